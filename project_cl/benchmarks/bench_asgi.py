@@ -0,0 +1,216 @@
+"""
+Load benchmark of concurrent lookups under WSGI and ASGI.
+
+Starts the app with gunicorn twice - WORKERS sync workers (WSGI, as deployed today)
+and WORKERS uvicorn workers (ASGI) - and sends lookups from CONCURRENCY clients
+for SECONDS. Meanwhile SLOW_CLIENTS organizers keep running draws of a group of
+GROUP_SIZE players through the API, so the lookups compete with slow requests
+like they do in December. Every run reports lookups per second, p50/p95 latency
+and errors.
+
+The servers are separate processes, so the benchmark needs a migrated database
+they can share (PostgreSQL from the settings or an SQLite file), not the test database.
+It creates a "bench-asgi" user with its data and deletes it at the end:
+
+    python benchmarks/bench_asgi.py
+    DJANGO_SETTINGS_MODULE=... BENCH_CONCURRENCY=8,64 BENCH_SECONDS=5 python benchmarks/bench_asgi.py
+
+Results depend on the machine and the database; compare the two modes of one run.
+"""
+import http.client
+import json
+import os
+import random
+import re
+import socket
+import statistics
+import subprocess
+import sys
+import threading
+import time
+from pathlib import Path
+from urllib.parse import urlencode
+
+PROJECT_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(PROJECT_DIR))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'project_cl.settings')
+
+import django  # noqa: E402
+django.setup()
+
+from django.contrib.auth.models import User  # noqa: E402
+from secret_santa.models import Draw, Event, GiftPair, Group, Participant  # noqa: E402
+
+
+CONCURRENCY = [int(value) for value in os.environ.get('BENCH_CONCURRENCY', '8,32,64').split(',')]
+SECONDS = float(os.environ.get('BENCH_SECONDS', 10))
+WORKERS = int(os.environ.get('BENCH_WORKERS', 4))
+SLOW_CLIENTS = int(os.environ.get('BENCH_SLOW_CLIENTS', 2))
+GROUP_SIZE = int(os.environ.get('BENCH_GROUP_SIZE', 1000))
+GIVERS = 200
+USERNAME = 'bench-asgi'
+PASSWORD = 'benchmark'
+SERVERS = {
+    'wsgi': ['project_cl.wsgi:application'],
+    'asgi': ['project_cl.asgi:application', '--worker-class', 'uvicorn.workers.UvicornWorker'],
+}
+
+
+def seed():
+    """
+    Creates the benchmark organizer with an upcoming draw of GIVERS players
+    and a group of GROUP_SIZE players for the slow draws.
+
+    :return: tuple (list of lookup emails, event id, group id)
+    """
+    User.objects.filter(username=USERNAME).delete()
+    organizer = User.objects.create_user(username=USERNAME, password=PASSWORD)
+    event = Event.objects.create(name='Benchmark', description='', organizer=organizer)
+    Participant.objects.bulk_create([
+        Participant(first_name=f'Player{i}', last_name='Bench', email=f'player{i}.bench-asgi@example.com',
+                    wishlist='Socks', creator=organizer)
+        for i in range(max(GIVERS, GROUP_SIZE))
+    ], batch_size=500)
+    participants = list(Participant.objects.filter(creator=organizer).order_by('id'))
+
+    group = Group.objects.create(name='Benchmark', creator=organizer, price_limit=50, currency='PLN')
+    group.participants.add(*participants[:GROUP_SIZE])
+    draw = Draw.objects.create(event=event, group=group, date='2999-12-24', price_limit=50, currency='PLN')
+    givers = participants[:GIVERS]
+    GiftPair.objects.bulk_create([
+        GiftPair(draw=draw, giver=giver, receiver=givers[(i + 1) % GIVERS]) for i, giver in enumerate(givers)
+    ], batch_size=500)
+    return [giver.email for giver in givers], event.id, group.id
+
+
+class Browser:
+    """
+    Keep-alive HTTP client with cookies, enough to pass the CSRF checks of the app.
+    """
+    def __init__(self, port):
+        self.connection = http.client.HTTPConnection('127.0.0.1', port, timeout=120)
+        self.cookies = {}
+
+    def request(self, method, path, body=None, headers=None):
+        headers = dict(headers or {})
+        if self.cookies:
+            headers['Cookie'] = '; '.join(f'{name}={value}' for name, value in self.cookies.items())
+        self.connection.request(method, path, body, headers)
+        response = self.connection.getresponse()
+        content = response.read()
+        for header in response.headers.get_all('Set-Cookie') or []:
+            name, value = header.split(';', 1)[0].split('=', 1)
+            self.cookies[name] = value
+        return response.status, content
+
+    def form_token(self, path):
+        status, content = self.request('GET', path)
+        return re.search(rb'name="csrfmiddlewaretoken" value="([^"]+)"', content).group(1).decode()
+
+    def post_form(self, path, token, data):
+        return self.request('POST', path, urlencode({**data, 'csrfmiddlewaretoken': token}),
+                            {'Content-Type': 'application/x-www-form-urlencoded', 'Referer': 'http://127.0.0.1/'})
+
+
+def lookup_client(port, emails, deadline, latencies, errors):
+    browser = Browser(port)
+    token = browser.form_token('/email-lookup/')
+    while time.perf_counter() < deadline:
+        start = time.perf_counter()
+        try:
+            status, content = browser.post_form('/email-lookup/', token, {'email': random.choice(emails)})
+        except OSError:
+            status = None
+            browser = Browser(port)
+            token = browser.form_token('/email-lookup/')
+        if status == 200:
+            latencies.append(time.perf_counter() - start)
+        else:
+            errors.append(status)
+
+
+def draw_client(port, event_id, group_id, stop, draws):
+    browser = Browser(port)
+    browser.post_form('/login/', browser.form_token('/login/'), {'username': USERNAME, 'password': PASSWORD})
+    body = json.dumps({'event': event_id, 'group': group_id, 'date': '2999-12-25', 'avoid_repeats': 0})
+    while not stop.is_set():
+        status, content = browser.request('POST', '/api/v1/draws/', body, {
+            'Content-Type': 'application/json', 'X-CSRFToken': browser.cookies['csrftoken']})
+        draws.append(status)
+
+
+def start_server(mode):
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        port = sock.getsockname()[1]
+    server = subprocess.Popen(
+        ['gunicorn', *SERVERS[mode], '--workers', str(WORKERS), '--bind', f'127.0.0.1:{port}',
+         '--timeout', '300', '--log-level', 'warning'],
+        cwd=PROJECT_DIR,
+    )
+    for _ in range(300):
+        try:
+            with socket.create_connection(('127.0.0.1', port), timeout=1):
+                return server, port
+        except OSError:
+            time.sleep(0.1)
+    server.terminate()
+    raise RuntimeError(f'{mode} server did not start')
+
+
+def run(port, concurrency, emails, event_id, group_id):
+    latencies, errors, draws = [], [], []
+    stop = threading.Event()
+    slow = [threading.Thread(target=draw_client, args=(port, event_id, group_id, stop, draws))
+            for _ in range(SLOW_CLIENTS)]
+    for thread in slow:
+        thread.start()
+    time.sleep(0.5)  # let the draws occupy the workers
+
+    deadline = time.perf_counter() + SECONDS
+    clients = [threading.Thread(target=lookup_client, args=(port, emails, deadline, latencies, errors))
+               for _ in range(concurrency)]
+    for thread in clients:
+        thread.start()
+    for thread in clients:
+        thread.join()
+    stop.set()
+    for thread in slow:
+        thread.join()
+
+    latencies.sort()
+    return {
+        'lookups_per_second': round(len(latencies) / SECONDS, 1),
+        'p50_ms': round(statistics.median(latencies) * 1000, 1) if latencies else None,
+        'p95_ms': round(latencies[int(len(latencies) * 0.95)] * 1000, 1) if latencies else None,
+        'errors': len(errors),
+        'draws': draws.count(201),
+    }
+
+
+def main():
+    emails, event_id, group_id = seed()
+    results = {}
+    try:
+        for mode in SERVERS:
+            server, port = start_server(mode)
+            try:
+                for concurrency in CONCURRENCY:
+                    result = run(port, concurrency, emails, event_id, group_id)
+                    results[f'{mode} / {concurrency}'] = result
+                    print(f'{mode} {concurrency:>4} clients: {result["lookups_per_second"]:8} lookups/s '
+                          f'p50 {result["p50_ms"]} ms p95 {result["p95_ms"]} ms '
+                          f'{result["errors"]} errors, {result["draws"]} draws', flush=True)
+            finally:
+                server.terminate()
+                server.wait()
+    finally:
+        User.objects.filter(username=USERNAME).delete()
+
+    output = os.environ.get('BENCH_OUTPUT')
+    if output:
+        Path(output).write_text(json.dumps(results, indent=2) + '\n')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,76 @@
+"""
+Benchmark of the constraint-aware draw engine (secret_santa.draw.draw_pairs).
+
+10,000 participants in teams of 50 where nobody may draw a teammate
+(about 490,000 exclusions), plus mutual couples. The matching fallback is
+measured on its own by disabling the random swaps, and a history of
+previous draws is measured as pairs to avoid.
+
+Run with:
+    pytest benchmarks/bench_draw.py -s
+"""
+import random
+import time
+from unittest import mock
+import pytest
+from secret_santa.draw import draw_pairs
+
+
+PARTICIPANTS = 10_000
+TEAM_SIZE = 50
+REPEAT = 5
+HISTORY_DRAWS = 3
+LIMIT = 1.0  # seconds
+
+
+def dense_exclusions():
+    exclusions = []
+    for first in range(0, PARTICIPANTS, TEAM_SIZE):
+        team = range(first, first + TEAM_SIZE)
+        exclusions.extend((giver, receiver) for giver in team for receiver in team if giver != receiver)
+    # couples across neighbouring teams
+    for giver in range(0, PARTICIPANTS - TEAM_SIZE, 7):
+        exclusions.append((giver, giver + TEAM_SIZE))
+        exclusions.append((giver + TEAM_SIZE, giver))
+    return exclusions
+
+
+def measure(label, participants, exclusions):
+    forbidden = set(exclusions)
+    timings = []
+    for seed in range(REPEAT):
+        start = time.perf_counter()
+        pairs = draw_pairs(participants, exclusions, rng=random.Random(seed))
+        timings.append(time.perf_counter() - start)
+        assert not any(giver == receiver or (giver, receiver) in forbidden for giver, receiver in pairs)
+        assert sorted(receiver for giver, receiver in pairs) == participants
+    print(f'\n{label}: best {min(timings) * 1000:.0f} ms, worst {max(timings) * 1000:.0f} ms')
+    return max(timings)
+
+
+@pytest.mark.parametrize('swaps', [True, False], ids=['swaps', 'matching only'])
+def test_dense_exclusions(swaps):
+    participants = list(range(PARTICIPANTS))
+    exclusions = dense_exclusions()
+    label = f'{PARTICIPANTS} participants, {len(exclusions)} exclusions'
+    if swaps:
+        worst = measure(label, participants, exclusions)
+    else:
+        with mock.patch('secret_santa.draw.SWAP_ATTEMPTS', 0):
+            worst = measure(f'{label}, matching only', participants, exclusions)
+    assert worst < LIMIT
+
+
+def test_dense_exclusions_with_history():
+    participants = list(range(PARTICIPANTS))
+    exclusions = dense_exclusions()
+    history = set()
+    for seed in range(HISTORY_DRAWS):
+        history.update(draw_pairs(participants, exclusions, rng=random.Random(seed)))
+
+    start = time.perf_counter()
+    pairs = draw_pairs(participants, exclusions, rng=random.Random(HISTORY_DRAWS), avoid=history)
+    elapsed = time.perf_counter() - start
+    repeats = len(set(pairs) & history)
+    print(f'\n{PARTICIPANTS} participants, {HISTORY_DRAWS} previous draws: {elapsed * 1000:.0f} ms, {repeats} repeats')
+    assert elapsed < LIMIT
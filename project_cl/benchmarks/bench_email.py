@@ -0,0 +1,78 @@
+"""
+Benchmark of SMTP connection setups per draw.
+
+Compares the old path (one send_mail call per giver) with the batched
+secret_santa.mail.send_messages path. The locmem backend is wrapped so it
+opens and closes a "connection" exactly like the SMTP backend does.
+
+Run with:
+    pytest benchmarks/bench_email.py -s
+"""
+import time
+import pytest
+from django.conf import settings
+from django.core.mail import send_mail
+from django.core.mail.backends import locmem
+from secret_santa.mail import MESSAGES_PER_CONNECTION, build_message, send_messages
+
+
+SIZES = [10, 100, 1000]
+
+
+class CountingBackend(locmem.EmailBackend):
+    """
+    locmem backend counting connection setups.
+    """
+    setups = 0
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.is_open = False
+
+    def open(self):
+        if self.is_open:
+            return False
+        self.is_open = True
+        CountingBackend.setups += 1
+        return True
+
+    def close(self):
+        self.is_open = False
+
+    def send_messages(self, messages):
+        new_connection = self.open()
+        try:
+            return super().send_messages(messages)
+        finally:
+            if new_connection:
+                self.close()
+
+
+def send_one_by_one(size):
+    for i in range(size):
+        send_mail('Secret Santa', 'Hi', settings.EMAIL_HOST_USER, [f'{i}@example.com'])
+
+
+def send_batched(size):
+    send_messages([build_message('Secret Santa', 'Hi', f'{i}@example.com') for i in range(size)])
+
+
+@pytest.fixture(autouse=True)
+def counting_backend(settings):
+    settings.EMAIL_BACKEND = 'benchmarks.bench_email.CountingBackend'
+    CountingBackend.setups = 0
+
+
+@pytest.mark.parametrize('size', SIZES)
+@pytest.mark.parametrize('sender', [send_one_by_one, send_batched], ids=['send_mail', 'batched'])
+def test_connection_setups_per_draw(sender, size):
+    start = time.perf_counter()
+    sender(size)
+    elapsed = time.perf_counter() - start
+
+    print(f'\n{sender.__name__:>16} | {size:>5} messages | '
+          f'{CountingBackend.setups:>5} connection setups | {elapsed * 1000:8.1f} ms')
+    if sender is send_batched:
+        assert CountingBackend.setups == -(-size // MESSAGES_PER_CONNECTION)
+    else:
+        assert CountingBackend.setups == size
@@ -0,0 +1,75 @@
+"""
+Memory of the streaming export (secret_santa.exports) for draws of growing size.
+
+Each size is exported through the export view with the test client, consuming
+the streamed response line by line, and compared with loading the same
+gift pairs as model instances at once. The streaming peak should stay flat.
+
+Run with:
+    pytest benchmarks/bench_export.py -s
+"""
+import time
+import tracemalloc
+import pytest
+from django.contrib.auth.models import User
+from django.test import Client
+from django.urls import reverse
+from secret_santa.models import Draw, Event, GiftPair, Group, Participant
+
+
+SIZES = [1_000, 10_000, 100_000]
+BATCH_SIZE = 5000
+
+
+def seed(user, size):
+    event = Event.objects.create(name=f'Event {size}', description='', organizer=user)
+    group = Group.objects.create(name=f'Group {size}', creator=user, price_limit=50)
+    first = Participant.objects.count()
+    Participant.objects.bulk_create([
+        Participant(id=first + i + 1, first_name=f'Player{i}', last_name='Bench', email=f'player{i}@example.com',
+                    wishlist='Socks, books and chocolate', creator=user)
+        for i in range(size)
+    ], batch_size=BATCH_SIZE)
+    draw = Draw.objects.create(event=event, group=group, date='2030-12-24', price_limit=50)
+    GiftPair.objects.bulk_create([
+        GiftPair(draw=draw, giver_id=first + i + 1, receiver_id=first + (i + 1) % size + 1)
+        for i in range(size)
+    ], batch_size=BATCH_SIZE)
+    return draw
+
+
+def peak_of(function):
+    tracemalloc.start()
+    start = time.perf_counter()
+    result = function()
+    elapsed = time.perf_counter() - start
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return result, elapsed, peak / 1024 / 1024
+
+
+@pytest.mark.django_db
+def test_export_memory():
+    user = User.objects.create_user(username='organizer', password='benchmark')
+    client = Client()
+    client.login(username='organizer', password='benchmark')
+
+    streaming_peaks = []
+    for size in SIZES:
+        draw = seed(user, size)
+
+        def stream():
+            response = client.get(reverse('export-game', args=[draw.id]))
+            return sum(1 for line in response.streaming_content)
+
+        def materialize():
+            return len(list(GiftPair.objects.filter(draw=draw).select_related('draw__event', 'giver', 'receiver')))
+
+        lines, elapsed, peak = peak_of(stream)
+        assert lines == size + 1
+        streaming_peaks.append(peak)
+        print(f'\n{size:>7} pairs: streaming export {elapsed:6.2f} s, peak {peak:6.1f} MiB', end='')
+        count, elapsed, peak = peak_of(materialize)
+        print(f' | model instances {elapsed:6.2f} s, peak {peak:6.1f} MiB', end='')
+
+    assert streaming_peaks[-1] < streaming_peaks[0] * 3
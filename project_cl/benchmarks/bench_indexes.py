@@ -0,0 +1,141 @@
+"""
+Query plans and timings of the lookup and dashboard queries
+before and after the indexes added in migration 0020.
+
+"Before" is the old schema: single-column indexes on the foreign keys only.
+"After" is the current schema: composite indexes and the LOWER(email) index.
+
+Seeds BENCH_PAIRS gift pairs (1,000,000 by default). Run with:
+    pytest benchmarks/bench_indexes.py -s
+    BENCH_PAIRS=100000 pytest benchmarks/bench_indexes.py -s
+"""
+import os
+import time
+from datetime import date, timedelta
+import pytest
+from django.contrib.auth.models import User
+from django.db import connection
+from secret_santa.models import Draw, Event, GiftPair, Group, Participant
+
+
+BENCH_PAIRS = int(os.environ.get('BENCH_PAIRS', 1_000_000))
+ORGANIZERS = 100
+PLAYERS_PER_ORGANIZER = 200
+GROUP_SIZE = 20
+BATCH_SIZE = 5000
+REPEAT = 20
+
+OLD_FK_INDEXES = [
+    ('secret_santa_giftpair', 'giver_id'),
+    ('secret_santa_giftpair', 'draw_id'),
+    ('secret_santa_draw', 'event_id'),
+    ('secret_santa_draw', 'group_id'),
+]
+
+
+def seed():
+    """
+    Seeds organizers with events, groups, players and BENCH_PAIRS gift pairs
+    spread over ten years of draws. Primary keys are set explicitly,
+    so bulk_create does not need to return them on any backend.
+    """
+    today = date.today()
+    users = User.objects.bulk_create([User(id=i + 1, username=f'organizer{i}') for i in range(ORGANIZERS)])
+    Event.objects.bulk_create([Event(id=user.id, name='Christmas', description='', organizer=user) for user in users])
+    Group.objects.bulk_create([Group(id=user.id, name='Office', creator=user, price_limit=50) for user in users])
+    Participant.objects.bulk_create([
+        Participant(id=i + 1, first_name=f'Player{i}', last_name='Bench', email=f'Player{i}@Example.com',
+                    creator_id=i // PLAYERS_PER_ORGANIZER + 1)
+        for i in range(ORGANIZERS * PLAYERS_PER_ORGANIZER)
+    ], batch_size=BATCH_SIZE)
+
+    draws = BENCH_PAIRS // GROUP_SIZE
+    Draw.objects.bulk_create([
+        Draw(id=i + 1, event_id=i % ORGANIZERS + 1, group_id=i % ORGANIZERS + 1,
+             date=today + timedelta(days=i % 3650 - 3600), price_limit=50)
+        for i in range(draws)
+    ], batch_size=BATCH_SIZE)
+
+    pairs = []
+    for i in range(draws):
+        organizer = i % ORGANIZERS
+        first = organizer * PLAYERS_PER_ORGANIZER + (i * GROUP_SIZE) % PLAYERS_PER_ORGANIZER + 1
+        for j in range(GROUP_SIZE):
+            pairs.append(GiftPair(id=i * GROUP_SIZE + j + 1, draw_id=i + 1,
+                                  giver_id=first + j, receiver_id=first + (j + 1) % GROUP_SIZE))
+        if len(pairs) >= BATCH_SIZE:
+            GiftPair.objects.bulk_create(pairs)
+            pairs = []
+    GiftPair.objects.bulk_create(pairs)
+
+
+def lookup_query():
+    # same query as views.gift_pairs_page for the email lookup
+    givers = Participant.objects.with_email('player4242@example.com')
+    return (GiftPair.objects.filter(giver__in=givers, draw__date__gte=date.today())
+            .select_related('draw__event', 'receiver').order_by('draw__date', 'id')[:21])
+
+
+def dashboard_draws_query():
+    # same query as LoggedUserView for the upcoming games
+    return (Draw.objects.filter(event__organizer_id=42, date__gte=date.today())
+            .select_related('event', 'group').order_by('date', 'id')[:13])
+
+
+def dashboard_pairs_query():
+    # same query as views.game_cards for one page of games
+    return (GiftPair.objects.filter(draw__in=list(dashboard_draws_query()))
+            .order_by('draw_id', 'id')
+            .values('draw_id', 'giver__first_name', 'giver__last_name',
+                    'receiver__first_name', 'receiver__last_name'))
+
+
+QUERIES = {
+    'lookup': lookup_query,
+    'dashboard draws': dashboard_draws_query,
+    'dashboard pairs': dashboard_pairs_query,
+}
+
+
+def use_old_indexes(schema_editor):
+    for model in (Participant, Draw, GiftPair):
+        for index in model._meta.indexes:
+            schema_editor.remove_index(model, index)
+    for table, column in OLD_FK_INDEXES:
+        schema_editor.execute(f'CREATE INDEX bench_{table}_{column} ON {table} ({column})')
+
+
+def use_new_indexes(schema_editor):
+    for table, column in OLD_FK_INDEXES:
+        schema_editor.execute(f'DROP INDEX bench_{table}_{column}')
+    for model in (Participant, Draw, GiftPair):
+        for index in model._meta.indexes:
+            schema_editor.add_index(model, index)
+
+
+def measure(label):
+    if connection.vendor == 'postgresql':
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE')
+    for name, query in QUERIES.items():
+        start = time.perf_counter()
+        for _ in range(REPEAT):
+            list(query())
+        elapsed = (time.perf_counter() - start) / REPEAT
+        print(f'\n=== {label}: {name} ({elapsed * 1000:.2f} ms per query) ===')
+        print(query().explain())
+
+
+@pytest.mark.django_db(transaction=True)
+def test_lookup_and_dashboard_plans():
+    start = time.perf_counter()
+    seed()
+    print(f'\nSeeded {GiftPair.objects.count()} gift pairs in {time.perf_counter() - start:.1f} s')
+
+    with connection.schema_editor() as schema_editor:
+        use_old_indexes(schema_editor)
+    measure('before')
+
+    with connection.schema_editor() as schema_editor:
+        use_new_indexes(schema_editor)
+    measure('after')
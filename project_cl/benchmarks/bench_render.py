@@ -0,0 +1,65 @@
+"""
+Micro-benchmark of assignment email rendering (secret_santa.mail.render_assignments).
+
+Renders the text and HTML emails of a 10,000 player draw three ways:
+the old f-string bodies (text only, for reference), the templates rendered
+once per giver, and the batched pass used by the app. Prints the cost per message.
+
+Run with:
+    pytest benchmarks/bench_render.py -s
+"""
+import time
+import pytest
+from secret_santa.mail import assignment_templates, format_price, render_assignments
+
+
+MESSAGES = 10_000
+REPEAT = 3
+
+
+def assignments():
+    return [(f'Player {i}', f'player{i}@example.com', f'Player {(i + 1) % MESSAGES}',
+             'Socks\nA book' if i % 2 else None)
+            for i in range(MESSAGES)]
+
+
+def render_f_strings(rows, price_limit, currency, date):
+    bodies = []
+    for giver_name, giver_email, receiver_name, wishlist in rows:
+        message = f'Hi {giver_name},\n\nYou are {receiver_name}\'s Secret Santa!'
+        message += f'\n\nThe maximum price for gifts is {price_limit} {currency}.'
+        message += f'\nThe exchange date is {date}.'
+        message += f'\n\nBest wishes,\nSecret Santa'
+        bodies.append(message)
+    return bodies
+
+
+def render_one_by_one(rows, price_limit, currency, date):
+    text, html = assignment_templates()
+    emails = []
+    for giver_name, giver_email, receiver_name, wishlist in rows:
+        context = {
+            'assignments': [{'giver_name': giver_name, 'receiver_name': receiver_name, 'wishlist': wishlist}],
+            'price_limit': format_price(price_limit, currency),
+            'date': date,
+            'separator': '',
+        }
+        emails.append((giver_email, text.render(context), html.render(context)))
+    return emails
+
+
+@pytest.mark.parametrize('renderer', [render_f_strings, render_one_by_one, render_assignments],
+                         ids=['f-strings (text only)', 'per message', 'batched'])
+def test_render_cost_per_message(renderer):
+    rows = assignments()
+    renderer(rows[:10], 50, 'PLN', '2099-12-24')  # compiles the templates
+    timings = []
+    for _ in range(REPEAT):
+        start = time.perf_counter()
+        emails = renderer(rows, 50, 'PLN', '2099-12-24')
+        timings.append(time.perf_counter() - start)
+    assert len(emails) == MESSAGES
+
+    best = min(timings)
+    print(f'\n{renderer.__name__:>18} | {MESSAGES} messages | {best * 1000:8.1f} ms | '
+          f'{best / MESSAGES * 1_000_000:6.1f} us per message')
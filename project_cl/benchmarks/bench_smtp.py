@@ -0,0 +1,46 @@
+"""
+Benchmark of sending a big draw to a slow SMTP server.
+
+A local stand-in server (secret_santa/tests/smtp_server.py) spends LATENCY seconds
+on every message, like a remote server does. The messages are sent over one reused
+connection (send_messages) and over a pool of connections (send_parallel).
+
+Run with:
+    pytest benchmarks/bench_smtp.py -s
+"""
+import time
+import pytest
+from secret_santa.mail import build_message, send_messages, send_parallel
+from secret_santa.tests.smtp_server import SlowSMTPServer
+
+
+MESSAGES = 1000
+LATENCY = 0.01  # seconds per message
+
+
+@pytest.fixture
+def server(settings):
+    with SlowSMTPServer(latency=LATENCY) as server:
+        settings.EMAIL_BACKEND = 'django.core.mail.backends.smtp.EmailBackend'
+        settings.EMAIL_HOST = '127.0.0.1'
+        settings.EMAIL_PORT = server.port
+        settings.EMAIL_USE_TLS = False
+        settings.EMAIL_HOST_USER = 'santa@example.com'
+        settings.EMAIL_HOST_PASSWORD = ''
+        yield server
+
+
+@pytest.mark.parametrize('workers', [None, 1, 4, 8, 16], ids=['one connection', '1', '4', '8', '16'])
+def test_send_big_draw(server, workers):
+    messages = [build_message('Secret Santa', 'Hi', f'player{i}@example.com') for i in range(MESSAGES)]
+
+    start = time.perf_counter()
+    if workers is None:
+        report = send_messages(messages)
+    else:
+        report = send_parallel(messages, workers=workers)
+    elapsed = time.perf_counter() - start
+
+    assert len(report.sent) == MESSAGES
+    label = 'send_messages' if workers is None else f'{workers:>2} workers'
+    print(f'\n{label:>14} | {MESSAGES} messages | {elapsed:6.2f} s | {MESSAGES / elapsed:7.0f} messages/s')
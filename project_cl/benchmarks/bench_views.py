@@ -0,0 +1,147 @@
+"""
+End-to-end benchmark of the draw and lookup paths.
+
+Seeds one organizer per group size (10, 100, 1,000 and 10,000 participants
+by default) with HISTORY_YEARS of past draws and one upcoming draw, then
+drives the views through the test client with the locmem email backend.
+Every scenario records wall time, number of queries and peak memory
+(tracemalloc) and the results are written to a JSON file, so a regression
+shows up as a diff of benchmarks/baseline.json.
+
+Run with:
+    pytest benchmarks/bench_views.py -s
+    BENCH_SIZES=10,100 BENCH_OUTPUT=/tmp/bench.json pytest benchmarks/bench_views.py -s
+
+Query counts do not depend on the machine; timings and memory do,
+so compare them with a baseline recorded on the same machine.
+Timings include the overhead of tracemalloc, which is the same in every run.
+"""
+import io
+import json
+import os
+import platform
+import time
+import tracemalloc
+from datetime import date, timedelta
+from pathlib import Path
+import django
+import pytest
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.core.cache import cache
+from django.db import connection
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from secret_santa.models import Draw, Event, GiftPair, Group, Participant
+
+
+SIZES = [int(size) for size in os.environ.get('BENCH_SIZES', '10,100,1000,10000').split(',')]
+HISTORY_YEARS = 5
+OUTPUT = Path(os.environ.get('BENCH_OUTPUT', Path(__file__).with_name('baseline.json')))
+BATCH_SIZE = 5000
+
+
+def seed(size):
+    """
+    Seeds an organizer with an event, a group of `size` participants,
+    HISTORY_YEARS of past draws and one upcoming draw.
+    The first participant also has an account, for My games.
+
+    :return: tuple (organizer, event, group, participants)
+    """
+    organizer = User.objects.create_user(username=f'organizer{size}', password='benchmark')
+    event = Event.objects.create(name='Christmas', description='', organizer=organizer)
+    group = Group.objects.create(name=f'Group of {size}', creator=organizer, price_limit=50, currency='PLN')
+    Participant.objects.bulk_create([
+        Participant(first_name=f'Player{i}', last_name=f'Size{size}', email=f'player{i}.size{size}@example.com',
+                    wishlist='Socks, books and chocolate', creator=organizer)
+        for i in range(size)
+    ], batch_size=BATCH_SIZE)
+    participants = list(Participant.objects.filter(creator=organizer).order_by('id'))
+    group.participants.add(*participants)
+    User.objects.create_user(username=f'player0.size{size}', email=participants[0].email, password='benchmark')
+
+    today = date.today()
+    days = [today.replace(year=today.year - years) for years in range(HISTORY_YEARS, 0, -1)]
+    days.append(today + timedelta(days=30))
+    for shift, day in enumerate(days, start=1):
+        draw = Draw.objects.create(event=event, group=group, date=day, price_limit=50, currency='PLN')
+        GiftPair.objects.bulk_create([
+            GiftPair(draw=draw, giver=giver, receiver=participants[(i + shift) % size])
+            for i, giver in enumerate(participants)
+        ], batch_size=BATCH_SIZE)
+    return organizer, event, group, participants
+
+
+def measure(client, method, url, data=None):
+    """
+    Function sending one request and measuring it.
+
+    :return: dict with status, seconds, queries and peak_kb
+    """
+    tracemalloc.start()
+    with CaptureQueriesContext(connection) as queries:
+        start = time.perf_counter()
+        response = getattr(client, method)(url, data)
+        elapsed = time.perf_counter() - start
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    assert response.status_code in (200, 302), response.content[:200]
+    return {
+        'status': response.status_code,
+        'seconds': round(elapsed, 4),
+        'queries': len(queries),
+        'peak_kb': round(peak / 1024),
+    }
+
+
+def scenarios(size):
+    organizer, event, group, participants = seed(size)
+    organizer_client = Client()
+    organizer_client.login(username=organizer.username, password='benchmark')
+    player_client = Client()
+    player_client.login(username=f'player0.size{size}', password='benchmark')
+    email = participants[0].email
+
+    quick_game = {'max_price': 50, 'currency': 'PLN', 'date': '2030-12-24', 'num_players': 0,
+                  'players': '\n'.join(f'{p.name}, {p.email}' for p in participants)}
+
+    cache.clear()
+    # the request only stores the emails in the outbox; deliver them, like the worker does,
+    # so they do not slow down the next scenarios
+    yield 'quick game', measure(Client(), 'post', reverse('quick_game'), quick_game)
+    call_command('deliver_outbox', '--once', stdout=io.StringIO())
+    yield 'game', measure(organizer_client, 'post', reverse('new-game'), {
+        'event': event.id, 'group': group.id, 'date': '2030-12-24', 'avoid_repeats': 3})
+    yield 'dashboard', measure(organizer_client, 'get', reverse('base'))
+    cache.clear()
+    yield 'lookup (cold)', measure(Client(), 'post', reverse('email-lookup'), {'email': email})
+    yield 'lookup (warm)', measure(Client(), 'post', reverse('email-lookup'), {'email': email})
+    yield 'lookup archive', measure(Client(), 'post', reverse('email-lookup-archive'), {'email': email})
+    cache.clear()
+    yield 'my gift pairs (cold)', measure(player_client, 'get', reverse('my-gift-pairs'))
+    yield 'my gift pairs (warm)', measure(player_client, 'get', reverse('my-gift-pairs'))
+
+
+@pytest.mark.django_db
+def test_views(settings):
+    settings.EMAIL_BACKEND = 'django.core.mail.backends.locmem.EmailBackend'
+
+    results = {}
+    for size in SIZES:
+        for name, result in scenarios(size):
+            results[f'{name} / {size}'] = result
+            print(f'\n{name:>22} {size:>6}: {result["seconds"] * 1000:9.1f} ms '
+                  f'{result["queries"]:5} queries {result["peak_kb"]:8} KiB', end='')
+
+    OUTPUT.write_text(json.dumps({
+        'environment': {
+            'python': platform.python_version(),
+            'django': django.get_version(),
+            'database': connection.vendor,
+            'history_years': HISTORY_YEARS,
+        },
+        'results': results,
+    }, indent=2) + '\n')
+    print(f'\n\nResults written to {OUTPUT}')
@@ -20,47 +20,76 @@ from secret_santa import views
 #from django.contrib.auth import views as auth_views
 from secret_santa.views import (MainView,
                                 QuickGameView,
+                                QuickGameStatusView,
                                 LoginView,
                                 LogoutView,
                                 LoggedUserView,
+                                GamesArchiveView,
+                                ExportView,
                                 AddEventView,
                                 AddGroupView,
                                 AddPlayerView,
+                                ImportPlayersView,
                                 EditEventView,
                                 EditGroupView,
                                 EditPlayerView,
                                 DeleteEventView,
                                 DeleteGroupView,
+                                AddExclusionView,
                                 DeletePlayerView,
                                 GameView,
+                                EventDrawView,
                                 ChangePassword,
                                 MyGiftPairsView,
-                                LookupView,)
+                                MyGiftPairsArchiveView,
+                                LookupView,
+                                LookupArchiveView,)
+from secret_santa.api import (ParticipantsApiView,
+                              GroupsApiView,
+                              GroupMembersApiView,
+                              DrawsApiView,
+                              DrawApiView,)
 
 
 urlpatterns = [
     path('admin/', admin.site.urls),
     path('', MainView.as_view(), name='index'),
     path('quick-game/', QuickGameView.as_view(), name='quick_game'),
+    path('quick-game/<str:job_id>/', QuickGameStatusView.as_view(), name='quick-game-status'),
     path('login/', LoginView.as_view(), name='login'),
     path('logout/', LogoutView.as_view(), name='logout'),
     path('logged/', LoggedUserView.as_view(), name='base'),
+    path('logged/archive/', GamesArchiveView.as_view(), name='games-archive'),
+    path('export/', ExportView.as_view(scope='all'), name='export-all'),
+    path('export/event/<int:pk>/', ExportView.as_view(scope='event'), name='export-event'),
+    path('export/game/<int:pk>/', ExportView.as_view(scope='game'), name='export-game'),
     path('add-event/', AddEventView.as_view(), name='add-event'),
     path('edit-event/<int:event_id>/', EditEventView.as_view(), name='edit-event'),
     path('delete-event/<int:event_id>/', DeleteEventView.as_view(), name='delete-event'),
     path('add-group/', AddGroupView.as_view(), name='add-group'),
     path('edit-group/<int:group_id>/', EditGroupView.as_view(), name='edit-group'),
     path('delete-group/<int:group_id>/', DeleteGroupView.as_view(), name='delete-group'),
+    path('add-exclusion/<int:group_id>/', AddExclusionView.as_view(), name='add-exclusion'),
     path('add-player/', AddPlayerView.as_view(), name='add-player'),
+    path('import-players/', ImportPlayersView.as_view(), name='import-players'),
     path('edit-player/<int:player_id>/', EditPlayerView.as_view(), name='edit-player'),
     path('delete-player/<int:player_id>/', DeletePlayerView.as_view(), name='delete-player'),
     path('new-game/', GameView.as_view(), name='new-game'),
+    path('draw-event/<int:event_id>/', EventDrawView.as_view(), name='draw-event'),
     path('register/', views.register, name='register'),
     path('change-password/', ChangePassword.as_view(), name='change-password'),
     path('delete-account/<int:pk>/', views.DeleteAccountView.as_view(), name='delete_account'),
     path('my-gift-pairs/', MyGiftPairsView.as_view(), name='my-gift-pairs'),
+    path('my-gift-pairs/archive/', MyGiftPairsArchiveView.as_view(), name='my-gift-pairs-archive'),
     path('email-lookup/', LookupView.as_view(), name='email-lookup'),
+    path('email-lookup/archive/', LookupArchiveView.as_view(), name='email-lookup-archive'),
     path('success/', views.success_view, name='success'),
+    path('cache-stats/', views.cache_stats_view, name='cache-stats'),
+    path('api/v1/participants/', ParticipantsApiView.as_view(), name='api-participants'),
+    path('api/v1/groups/', GroupsApiView.as_view(), name='api-groups'),
+    path('api/v1/groups/<int:group_id>/members/', GroupMembersApiView.as_view(), name='api-group-members'),
+    path('api/v1/draws/', DrawsApiView.as_view(), name='api-draws'),
+    path('api/v1/draws/<int:pk>/', DrawApiView.as_view(), name='api-draw'),
     # path('reset-password/', CustomPasswrordResetView.as_view(), name='reset-pswrd'),
     # path('reset-password/confirm/<uidb64>/<token>/', auth_views.PasswordResetConfirmView.as_view(), name='password_reset_confirm'),
 ]
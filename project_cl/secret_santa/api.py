@@ -0,0 +1,376 @@
+import json
+from django.db import transaction
+from django.forms.models import model_to_dict
+from django.http import JsonResponse
+from django.urls import reverse
+from django.views import View
+from .assignments import invalidate_emails, invalidate_participants
+from .bulk import bulk_create_with_ids
+from .draw import DrawInfeasible, create_draw
+from .forms import GameForm, GroupForm, ParticipantForm
+from .fragments import players_stamp_key, touch
+from .models import Draw, Group, Participant, ScheduledDraw
+from .pagination import keyset_page
+
+
+API_PAGE_SIZE = 50
+API_MAX_PAGE_SIZE = 500
+API_MAX_BATCH = 1000  # items of one batch request
+PARTICIPANT_UPDATE_FIELDS = ['first_name', 'last_name', 'email', 'wishlist']
+
+# Fields of the JSON objects returned by the API and how they are read from the models.
+# ?fields=id,email returns only some of them.
+PARTICIPANT_FIELDS = {
+    'id': lambda participant: participant.id,
+    'first_name': lambda participant: participant.first_name,
+    'last_name': lambda participant: participant.last_name,
+    'email': lambda participant: participant.email,
+    'wishlist': lambda participant: participant.wishlist,
+}
+GROUP_FIELDS = {
+    'id': lambda group: group.id,
+    'name': lambda group: group.name,
+    'price_limit': lambda group: str(group.price_limit),
+    'currency': lambda group: group.currency,
+    'participants': lambda group: [participant.id for participant in group.participants.all()],
+}
+DRAW_FIELDS = {
+    'id': lambda draw: draw.id,
+    'event': lambda draw: draw.event_id,
+    'group': lambda draw: draw.group_id,
+    'date': lambda draw: draw.date.isoformat(),
+    'price_limit': lambda draw: str(draw.price_limit),
+    'currency': lambda draw: draw.currency,
+}
+
+
+class ApiError(Exception):
+    """
+    Raised by API views to return a JSON error response.
+
+    Attributes:
+        - message: description of the error.
+        - status: HTTP status of the response.
+        - errors: optional details, e.g. form errors per item of a batch.
+    """
+    def __init__(self, message, status=400, errors=None):
+        super().__init__(message)
+        self.message = message
+        self.status = status
+        self.errors = errors
+
+
+def form_errors(form):
+    return {field: list(messages) for field, messages in form.errors.items()}
+
+
+def serialize(obj, getters, fields):
+    return {name: getters[name](obj) for name in fields}
+
+
+class ApiView(View):
+    """
+    Base view of the JSON API (version 1).
+    Requests need a logged in user (session cookie, with the CSRF token in the X-CSRFToken header
+    for POST, PATCH and DELETE). Bodies are JSON objects, available as self.data.
+    Errors are returned as {"error": "...", "errors": {...}} with a 4xx status.
+    """
+    def dispatch(self, request, *args, **kwargs):
+        if not request.user.is_authenticated:
+            return JsonResponse({'error': 'Authentication required.'}, status=401)
+        try:
+            self.data = self.read_body(request)
+            return super().dispatch(request, *args, **kwargs)
+        except ApiError as e:
+            body = {'error': e.message}
+            if e.errors is not None:
+                body['errors'] = e.errors
+            return JsonResponse(body, status=e.status)
+
+    def http_method_not_allowed(self, request, *args, **kwargs):
+        raise ApiError(f'Method {request.method} is not allowed.', status=405)
+
+    @staticmethod
+    def read_body(request):
+        if request.method not in ('POST', 'PATCH', 'DELETE'):
+            return {}
+        try:
+            data = json.loads(request.body or b'{}')
+        except ValueError:
+            raise ApiError('Request body is not valid JSON.')
+        if not isinstance(data, dict):
+            raise ApiError('Request body must be a JSON object.')
+        return data
+
+    def fields(self, getters):
+        """
+        Function returning the fields requested with ?fields=, all fields by default.
+
+        :param getters: dict of the fields of the resource (e.g. PARTICIPANT_FIELDS)
+        :return: list of field names
+        :raises ApiError: when an unknown field is requested
+        """
+        requested = self.request.GET.get('fields')
+        if not requested:
+            return list(getters)
+        fields = [name.strip() for name in requested.split(',') if name.strip()]
+        unknown = [name for name in fields if name not in getters]
+        if unknown:
+            raise ApiError(f'Unknown fields: {", ".join(unknown)}.')
+        return fields
+
+    def page_size(self):
+        value = self.request.GET.get('limit', API_PAGE_SIZE)
+        try:
+            value = int(value)
+        except (TypeError, ValueError):
+            raise ApiError('limit must be a number.')
+        if not 1 <= value <= API_MAX_PAGE_SIZE:
+            raise ApiError(f'limit must be between 1 and {API_MAX_PAGE_SIZE}.')
+        return value
+
+    def page(self, queryset, getters):
+        """
+        Function returning one page of a queryset ordered by id as a JSON response.
+        The page starts after the id given as ?cursor=, so its cost does not grow with the number of rows before it.
+
+        :param queryset: queryset of the objects of the logged user
+        :param getters: dict of the fields of the resource
+        :return: JsonResponse with results and the url of the next page
+        """
+        fields = self.fields(getters)
+        size = self.page_size()
+        cursor = self.request.GET.get('cursor')
+        if cursor:
+            try:
+                queryset = queryset.filter(id__gt=int(cursor))
+            except ValueError:
+                raise ApiError('Invalid cursor.')
+        items = list(queryset.order_by('id')[:size + 1])
+        next_cursor = items[size - 1].id if len(items) > size else None
+        return self.page_response(items[:size], getters, fields, next_cursor)
+
+    def page_response(self, items, getters, fields, next_cursor):
+        next_url = None
+        if next_cursor is not None:
+            query = self.request.GET.copy()
+            query['cursor'] = next_cursor
+            next_url = f'{self.request.path}?{query.urlencode()}'
+        return JsonResponse({'results': [serialize(item, getters, fields) for item in items], 'next': next_url})
+
+    def batch(self, key):
+        """
+        Function returning the list of items of a batch request, e.g. {"participants": [...]}.
+
+        :param key: name of the list in the body
+        :return: list
+        :raises ApiError: when the list is missing, empty or longer than API_MAX_BATCH
+        """
+        items = self.data.get(key)
+        if not isinstance(items, list) or not items:
+            raise ApiError(f'"{key}" must be a non-empty list.')
+        if len(items) > API_MAX_BATCH:
+            raise ApiError(f'At most {API_MAX_BATCH} items can be sent at once.', status=413)
+        return items
+
+
+def participant_form(user, data, instance=None):
+    """
+    Function returning ParticipantForm for one item of a batch.
+    The creator is always the logged user, so its field is dropped and not validated
+    (validating it would cost one query per item).
+    """
+    form = ParticipantForm(data=data, instance=instance or Participant(creator=user), user=user)
+    del form.fields['creator']
+    return form
+
+
+class ParticipantsApiView(ApiView):
+    """
+    API endpoint of the participants of the logged user.
+
+    Methods:
+        - get(self, request): Returns one page of participants.
+        - post(self, request): Creates participants from {"participants": [{...}, ...]}.
+        - patch(self, request): Updates participants from {"participants": [{"id": ..., ...}, ...]}.
+        - delete(self, request): Deletes participants from {"ids": [...]}.
+    Batches are validated with ParticipantForm and saved only when every item is valid.
+    One batch cannot create two participants with the same email (case-insensitive).
+    """
+    def get(self, request):
+        participants = Participant.objects.filter(creator=request.user)
+        fields = self.fields(PARTICIPANT_FIELDS)
+        return self.page(participants.only(*fields), PARTICIPANT_FIELDS)
+
+    def post(self, request):
+        items = self.batch('participants')
+        forms = [participant_form(request.user, item if isinstance(item, dict) else {}) for item in items]
+        errors = {index: form_errors(form) for index, form in enumerate(forms) if not form.is_valid()}
+        seen = set()
+        for index, form in enumerate(forms):
+            email = form.cleaned_data.get('email', '').lower()
+            if email in seen:
+                errors.setdefault(index, {}).setdefault('email', []).append('Repeated in this batch.')
+            elif email:
+                seen.add(email)
+        if errors:
+            raise ApiError('Invalid participants.', errors=errors)
+
+        participants = [form.instance for form in forms]
+        with transaction.atomic():
+            bulk_create_with_ids(Participant, participants)
+            invalidate_emails(participant.email for participant in participants)
+            touch(players_stamp_key(request.user.id))
+        return JsonResponse({'ids': [participant.pk for participant in participants]}, status=201)
+
+    def patch(self, request):
+        items = self.batch('participants')
+        ids = [item.get('id') for item in items if isinstance(item, dict)]
+        existing = Participant.objects.filter(creator=request.user).in_bulk(
+            [pk for pk in ids if isinstance(pk, int)])
+
+        forms = []
+        errors = {}
+        for index, item in enumerate(items):
+            pk = item.get('id') if isinstance(item, dict) else None
+            participant = existing.get(pk) if isinstance(pk, int) else None
+            if participant is None:
+                errors[index] = {'id': ['Unknown participant.']}
+                continue
+            data = {**model_to_dict(participant, fields=PARTICIPANT_UPDATE_FIELDS), **item}
+            old_email = participant.email
+            form = participant_form(request.user, data, instance=participant)
+            if form.is_valid():
+                forms.append((form, old_email))
+            else:
+                errors[index] = form_errors(form)
+        if errors:
+            raise ApiError('Invalid participants.', errors=errors)
+
+        participants = [form.instance for form, old_email in forms]
+        with transaction.atomic():
+            Participant.objects.bulk_update(participants, PARTICIPANT_UPDATE_FIELDS)
+            # bulk_update sends no signals, so the cache is invalidated here
+            invalidate_emails(old_email for form, old_email in forms)
+            invalidate_participants(Participant.objects.filter(pk__in=[p.pk for p in participants]))
+            touch(players_stamp_key(request.user.id))
+        return JsonResponse({'ids': [participant.pk for participant in participants]})
+
+    def delete(self, request):
+        ids = self.batch('ids')
+        if not all(isinstance(pk, int) for pk in ids):
+            raise ApiError('"ids" must be a list of ids.')
+        participants = Participant.objects.filter(creator=request.user, pk__in=ids)
+        count, per_model = participants.delete()  # the delete receivers invalidate the cache
+        return JsonResponse({'deleted': per_model.get(Participant._meta.label, 0)})
+
+
+class GroupsApiView(ApiView):
+    """
+    API endpoint of the groups of the logged user.
+
+    Methods:
+        - get(self, request): Returns one page of groups.
+        - post(self, request): Creates a group, validated with GroupForm (at least 3 players).
+    """
+    def get(self, request):
+        groups = Group.objects.filter(creator=request.user)
+        if 'participants' in self.fields(GROUP_FIELDS):
+            groups = groups.prefetch_related('participants')
+        return self.page(groups, GROUP_FIELDS)
+
+    def post(self, request):
+        form = GroupForm(data=self.data, instance=Group(creator=request.user), user=request.user)
+        del form.fields['creator']
+        if not form.is_valid():
+            raise ApiError('Invalid group.', errors=form_errors(form))
+        group = form.save()
+        return JsonResponse({'id': group.id}, status=201)
+
+
+class GroupMembersApiView(ApiView):
+    """
+    API endpoint changing the players of a group at once.
+
+    Methods:
+        - post(self, request, group_id): Adds and removes players from {"add": [...], "remove": [...]}.
+    The new list of players is validated with GroupForm, so a group keeps at least 3 players.
+    """
+    def post(self, request, group_id):
+        group = Group.objects.filter(pk=group_id, creator=request.user).first()
+        if group is None:
+            raise ApiError('Group not found.', status=404)
+        add = self.data.get('add', [])
+        remove = self.data.get('remove', [])
+        if not isinstance(add, list) or not isinstance(remove, list) \
+                or not all(isinstance(pk, int) for pk in add + remove):
+            raise ApiError('"add" and "remove" must be lists of ids.')
+        if len(add) + len(remove) > API_MAX_BATCH:
+            raise ApiError(f'At most {API_MAX_BATCH} items can be sent at once.', status=413)
+
+        members = set(group.participants.values_list('id', flat=True))
+        members = (members | set(add)) - set(remove)
+        form = GroupForm(data={
+            'name': group.name,
+            'price_limit': group.price_limit,
+            'currency': group.currency,
+            'participants': sorted(members),
+        }, instance=group, user=request.user)
+        del form.fields['creator']
+        if not form.is_valid():
+            raise ApiError('Invalid players.', errors=form_errors(form))
+        form.save()
+        return JsonResponse({'id': group.id, 'participants': sorted(members)})
+
+
+class DrawsApiView(ApiView):
+    """
+    API endpoint of the games of the logged user.
+
+    Methods:
+        - get(self, request): Returns one page of games, newest first.
+        - post(self, request): Runs a draw validated with GameForm and returns its id right away,
+                               or with run_at schedules it for run_scheduled_draws (202 with the schedule id).
+    The emails of a new game are sent in the background by the deliver_outbox worker.
+    """
+    def get(self, request):
+        fields = self.fields(DRAW_FIELDS)
+        draws = Draw.objects.filter(event__organizer=request.user)
+        page = keyset_page(draws, request.GET.get('cursor'), descending=True, page_size=self.page_size())
+        return self.page_response(page.items, DRAW_FIELDS, fields, page.next_cursor)
+
+    def post(self, request):
+        form = GameForm(data=self.data, user=request.user)
+        if not form.is_valid():
+            raise ApiError('Invalid game.', errors=form_errors(form))
+        if form.cleaned_data['run_at']:
+            scheduled = ScheduledDraw.objects.create(
+                event=form.cleaned_data['event'], group=form.cleaned_data['group'], date=form.cleaned_data['date'],
+                run_at=form.cleaned_data['run_at'], avoid_repeats=form.cleaned_data['avoid_repeats'])
+            return JsonResponse({'scheduled': scheduled.id, 'run_at': scheduled.run_at}, status=202)
+        try:
+            draw = create_draw(form.cleaned_data['event'], form.cleaned_data['group'],
+                               form.cleaned_data['date'], form.cleaned_data['avoid_repeats'])
+        except DrawInfeasible as e:
+            raise ApiError(f'The draw is not possible: {e}', status=409)
+        response = JsonResponse({'id': draw.id}, status=201)
+        response['Location'] = reverse('api-draw', args=[draw.id])
+        return response
+
+
+class DrawApiView(ApiView):
+    """
+    API endpoint of one game of the logged user.
+
+    Methods:
+        - get(self, request, pk): Returns the game with its gift pairs (ids of giver and receiver).
+    """
+    def get(self, request, pk):
+        fields = self.fields(DRAW_FIELDS)
+        draw = Draw.objects.filter(pk=pk, event__organizer=request.user).first()
+        if draw is None:
+            raise ApiError('Game not found.', status=404)
+        data = serialize(draw, DRAW_FIELDS, fields)
+        data['pairs'] = [{'giver': giver, 'receiver': receiver}
+                         for giver, receiver in draw.pairs.order_by('id').values_list('giver_id', 'receiver_id')]
+        return JsonResponse(data)
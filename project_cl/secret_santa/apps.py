@@ -4,3 +4,6 @@ from django.apps import AppConfig
 class SecretSantaConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'secret_santa'
+
+    def ready(self):
+        from . import checks, query_budget, signals  # noqa: F401
@@ -0,0 +1,158 @@
+from datetime import date
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Q
+from .models import GiftPair, Participant
+from .pagination import keyset_page
+from .routers import REPLICA_LAG_SECONDS, pinned_to_primary, reads_from_replica
+
+
+CACHE_TIMEOUT = 60 * 60 * 24
+HITS_KEY = 'assignments:hits'
+MISSES_KEY = 'assignments:misses'
+
+
+def gift_pairs_page(givers, cursor=None, archive=False):
+    """
+    Function returning one page of gifts the participants have to buy.
+
+    :param givers: queryset of Participant objects (one email can be stored by several creators)
+    :param cursor: cursor of the requested page or None for the first page
+    :param archive: past games (newest first) instead of upcoming ones
+    :return: KeysetPage of GiftPair objects
+    """
+    today = date.today()
+    gift_pairs = GiftPair.objects.filter(giver__in=givers).select_related('draw__event', 'receiver')
+    if archive:
+        gift_pairs = gift_pairs.filter(draw__date__lt=today)
+    else:
+        gift_pairs = gift_pairs.filter(draw__date__gte=today)
+    return keyset_page(gift_pairs, cursor, date_field='draw__date', descending=archive)
+
+
+def load_assignments(email, cursor=None, archive=False):
+    """
+    Function reading one page of assignments of an email from the database.
+
+    :param email: email of the giver (case-insensitive)
+    :param cursor: cursor of the requested page or None for the first page
+    :param archive: past games instead of upcoming ones
+    :return: dict with the stored email of the participant (None when the email is unknown),
+             rows ready for the templates and the cursor of the next page
+    """
+    participant = Participant.objects.with_email(email).first()
+    if participant is None:
+        return {'email': None, 'rows': [], 'next_cursor': None}
+
+    page = gift_pairs_page(Participant.objects.with_email(email), cursor, archive)
+    return {
+        'email': participant.email,
+        'rows': [{
+            'event_name': gift_pair.draw.event.name,
+            'date': gift_pair.draw.date,
+            'receiver_name': gift_pair.receiver.name,
+            'receiver_wishlist': gift_pair.receiver.wishlist,
+        } for gift_pair in page],
+        'next_cursor': page.next_cursor,
+    }
+
+
+def cache_key(email, day=None):
+    # upcoming games depend on the current date, so yesterday's entries are never reused
+    day = day or date.today()
+    return f'assignments:{email.lower()}:{day.isoformat()}'
+
+
+def cached_assignments(email):
+    """
+    Function returning the first page of upcoming assignments of an email from the cache,
+    loading it from the database on a miss.
+
+    :param email: email of the giver (case-insensitive)
+    :return: dict like load_assignments
+    """
+    key = cache_key(email)
+    # users who have just written skip the cache, which may hold rows read from a lagging replica
+    data = None if pinned_to_primary() else cache.get(key)
+    if data is not None:
+        _count(HITS_KEY)
+        return data
+
+    _count(MISSES_KEY)
+    data = load_assignments(email)
+    # a lagging replica can return rows from before the last invalidation, so they are kept only briefly
+    cache.set(key, data, REPLICA_LAG_SECONDS if reads_from_replica() else CACHE_TIMEOUT)
+    return data
+
+
+def get_assignments(email, cursor=None, archive=False):
+    """
+    Function returning one page of assignments of an email.
+    Only the first page of upcoming games is cached - it is what almost every request asks for.
+
+    :param email: email of the giver (case-insensitive)
+    :param cursor: cursor of the requested page or None for the first page
+    :param archive: past games instead of upcoming ones
+    :return: dict like load_assignments
+    """
+    if cursor or archive:
+        return load_assignments(email, cursor, archive)
+    return cached_assignments(email)
+
+
+def invalidate_emails(emails):
+    """
+    Function removing cached assignments of the given emails.
+    Entries are removed right away and again after the current transaction commits,
+    so a request running in between cannot cache data from before the change.
+
+    :param emails: iterable of emails
+    """
+    keys = [cache_key(email) for email in set(emails) if email]
+    if not keys:
+        return
+    cache.delete_many(keys)
+    transaction.on_commit(lambda: cache.delete_many(keys))
+
+
+def invalidate_givers(gift_pairs):
+    """
+    Function removing cached assignments of the givers of gift pairs. Needs one query.
+
+    :param gift_pairs: queryset of GiftPair objects
+    """
+    invalidate_emails(Participant.objects.filter(gifts_given__in=gift_pairs).values_list('email', flat=True))
+
+
+def invalidate_participants(participants):
+    """
+    Function removing cached assignments of participants and of everyone giving gifts to them.
+    Needs one query.
+
+    :param participants: queryset of Participant objects
+    """
+    invalidate_emails(Participant.objects.filter(
+        Q(pk__in=participants) | Q(gifts_given__receiver__in=participants)
+    ).values_list('email', flat=True))
+
+
+def cache_stats():
+    """
+    Function returning hit and miss counters of the assignment cache.
+
+    :return: dict with hits, misses and hit_ratio
+    """
+    counters = cache.get_many([HITS_KEY, MISSES_KEY])
+    hits = counters.get(HITS_KEY, 0)
+    misses = counters.get(MISSES_KEY, 0)
+    total = hits + misses
+    return {'hits': hits, 'misses': misses, 'hit_ratio': hits / total if total else None}
+
+
+def _count(key):
+    # add() is a no-op when the counter exists, incr() is atomic on shared backends
+    cache.add(key, 0, None)
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.set(key, 1, None)
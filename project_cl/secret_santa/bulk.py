@@ -0,0 +1,22 @@
+from django.db import connections, router
+from .query_budget import row_by_row
+
+
+def bulk_create_with_ids(model, objs, batch_size=None):
+    """
+    Function saving new rows with as few INSERTs as possible and setting their primary keys.
+    Backends that cannot return the ids of a bulk insert (e.g. SQLite on Django 3.2) save the rows
+    one by one instead, as the ids cannot be matched to the rows reliably afterwards.
+    Those saves send the usual post_save signals and are not checked against query budgets.
+
+    :param model: model class
+    :param objs: list of unsaved model instances
+    :param batch_size: number of rows inserted with one query
+    :return: the list of objs, with their primary keys set
+    """
+    if connections[router.db_for_write(model)].features.can_return_rows_from_bulk_insert:
+        return model.objects.bulk_create(objs, batch_size=batch_size)
+    with row_by_row():
+        for obj in objs:
+            obj.save(force_insert=True)
+    return objs
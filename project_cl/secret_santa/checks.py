@@ -0,0 +1,27 @@
+from django.conf import settings
+from django.core.checks import Tags, Warning, register
+
+
+PROCESS_LOCAL_CACHES = (
+    'django.core.cache.backends.locmem.LocMemCache',
+    'django.core.cache.backends.dummy.DummyCache',
+)
+
+
+@register(Tags.caches)
+def check_shared_cache(app_configs, **kwargs):
+    """
+    Check warning when the default cache is not shared by the worker processes.
+    Modification stamps of the dashboard fragments and cached assignments are removed
+    only in the cache of the process saving the change, so other workers would keep
+    showing stale fragments and assignments until they expire.
+    """
+    if settings.DEBUG or settings.CACHES['default']['BACKEND'] not in PROCESS_LOCAL_CACHES:
+        return []
+    return [Warning(
+        'The default cache is local to one process.',
+        hint='With several workers set CACHE_BACKEND to a shared cache, e.g. '
+             'django.core.cache.backends.memcached.PyMemcacheCache or '
+             'django.core.cache.backends.db.DatabaseCache.',
+        id='secret_santa.W001',
+    )]
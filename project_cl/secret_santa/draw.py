@@ -0,0 +1,466 @@
+import random
+from collections import defaultdict
+from django.db import transaction
+from django.db.models import prefetch_related_objects
+from .assignments import invalidate_emails
+from .bulk import bulk_create_with_ids
+from .fragments import event_stamp_key, touch
+from .mail import render_assignments
+from .models import Draw, Exclusion, GiftPair, Group, OutboxEmail
+
+
+SWAP_ATTEMPTS = 30  # random partners tried for every conflicting giver before falling back to matching
+EXACT_REPEATS_LIMIT = 100  # groups up to this size get the exact fewest repeats (O(n^3))
+
+
+class DrawInfeasible(ValueError):
+    """
+    Raised when no assignment satisfies the exclusion rules.
+    The message explains which participants make the draw impossible.
+    """
+
+
+def draw_pairs(participants, exclusions=(), key=None, rng=random, avoid=()):
+    """
+    Function drawing gift pairs with exclusion rules.
+    Nobody draws themselves and no giver draws a receiver excluded for them.
+
+    A random permutation is drawn first and conflicting givers swap receivers
+    with random partners. Givers left without a valid receiver are placed
+    with augmenting paths (bipartite matching), which either finds an assignment
+    or proves that none exists. Exclusions are stored per giver, so the cost
+    grows with the number of participants and rules, not with their square.
+    Pairs to avoid are treated like exclusions until they make the draw
+    impossible. Then they are allowed again one giver at a time, and the
+    repeats are reduced afterwards (exactly for groups up to EXACT_REPEATS_LIMIT).
+
+    :param participants: list of participants (model instances, tuples, ids...)
+    :param exclusions: iterable of (giver, receiver) keys that must not be drawn
+    :param key: function returning the key of a participant used in exclusions (the participant itself by default)
+    :param rng: random number generator (random module or random.Random instance)
+    :param avoid: iterable of (giver, receiver) keys that should not be drawn (e.g. previous years),
+                  repeated only as far as the exclusions make it necessary
+    :return: list of tuples (giver, receiver)
+    :raises DrawInfeasible: when the rules leave no valid assignment
+    """
+    participants = list(participants)
+    n = len(participants)
+    if n == 0:
+        return []
+    if n == 1:
+        raise DrawInfeasible('At least two participants are needed for a draw.')
+
+    keys = [key(participant) for participant in participants] if key else participants
+    index = {participant_key: i for i, participant_key in enumerate(keys)}
+    forbidden = [set() for _ in range(n)]
+    for giver, receiver in exclusions:
+        if giver in index and receiver in index:
+            forbidden[index[giver]].add(index[receiver])
+    for i in range(n):
+        forbidden[i].add(i)
+
+    _check_feasible(participants, forbidden)
+
+    soft = [set() for _ in range(n)]
+    for giver, receiver in avoid:
+        if giver in index and receiver in index:
+            i, j = index[giver], index[receiver]
+            if j not in forbidden[i]:
+                soft[i].add(j)
+    avoided = [set(receivers) for receivers in soft]
+    for i in range(n):
+        forbidden[i] |= soft[i]
+
+    receivers = list(range(n))
+    rng.shuffle(receivers)
+    conflicts = [i for i in range(n) if receivers[i] in forbidden[i]]
+    stuck = []
+    for i in conflicts:
+        if receivers[i] not in forbidden[i]:
+            continue  # fixed by an earlier swap
+        for _ in range(SWAP_ATTEMPTS):
+            j = rng.randrange(n)
+            if receivers[j] not in forbidden[i] and receivers[i] not in forbidden[j]:
+                receivers[i], receivers[j] = receivers[j], receivers[i]
+                break
+        else:
+            stuck.append(i)
+
+    if stuck:
+        _assign_with_matching(participants, forbidden, receivers, stuck, soft, rng)
+        if any(receivers[i] in avoided[i] for i in range(n)):
+            _reduce_repeats(forbidden, receivers, avoided)
+        if n <= EXACT_REPEATS_LIMIT and any(receivers[i] in avoided[i] for i in range(n)):
+            receivers = _fewest_repeats(forbidden, avoided, rng)
+
+    return [(participants[i], participants[receivers[i]]) for i in range(n)]
+
+
+def _check_feasible(participants, forbidden):
+    """
+    Function failing fast on the most common impossible rules.
+    """
+    n = len(participants)
+    for i, excluded in enumerate(forbidden):
+        if len(excluded) >= n:
+            raise DrawInfeasible(f'{participants[i]} cannot give a gift to anyone.')
+
+    givers_excluding = [0] * n
+    for excluded in forbidden:
+        for j in excluded:
+            givers_excluding[j] += 1
+    for j, count in enumerate(givers_excluding):
+        if count >= n:
+            raise DrawInfeasible(f'Nobody can give a gift to {participants[j]}.')
+
+
+def _assign_with_matching(participants, forbidden, receivers, stuck, soft, rng):
+    """
+    Function placing givers that random swaps could not fix.
+    Each of them is matched through a breadth-first search for an augmenting path.
+    Every receiver is visited at most once per search, so a search costs
+    O(participants + exclusions) even though the graph of allowed pairs is dense.
+
+    When a search fails, pairs to avoid of one of the givers it reached are allowed
+    again and the search is repeated, until a path is found or nothing is left to relax.
+    """
+    n = len(participants)
+    stuck_set = set(stuck)  # stuck keeps the order of the searches
+    owner = [None] * n
+    for i in range(n):
+        if i not in stuck_set:
+            owner[receivers[i]] = i
+    for giver in stuck:
+        receivers[giver] = None
+
+    for giver in stuck:
+        free_receiver, parent, reached = _augmenting_path(giver, forbidden, owner, n)
+        while free_receiver is None:
+            relaxable = [u for u in reached if soft[u]]
+            if not relaxable:
+                names = ', '.join(str(participants[i]) for i in reached[:5])
+                more = f' and {len(reached) - 5} more' if len(reached) > 5 else ''
+                raise DrawInfeasible(
+                    f'{len(reached)} participants ({names}{more}) can only give gifts to '
+                    f'{len(reached) - 1} people between them.'
+                )
+            u = rng.choice(relaxable)
+            forbidden[u] -= soft[u]
+            soft[u] = set()
+            free_receiver, parent, reached = _augmenting_path(giver, forbidden, owner, n)
+
+        r = free_receiver
+        while r is not None:
+            u = parent[r]
+            previous = receivers[u]
+            receivers[u] = r
+            owner[r] = u
+            r = previous if u != giver else None
+
+
+def _reduce_repeats(forbidden, receivers, avoided):
+    """
+    Function moving repeated pairs back to new receivers where it is possible.
+    A giver with a repeated receiver gives it up and looks for a chain of givers
+    that can pass receivers on without repeats and free a new one for them.
+    """
+    n = len(receivers)
+    strict = [forbidden[i] | avoided[i] for i in range(n)]
+    owner = [None] * n
+    for i in range(n):
+        owner[receivers[i]] = i
+
+    for giver in range(n):
+        repeated = receivers[giver]
+        if repeated not in avoided[giver]:
+            continue
+        owner[repeated] = None
+        receivers[giver] = None
+        free_receiver, parent, reached = _augmenting_path(giver, strict, owner, n)
+        if free_receiver is None:
+            owner[repeated] = giver
+            receivers[giver] = repeated
+            continue
+        r = free_receiver
+        while r is not None:
+            u = parent[r]
+            previous = receivers[u]
+            receivers[u] = r
+            owner[r] = u
+            r = previous if u != giver else None
+
+
+def _fewest_repeats(forbidden, avoided, rng):
+    """
+    Function returning the assignment with the fewest repeated pairs (Hungarian algorithm).
+    Used for small groups only, after a valid assignment was found.
+    Participants are shuffled first, so equally good assignments are picked at random.
+    """
+    n = len(forbidden)
+    order = list(range(n))
+    rng.shuffle(order)
+    excluded = n + 1  # more than any number of repeats, a valid assignment never pays it
+    costs = [[0] * (n + 1)]
+    for giver in order:
+        row = [0]
+        for receiver in order:
+            if receiver in avoided[giver]:
+                row.append(1)
+            elif receiver in forbidden[giver]:
+                row.append(excluded)
+            else:
+                row.append(0)
+        costs.append(row)
+
+    infinity = float('inf')
+    u = [0] * (n + 1)
+    v = [0] * (n + 1)
+    match = [0] * (n + 1)  # column -> row
+    way = [0] * (n + 1)
+    for row in range(1, n + 1):
+        match[0] = row
+        column = 0
+        min_values = [infinity] * (n + 1)
+        used = [False] * (n + 1)
+        while True:
+            used[column] = True
+            current_row = match[column]
+            delta = infinity
+            next_column = 0
+            row_costs = costs[current_row]
+            for j in range(1, n + 1):
+                if not used[j]:
+                    reduced = row_costs[j] - u[current_row] - v[j]
+                    if reduced < min_values[j]:
+                        min_values[j] = reduced
+                        way[j] = column
+                    if min_values[j] < delta:
+                        delta = min_values[j]
+                        next_column = j
+            for j in range(n + 1):
+                if used[j]:
+                    u[match[j]] += delta
+                    v[j] -= delta
+                else:
+                    min_values[j] -= delta
+            column = next_column
+            if match[column] == 0:
+                break
+        while column:
+            previous = way[column]
+            match[column] = match[previous]
+            column = previous
+
+    receivers = [None] * n
+    for column in range(1, n + 1):
+        receivers[order[match[column] - 1]] = order[column - 1]
+    return receivers
+
+
+def _augmenting_path(giver, forbidden, owner, n):
+    """
+    Function searching for a free receiver reachable from the giver through taken receivers.
+
+    :return: tuple (free receiver or None, dict receiver -> giver it was reached from, list of reached givers)
+    """
+    # after visiting a giver only receivers excluded for them stay unvisited,
+    # so the list shrinks to at most the size of one exclusion set
+    unvisited = list(range(n))
+    parent = {}
+    queue = [giver]
+    reached = [giver]
+    free_receiver = None
+    while queue and free_receiver is None:
+        u = queue.pop(0)
+        remaining = []
+        for r in unvisited:
+            if free_receiver is not None or r in forbidden[u]:
+                remaining.append(r)
+                continue
+            parent[r] = u
+            if owner[r] is None:
+                free_receiver = r
+            else:
+                queue.append(owner[r])
+                reached.append(owner[r])
+        unvisited = remaining
+    return free_receiver, parent, reached
+
+
+def exclusion_pairs(group):
+    """
+    Function returning the exclusion rules of a group as (giver_id, receiver_id) pairs.
+    Mutual rules are returned in both directions. Needs one query.
+
+    :param group: Group object
+    :return: list of tuples
+    """
+    pairs = []
+    for giver_id, receiver_id, mutual in group.exclusions.values_list('giver_id', 'receiver_id', 'mutual'):
+        pairs.append((giver_id, receiver_id))
+        if mutual:
+            pairs.append((receiver_id, giver_id))
+    return pairs
+
+
+def history_pairs(group, last):
+    """
+    Function returning (giver_id, receiver_id) pairs drawn in the last draws of a group.
+    Needs one query, which uses the (group, date) index of draws and the (draw, id) index of pairs.
+
+    :param group: Group object
+    :param last: number of previous draws to read
+    :return: set of tuples
+    """
+    if not last:
+        return set()
+    draws = Draw.objects.filter(group=group).order_by('-date', '-id').values('id')[:last]
+    return set(GiftPair.objects.filter(draw__in=draws).values_list('giver_id', 'receiver_id'))
+
+
+def history_pairs_by_group(groups, last):
+    """
+    Function returning the pairs drawn in the last draws of every group. Needs two queries.
+
+    :param groups: list of Group objects
+    :param last: number of previous draws of every group to read
+    :return: dict group id -> set of tuples (giver_id, receiver_id)
+    """
+    history = defaultdict(set)
+    if not last:
+        return history
+    draw_groups = {}
+    per_group = defaultdict(int)
+    for draw_id, group_id in (Draw.objects.filter(group__in=groups)
+                              .order_by('group_id', '-date', '-id').values_list('id', 'group_id')):
+        if per_group[group_id] < last:
+            per_group[group_id] += 1
+            draw_groups[draw_id] = group_id
+    if draw_groups:
+        for draw_id, giver_id, receiver_id in (GiftPair.objects.filter(draw__in=list(draw_groups))
+                                               .values_list('draw_id', 'giver_id', 'receiver_id')):
+            history[draw_groups[draw_id]].add((giver_id, receiver_id))
+    return history
+
+
+def game_rows(group, pairs, day):
+    """
+    Function building the gift pairs and outbox emails of a game, not saved yet (draw is set later).
+
+    :param group: Group object
+    :param pairs: list of tuples (giver, receiver) of Participant objects
+    :param day: date of the gift exchange
+    :return: tuple (list of GiftPair objects, list of OutboxEmail objects)
+    """
+    gift_pairs = [GiftPair(giver=giver, receiver=receiver) for giver, receiver in pairs]
+    assignments = [(giver.name, giver.email, receiver.name, receiver.wishlist) for giver, receiver in pairs]
+    emails = [OutboxEmail(recipient=recipient, subject=subject, body=body, html_body=html)
+              for recipient, subject, body, html
+              in render_assignments(assignments, group.price_limit, group.currency, day)]
+    return gift_pairs, emails
+
+
+def create_draw(event, group, day, avoid_repeats=0):
+    """
+    Function drawing gift pairs of a group and saving them as a new game.
+    The draw, its pairs and the emails for the outbox are saved in one transaction,
+    so a game is never visible half-done; the deliver_outbox worker sends the emails
+    once it is committed.
+
+    :param event: Event object
+    :param group: Group object
+    :param day: date of the gift exchange
+    :param avoid_repeats: number of previous draws of the group whose pairs should not repeat
+    :return: saved Draw object
+    :raises DrawInfeasible: when the exclusion rules of the group leave no valid assignment
+    """
+    pairs = draw_pairs(group.participants.all(), exclusion_pairs(group),
+                       key=lambda player: player.pk, avoid=history_pairs(group, avoid_repeats))
+    gift_pairs, emails = game_rows(group, pairs, day)
+
+    with transaction.atomic():
+        draw = Draw.objects.create(event=event, group=group, date=day,
+                                   price_limit=group.price_limit, currency=group.currency)
+        for gift_pair, email in zip(gift_pairs, emails):
+            gift_pair.draw = draw
+            email.draw = draw
+        GiftPair.objects.bulk_create(gift_pairs)
+        OutboxEmail.objects.bulk_create(emails)
+        invalidate_emails(giver.email for giver, receiver in pairs)
+    return draw
+
+
+class EventDrawReport:
+    """
+    Result of drawing all groups of an event.
+
+    Attributes:
+        - groups: list of dicts, one per group: group, players (number), draw (saved Draw or None)
+                  and error (why the group cannot be drawn, or None).
+        - saved: True when the games were saved - all groups are drawn or none.
+    """
+    def __init__(self):
+        self.groups = []
+        self.saved = False
+
+    @property
+    def failed(self):
+        return [result for result in self.groups if result['error']]
+
+    def __repr__(self):
+        return f'<EventDrawReport groups={len(self.groups)} failed={len(self.failed)} saved={self.saved}>'
+
+
+def draw_event(event, day, avoid_repeats=0, batch_size=1000):
+    """
+    Function drawing every group of an event and saving all the games at once.
+    Groups, players, exclusions and history are read with a few queries for all groups together,
+    and the groups are locked until the games are saved, so the whole event is drawn from one
+    consistent snapshot. The games are saved in one transaction: when any group cannot be drawn,
+    nothing is saved and the report tells which groups fail.
+
+    :param event: Event object
+    :param day: date of the gift exchange
+    :param avoid_repeats: number of previous draws of every group whose pairs should not repeat
+    :param batch_size: number of rows per INSERT of gift pairs and emails
+    :return: EventDrawReport
+    """
+    report = EventDrawReport()
+    with transaction.atomic():
+        groups = list(Group.objects.select_for_update().filter(events=event).order_by('id'))
+        prefetch_related_objects(groups, 'participants')
+        exclusions = defaultdict(list)
+        for group_id, giver_id, receiver_id, mutual in Exclusion.objects.filter(group__in=groups).values_list(
+                'group_id', 'giver_id', 'receiver_id', 'mutual'):
+            exclusions[group_id].append((giver_id, receiver_id))
+            if mutual:
+                exclusions[group_id].append((receiver_id, giver_id))
+        history = history_pairs_by_group(groups, avoid_repeats)
+
+        games = []
+        for group in groups:
+            result = {'group': group, 'players': len(group.participants.all()), 'draw': None, 'error': None}
+            report.groups.append(result)
+            try:
+                pairs = draw_pairs(group.participants.all(), exclusions[group.id],
+                                   key=lambda player: player.pk, avoid=history[group.id])
+            except DrawInfeasible as e:
+                result['error'] = str(e)
+                continue
+            games.append((result, pairs, *game_rows(group, pairs, day)))
+        if report.failed or not games:
+            return report
+
+        draws = [Draw(event=event, group=result['group'], date=day, price_limit=result['group'].price_limit,
+                      currency=result['group'].currency) for result, pairs, gift_pairs, emails in games]
+        bulk_create_with_ids(Draw, draws)
+        for draw, (result, pairs, gift_pairs, emails) in zip(draws, games):
+            result['draw'] = draw
+            for row in gift_pairs + emails:
+                row.draw = draw
+        GiftPair.objects.bulk_create([row for game in games for row in game[2]], batch_size=batch_size)
+        OutboxEmail.objects.bulk_create([row for game in games for row in game[3]], batch_size=batch_size)
+        invalidate_emails(giver.email for game in games for giver, receiver in game[1])
+        touch(event_stamp_key(event.id))  # bulk inserts send no post_save of the draws
+        report.saved = True
+    return report
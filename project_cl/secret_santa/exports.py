@@ -0,0 +1,96 @@
+import csv
+import json
+from .models import GiftPair
+
+
+EXPORT_CHUNK_SIZE = 2000  # rows fetched from the database at a time
+EXPORT_FORMATS = {
+    'csv': 'text/csv',
+    'jsonl': 'application/x-ndjson',
+}
+EXPORT_COLUMNS = [
+    'game', 'event', 'group', 'date', 'price_limit', 'currency',
+    'giver_name', 'giver_email', 'giver_wishlist',
+    'receiver_name', 'receiver_email', 'receiver_wishlist',
+]
+QUERY_FIELDS = [
+    'draw_id', 'draw__event__name', 'draw__group__name', 'draw__date', 'draw__price_limit', 'draw__currency',
+    'giver__first_name', 'giver__last_name', 'giver__email', 'giver__wishlist',
+    'receiver__first_name', 'receiver__last_name', 'receiver__email', 'receiver__wishlist',
+]
+
+
+def export_rows(gift_pairs):
+    """
+    Function reading gift pairs for an export, EXPORT_CHUNK_SIZE rows at a time.
+    Only plain values are fetched (no model instances), so memory stays flat for draws of any size.
+
+    :param gift_pairs: queryset of GiftPair objects
+    :return: generator of dicts with EXPORT_COLUMNS keys
+    """
+    rows = (gift_pairs.order_by('draw__date', 'draw_id', 'id')
+            .values_list(*QUERY_FIELDS)
+            .iterator(chunk_size=EXPORT_CHUNK_SIZE))
+    for (game, event, group, day, price_limit, currency,
+         giver_first, giver_last, giver_email, giver_wishlist,
+         receiver_first, receiver_last, receiver_email, receiver_wishlist) in rows:
+        yield {
+            'game': game,
+            'event': event,
+            'group': group,
+            'date': day.isoformat(),
+            'price_limit': str(price_limit),
+            'currency': currency,
+            'giver_name': f'{giver_first} {giver_last}',
+            'giver_email': giver_email,
+            'giver_wishlist': giver_wishlist or '',
+            'receiver_name': f'{receiver_first} {receiver_last}',
+            'receiver_email': receiver_email,
+            'receiver_wishlist': receiver_wishlist or '',
+        }
+
+
+class _Echo:
+    # csv.writer writes into this "file" and gets the line back, nothing is buffered
+    def write(self, value):
+        return value
+
+
+def csv_lines(rows):
+    """
+    Function turning export rows into CSV lines, starting with a header.
+
+    :param rows: iterable of dicts returned by export_rows
+    :return: generator of strings
+    """
+    writer = csv.DictWriter(_Echo(), fieldnames=EXPORT_COLUMNS)
+    yield writer.writeheader()
+    for row in rows:
+        yield writer.writerow(row)
+
+
+def jsonl_lines(rows):
+    """
+    Function turning export rows into JSON Lines (one JSON object per line).
+
+    :param rows: iterable of dicts returned by export_rows
+    :return: generator of strings
+    """
+    for row in rows:
+        yield json.dumps(row, ensure_ascii=False) + '\n'
+
+
+def export_lines(gift_pairs, export_format):
+    """
+    Function returning the lines of an export of gift pairs.
+
+    :param gift_pairs: queryset of GiftPair objects
+    :param export_format: key of EXPORT_FORMATS
+    :return: generator of strings
+    """
+    rows = export_rows(gift_pairs)
+    return csv_lines(rows) if export_format == 'csv' else jsonl_lines(rows)
+
+
+def organizer_pairs(user):
+    return GiftPair.objects.filter(draw__event__organizer=user)
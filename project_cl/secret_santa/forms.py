@@ -1,8 +1,11 @@
+import io
 from django import forms
-from .models import Event, Group, Participant
+from .models import Event, Exclusion, Group, Participant
+from .quick_game import QUICK_GAME_MAX_UPLOAD_BYTES, read_players
 from django.contrib.auth.forms import UserCreationForm
 from django.contrib.auth.models import User
 from django.core.exceptions import ValidationError
+from django.utils import timezone
 from django.contrib.auth.forms import PasswordResetForm
 
 
@@ -58,6 +61,31 @@ class QucikGameForm(forms.Form):
     max_price = forms.DecimalField(label='Max price', decimal_places=2, min_value=0.01)
     currency = forms.ChoiceField(label='Currency', choices=CURRENCY_CHOICES, widget=forms.Select)
     date = forms.DateField(label='Date', widget=forms.TextInput(attrs={'placeholder': 'YYYY-MM-DD'}))
+    players = forms.CharField(label='Paste players', required=False,
+                              widget=forms.Textarea(attrs={'rows': 5, 'placeholder': 'Anna Smith, anna@example.com'}),
+                              help_text='One player per line: name, email.')
+    players_file = forms.FileField(label='Or upload a file', required=False,
+                                   help_text='CSV file with name, email lines.')
+
+    def clean_players(self):
+        """
+        Function reading the pasted players.
+        """
+        return read_players(self.cleaned_data['players'].splitlines())
+
+    def clean_players_file(self):
+        """
+        Function reading the uploaded players, up to QUICK_GAME_MAX_UPLOAD_BYTES.
+        """
+        upload = self.cleaned_data['players_file']
+        if not upload:
+            return []
+        if upload.size > QUICK_GAME_MAX_UPLOAD_BYTES:
+            raise ValidationError(f'The file can have at most {QUICK_GAME_MAX_UPLOAD_BYTES // 1024} KB.')
+        try:
+            return read_players(io.TextIOWrapper(upload.file, encoding='utf-8-sig', newline=''))
+        except UnicodeDecodeError:
+            raise ValidationError('The file must be UTF-8 text.')
 
 
 class EventForm(forms.ModelForm):
@@ -76,11 +104,13 @@ class EventForm(forms.ModelForm):
         """
         Function that allows to pass user as an argument.
         Organizer is now being automaticly added to the form (logged user).
+        User can only choose their own groups.
         """
         user = kwargs.pop('user', None)
         super(EventForm, self).__init__(*args, **kwargs)
         if user:
             self.initial['organizer'] = user
+            self.fields['groups'].queryset = Group.objects.filter(creator=user)
 
 
 class GroupForm(forms.ModelForm):
@@ -117,6 +147,41 @@ class GroupForm(forms.ModelForm):
             raise ValidationError('Group must contain at least 3 players.')
 
 
+class ExclusionForm(forms.ModelForm):
+    """
+    Form created for adding exclusion rules to a group.
+    Giver and receiver are chosen from the players of the group.
+    """
+    class Meta:
+        model = Exclusion
+        fields = ('giver', 'receiver', 'mutual')
+        labels = {
+            'giver': 'Player',
+            'receiver': 'Cannot draw',
+            'mutual': 'Both ways',
+        }
+
+    def __init__(self, *args, **kwargs):
+        """
+        Function that allows to pass group as an argument.
+        """
+        group = kwargs.pop('group', None)
+        super(ExclusionForm, self).__init__(*args, **kwargs)
+        if group:
+            self.instance.group = group
+            self.fields['giver'].queryset = group.participants.all()
+            self.fields['receiver'].queryset = group.participants.all()
+
+    def clean(self):
+        """
+        Function checking if giver and receiver are different players.
+        """
+        cleaned_data = super().clean()
+        if cleaned_data.get('giver') and cleaned_data.get('giver') == cleaned_data.get('receiver'):
+            raise ValidationError('Choose two different players.')
+        return cleaned_data
+
+
 class ParticipantForm(forms.ModelForm):
     """
     Form created for adding new participants.
@@ -139,6 +204,27 @@ class ParticipantForm(forms.ModelForm):
             self.initial['creator'] = user
 
 
+class ParticipantImportForm(forms.Form):
+    """
+    Form created for importing many players at once from a CSV file.
+    Optionally creates a group of all players listed in the file.
+    """
+    file = forms.FileField(label='CSV file', help_text='Columns: first_name, last_name, email and optional wishlist.')
+    group_name = forms.CharField(label='Create group', max_length=64, required=False)
+    price_limit = forms.DecimalField(label='Group price limit', max_digits=10, decimal_places=2,
+                                     min_value=0.01, required=False)
+    currency = forms.ChoiceField(label='Group currency', choices=CURRENCY_CHOICES, initial='PLN')
+
+    def clean(self):
+        """
+        Function checking if a group to create has a price limit.
+        """
+        cleaned_data = super().clean()
+        if cleaned_data.get('group_name') and not cleaned_data.get('price_limit'):
+            raise ValidationError('Enter a price limit for the group.')
+        return cleaned_data
+
+
 class GameForm(forms.Form):
     """
     Form created for creating new shuffle.
@@ -154,6 +240,43 @@ class GameForm(forms.Form):
     event = forms.ModelChoiceField(queryset=Event.objects.none())
     group = forms.ModelChoiceField(queryset=Group.objects.none())
     date = forms.DateField(widget=forms.TextInput(attrs={'placeholder': 'YYYY-MM-DD'}))
+    avoid_repeats = forms.IntegerField(
+        label='Avoid pairs from previous draws', min_value=0, max_value=10, initial=1, required=False,
+        help_text='Number of previous draws of the group whose pairs should not repeat (0 - allow repeats).')
+    run_at = forms.DateTimeField(
+        label='Draw at', required=False, widget=forms.TextInput(attrs={'placeholder': 'YYYY-MM-DD HH:MM'}),
+        help_text='Leave empty to draw now, or choose when the draw and the emails should run.')
+
+    def clean_avoid_repeats(self):
+        """
+        Function returning 0 (allow repeats) when the field is left empty.
+        """
+        return self.cleaned_data['avoid_repeats'] or 0
+
+    def clean_run_at(self):
+        """
+        Function checking if a scheduled draw is set in the future.
+        """
+        run_at = self.cleaned_data['run_at']
+        if run_at and run_at <= timezone.now():
+            raise ValidationError('Choose a time in the future.')
+        return run_at
+
+
+class EventDrawForm(forms.Form):
+    """
+    Form created for drawing all groups of an event at once.
+    """
+    date = forms.DateField(widget=forms.TextInput(attrs={'placeholder': 'YYYY-MM-DD'}))
+    avoid_repeats = forms.IntegerField(
+        label='Avoid pairs from previous draws', min_value=0, max_value=10, initial=1, required=False,
+        help_text='Number of previous draws of every group whose pairs should not repeat (0 - allow repeats).')
+
+    def clean_avoid_repeats(self):
+        """
+        Function returning 0 (allow repeats) when the field is left empty.
+        """
+        return self.cleaned_data['avoid_repeats'] or 0
 
 
 class RegisterForm(UserCreationForm):
@@ -175,6 +298,7 @@ class EmailLookupForm(forms.Form):
     for a special email address.
     """
     email = forms.EmailField(label='Enter your email', required=True)
+    cursor = forms.CharField(required=False, widget=forms.HiddenInput)
 
 
 # class CustomPasswordResetForm(PasswordResetForm): # not sure if I will include this view
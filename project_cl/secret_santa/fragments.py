@@ -0,0 +1,91 @@
+import time
+from django.core.cache import cache
+from django.core.cache.utils import make_template_fragment_key
+from django.db import transaction
+from .models import Draw
+from .routers import REPLICA_LAG_SECONDS, reads_from_replica
+
+
+FRAGMENT_TIMEOUT = 60 * 60 * 24
+
+# Cached fragments of the dashboard are never deleted. Their keys contain modification stamps
+# of what they show, and a change stores a new stamp, so the old fragment is simply not used again:
+# - game card: draw id + stamps of its event, its group and the organizer's players,
+# - group members: group id + stamps of the group and the organizer's players.
+# A draw and its pairs do not change after the draw, so the id is enough for them.
+# Stamps are times in nanoseconds. A stamp missing from the cache gets a new value,
+# so a lost stamp can never bring back an old fragment.
+
+
+def event_stamp_key(event_id):
+    return f'stamp:event:{event_id}'
+
+
+def group_stamp_key(group_id):
+    return f'stamp:group:{group_id}'
+
+
+def players_stamp_key(user_id):
+    return f'stamp:players:{user_id}'
+
+
+def touch(*keys):
+    """
+    Function storing new stamps, which makes the fragments built with the old ones unused.
+    Stamps are stored right away and again after the current transaction commits,
+    so a request running in between cannot cache a fragment from before the change.
+
+    :param keys: stamp keys (event_stamp_key, group_stamp_key, players_stamp_key)
+    """
+    if not keys:
+        return
+
+    def store():
+        stamp = time.time_ns()
+        cache.set_many({key: stamp for key in keys}, None)
+
+    store()
+    transaction.on_commit(store)
+
+
+def touch_games(gift_pairs):
+    """
+    Function making the game cards of gift pairs unused. Needs one query.
+
+    :param gift_pairs: queryset of GiftPair objects
+    """
+    events = Draw.objects.filter(pairs__in=gift_pairs).values_list('event_id', flat=True).distinct()
+    touch(*[event_stamp_key(event_id) for event_id in events])
+
+
+def get_stamps(keys):
+    """
+    Function reading stamps, creating the missing ones.
+
+    :param keys: iterable of stamp keys
+    :return: dict key -> stamp
+    """
+    keys = set(keys)
+    stamps = cache.get_many(keys)
+    missing = {key: time.time_ns() for key in keys if key not in stamps}
+    if missing:
+        cache.set_many(missing, None)
+        stamps.update(missing)
+    return stamps
+
+
+def fragment_timeout():
+    # a lagging replica can return rows from before the last change, so they are kept only briefly
+    return REPLICA_LAG_SECONDS if reads_from_replica() else FRAGMENT_TIMEOUT
+
+
+def cached_fragments(name, versions):
+    """
+    Function telling which fragments are in the cache, so their data does not have to be loaded.
+
+    :param name: fragment name used in the {% cache %} tag
+    :param versions: iterable of version strings used in the {% cache %} tag
+    :return: set of versions whose fragments are cached
+    """
+    keys = {make_template_fragment_key(name, [version]): version for version in versions}
+    return {keys[key] for key in cache.get_many(keys)}
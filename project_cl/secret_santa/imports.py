@@ -0,0 +1,152 @@
+import csv
+from django.core.exceptions import ValidationError
+from django.core.validators import validate_email
+from django.db import transaction
+from django.db.models.functions import Lower
+from .assignments import invalidate_emails
+from .bulk import bulk_create_with_ids
+from .fragments import players_stamp_key, touch
+from .models import Group, Participant
+
+
+IMPORT_BATCH_SIZE = 1000
+REQUIRED_COLUMNS = ('first_name', 'last_name', 'email')
+NAME_MAX_LENGTH = Participant._meta.get_field('first_name').max_length
+
+
+class ImportReport:
+    """
+    Result of a participant import.
+
+    Attributes:
+        - created: number of new participants.
+        - duplicates: number of rows whose email the creator already had (or that repeated an earlier row).
+        - errors: list of tuples (line number, message) of rows that were skipped.
+        - group: Group created from the imported rows or None.
+    """
+    def __init__(self):
+        self.created = 0
+        self.duplicates = 0
+        self.errors = []
+        self.group = None
+
+    def __repr__(self):
+        return f'<ImportReport created={self.created} duplicates={self.duplicates} errors={len(self.errors)}>'
+
+
+def read_rows(lines):
+    """
+    Function reading participants from CSV lines, one row at a time.
+    The header must contain first_name, last_name and email; wishlist is optional.
+
+    :param lines: iterable of text lines (file object, list of strings...)
+    :return: generator of tuples (line number, dict with the columns of the row)
+    :raises ValidationError: when the header misses a required column
+    """
+    reader = csv.DictReader(lines)
+    header = [column.strip().lower() for column in reader.fieldnames or []]
+    missing = [column for column in REQUIRED_COLUMNS if column not in header]
+    if missing:
+        raise ValidationError(f'Missing CSV columns: {", ".join(missing)}.')
+    reader.fieldnames = header
+
+    for row in reader:
+        yield reader.line_num, {column: (row.get(column) or '').strip() for column in header}
+
+
+def clean_row(row):
+    """
+    Function validating one CSV row.
+
+    :param row: dict returned by read_rows
+    :return: error message or None when the row is valid
+    """
+    for column in ('first_name', 'last_name'):
+        if not row[column]:
+            return f'{column} is required.'
+        if len(row[column]) > NAME_MAX_LENGTH:
+            return f'{column} is longer than {NAME_MAX_LENGTH} characters.'
+    try:
+        validate_email(row['email'])
+    except ValidationError:
+        return f'"{row["email"]}" is not a valid email.'
+    return None
+
+
+def import_participants(user, lines, group_name=None, price_limit=None, currency='PLN',
+                        batch_size=IMPORT_BATCH_SIZE):
+    """
+    Function importing participants of a user from CSV lines.
+    Rows are streamed and inserted in batches, so memory does not grow with the file.
+    Emails the user already has are skipped (case-insensitive), using one query
+    to load them into a set. Invalid rows are skipped and reported.
+
+    When group_name is given, a group of every participant listed in the file
+    (new and already existing ones) is created in the same transaction.
+    bulk_create sends no post_save, so the cached assignments of the imported emails
+    and the players fragment of the user are invalidated here.
+
+    :param user: User becoming the creator of the participants
+    :param lines: iterable of CSV text lines
+    :param group_name: name of a group to create or None
+    :param price_limit: price limit of the group
+    :param currency: currency of the group
+    :param batch_size: number of participants inserted with one query
+    :return: ImportReport
+    :raises ValidationError: when the header is invalid or the group would have fewer than 3 players
+    """
+    report = ImportReport()
+    with transaction.atomic():
+        known = dict(
+            Participant.objects.filter(creator=user)
+            .annotate(email_lower=Lower('email'))
+            .values_list('email_lower', 'id')
+        )
+        member_ids = set()
+        batch = []
+        for line, row in read_rows(lines):
+            error = clean_row(row)
+            if error:
+                report.errors.append((line, error))
+                continue
+
+            email = row['email'].lower()
+            if email in known:
+                report.duplicates += 1
+                if known[email] is not None:
+                    member_ids.add(known[email])
+                continue
+            known[email] = None  # inserted below, its id is not known yet
+
+            batch.append(Participant(first_name=row['first_name'], last_name=row['last_name'],
+                                     email=row['email'], wishlist=row.get('wishlist') or None, creator=user))
+            if len(batch) >= batch_size:
+                report.created += _insert(batch, group_name, member_ids)
+                batch = []
+        report.created += _insert(batch, group_name, member_ids)
+
+        if group_name:
+            if len(member_ids) < 3:
+                raise ValidationError('Group must contain at least 3 players.')
+            report.group = Group.objects.create(name=group_name, creator=user,
+                                                price_limit=price_limit, currency=currency)
+            Membership = Group.participants.through
+            Membership.objects.bulk_create(
+                [Membership(group_id=report.group.id, participant_id=pk) for pk in member_ids],
+                batch_size=batch_size,
+            )
+        if report.created:
+            touch(players_stamp_key(user.id))
+    return report
+
+
+def _insert(batch, group_name, member_ids):
+    if not batch:
+        return 0
+    if group_name:
+        created = bulk_create_with_ids(Participant, batch)
+        member_ids.update(participant.pk for participant in created)
+    else:
+        created = Participant.objects.bulk_create(batch)
+    invalidate_emails(participant.email for participant in batch)
+    return len(created)
@@ -0,0 +1,150 @@
+import mailbox
+import os
+import time
+from django.db import transaction
+from .assignments import invalidate_emails
+from .draw import draw_pairs, exclusion_pairs, history_pairs
+from .mail import build_message, render_assignments
+from .models import Draw, GiftPair, OutboxEmail, Participant
+
+
+DRAW_CHUNK_SIZE = 2000
+PARTICIPANT_FIELDS = ('first_name', 'last_name', 'email', 'wishlist')
+
+
+class LargeDrawReport:
+    """
+    Result of an offline draw.
+
+    Attributes:
+        - draw: saved Draw object.
+        - players: number of drawn players.
+        - queued: number of emails stored in the outbox.
+        - spooled: number of emails written to the maildir.
+        - timings: dict stage -> seconds ('draw', 'save', 'maildir').
+    """
+    def __init__(self):
+        self.draw = None
+        self.players = 0
+        self.queued = 0
+        self.spooled = 0
+        self.timings = {}
+
+    def __repr__(self):
+        return (f'<LargeDrawReport draw={self.draw.id if self.draw else None} players={self.players} '
+                f'queued={self.queued} spooled={self.spooled}>')
+
+
+def stream_player_ids(group, chunk_size=DRAW_CHUNK_SIZE):
+    """
+    Function streaming the ids of the players of a group with a server-side cursor where the database has one.
+
+    :param group: Group object
+    :param chunk_size: number of rows fetched at a time
+    :return: iterator of participant ids
+    """
+    return group.participants.order_by('id').values_list('id', flat=True).iterator(chunk_size=chunk_size)
+
+
+def chunks(items, size):
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+def chunk_assignments(pairs):
+    """
+    Function loading the players of a chunk of pairs (a few queries) and returning their assignments.
+
+    :param pairs: list of tuples (giver_id, receiver_id)
+    :return: list of tuples (giver_name, giver_email, receiver_name, receiver_wishlist) for render_assignments
+    """
+    ids = {pk for pair in pairs for pk in pair}
+    players = Participant.objects.only(*PARTICIPANT_FIELDS).in_bulk(ids)
+    return [(players[giver].name, players[giver].email, players[receiver].name, players[receiver].wishlist)
+            for giver, receiver in pairs]
+
+
+def run_large_draw(event, group, day, avoid_repeats=0, chunk_size=DRAW_CHUNK_SIZE,
+                   outbox=True, maildir=None, progress=None):
+    """
+    Function drawing a group of any size outside of a request, with the same derangement as the game views.
+    Only the ids of the players are kept for the whole draw. Names and emails are loaded,
+    and pairs and emails are saved, one chunk at a time, so apart from the ids
+    memory depends on the chunk size, not on the size of the group.
+
+    Pairs and outbox emails are saved in one transaction. Maildir messages cannot be rolled back,
+    so they are written after the transaction commits.
+
+    :param event: Event object
+    :param group: Group object
+    :param day: date of the gift exchange
+    :param avoid_repeats: number of previous draws of the group whose pairs should not repeat
+    :param chunk_size: number of pairs saved (and emails rendered) at a time
+    :param outbox: True to queue the emails in the outbox for deliver_outbox
+    :param maildir: path of a maildir to write the emails to, or None
+    :param progress: function called with (stage, done, total, seconds in the stage) after every chunk
+    :return: LargeDrawReport
+    :raises DrawInfeasible: when the exclusion rules of the group leave no valid assignment
+    """
+    report = LargeDrawReport()
+    progress = progress or (lambda stage, done, total, seconds: None)
+
+    start = time.perf_counter()
+    pairs = draw_pairs(stream_player_ids(group, chunk_size), exclusion_pairs(group),
+                       avoid=history_pairs(group, avoid_repeats))
+    report.players = len(pairs)
+    report.timings['draw'] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    saved = 0
+    with transaction.atomic():
+        report.draw = Draw.objects.create(event=event, group=group, date=day,
+                                          price_limit=group.price_limit, currency=group.currency)
+        for chunk in chunks(pairs, chunk_size):
+            GiftPair.objects.bulk_create([GiftPair(draw=report.draw, giver_id=giver, receiver_id=receiver)
+                                          for giver, receiver in chunk])
+            assignments = chunk_assignments(chunk)
+            invalidate_emails(giver_email for giver_name, giver_email, receiver_name, wishlist in assignments)
+            if outbox:
+                OutboxEmail.objects.bulk_create([
+                    OutboxEmail(draw=report.draw, recipient=recipient, subject=subject, body=body, html_body=html)
+                    for recipient, subject, body, html
+                    in render_assignments(assignments, group.price_limit, group.currency, day)
+                ])
+                report.queued += len(chunk)
+            saved += len(chunk)
+            progress('save', saved, report.players, time.perf_counter() - start)
+    report.timings['save'] = time.perf_counter() - start
+
+    if maildir:
+        start = time.perf_counter()
+        report.spooled = spool_to_maildir(maildir, pairs, group, day, chunk_size, progress)
+        report.timings['maildir'] = time.perf_counter() - start
+    return report
+
+
+def spool_to_maildir(path, pairs, group, day, chunk_size=DRAW_CHUNK_SIZE, progress=None):
+    """
+    Function writing the assignment emails of a draw to a maildir, one file per email.
+
+    :param path: path of the maildir, created when missing
+    :param pairs: list of tuples (giver_id, receiver_id)
+    :param group: Group object
+    :param day: date of the gift exchange
+    :param chunk_size: number of emails rendered at a time
+    :param progress: function called with (stage, done, total, seconds in the stage) after every chunk
+    :return: number of written emails
+    """
+    start = time.perf_counter()
+    for folder in ('tmp', 'new', 'cur'):  # Maildir(create=True) skips an existing empty directory
+        os.makedirs(os.path.join(path, folder), exist_ok=True)
+    box = mailbox.Maildir(path)
+    written = 0
+    for chunk in chunks(pairs, chunk_size):
+        for recipient, subject, body, html in render_assignments(
+                chunk_assignments(chunk), group.price_limit, group.currency, day):
+            box.add(build_message(subject, body, recipient, html).message())
+        written += len(chunk)
+        if progress:
+            progress('maildir', written, len(pairs), time.perf_counter() - start)
+    return written
@@ -0,0 +1,205 @@
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from decimal import Decimal
+from functools import lru_cache
+from django.conf import settings
+from django.core.mail import EmailMultiAlternatives, get_connection
+from django.template.loader import get_template
+
+
+MESSAGES_PER_CONNECTION = 100  # SMTP servers usually cap the number of messages per session
+EMAIL_WORKERS = 4  # SMTP connections open at the same time, settings.EMAIL_WORKERS overrides it
+ASSIGNMENT_SUBJECT = 'Secret Santa'
+ASSIGNMENT_TEMPLATES = ('assignment_email.txt', 'assignment_email.html')
+CURRENCY_DECIMALS = {'JPY': 0, 'KRW': 0, 'CLP': 0, 'BHD': 3}  # 2 for the other currencies of Group.CURRENCY_CHOICES
+
+
+class DeliveryReport:
+    """
+    Result of a batched delivery.
+
+    Attributes:
+        - sent: list of EmailMessage objects that were accepted by the backend.
+        - failed: list of tuples (EmailMessage, exception) that could not be delivered.
+    """
+    def __init__(self):
+        self.sent = []
+        self.failed = []
+
+    @property
+    def failed_recipients(self):
+        return [recipient for message, error in self.failed for recipient in message.to]
+
+    def __repr__(self):
+        return f'<DeliveryReport sent={len(self.sent)} failed={len(self.failed)}>'
+
+
+def build_message(subject, body, recipient, html=None):
+    """
+    Function building a single Secret Santa email, ready to be sent in a batch.
+
+    :param subject: subject of the email
+    :param body: plain text body
+    :param recipient: email address of the recipient
+    :param html: HTML version of the body, sent as an alternative part when given
+    :return: EmailMessage
+    """
+    message = EmailMultiAlternatives(subject, body, settings.EMAIL_HOST_USER, [recipient])
+    if html:
+        message.attach_alternative(html, 'text/html')
+    return message
+
+
+def format_price(amount, currency):
+    """
+    Function formatting a price limit with the number of decimal places of its currency.
+
+    :param amount: Decimal, int or string
+    :param currency: ISO code of the currency
+    :return: string, e.g. "1,250.00 PLN" or "5,000 JPY"
+    """
+    places = CURRENCY_DECIMALS.get(currency, 2)
+    return f'{Decimal(amount):,.{places}f} {currency}'
+
+
+@lru_cache(maxsize=None)
+def assignment_templates():
+    # compiled once per process - the template loaders do not cache them while DEBUG is on
+    return tuple(get_template(name) for name in ASSIGNMENT_TEMPLATES)
+
+
+def render_assignments(assignments, price_limit, currency, date):
+    """
+    Function rendering the emails of a whole draw.
+    Each template is rendered once for all the givers, and the result is split into messages,
+    which is much cheaper than rendering the templates once per giver.
+
+    :param assignments: iterable of tuples (giver name, giver email, receiver name, receiver wishlist or None)
+    :param price_limit: maximum price for gifts
+    :param currency: currency of the price limit
+    :param date: date of the gift exchange
+    :return: list of tuples (recipient, subject, text body, HTML body)
+    """
+    assignments = [{'giver_name': giver_name, 'giver_email': giver_email,
+                    'receiver_name': receiver_name, 'wishlist': wishlist}
+                   for giver_name, giver_email, receiver_name, wishlist in assignments]
+    if not assignments:
+        return []
+    # a random separator cannot appear in names or wishlists typed by users
+    separator = f'--{uuid.uuid4().hex}--'
+    context = {
+        'assignments': assignments,
+        'price_limit': format_price(price_limit, currency),
+        'date': str(date),
+        'separator': separator,
+    }
+    text, html = (template.render(context).split(separator)[1:] for template in assignment_templates())
+    return [(assignment['giver_email'], ASSIGNMENT_SUBJECT, body.strip(), html_body.strip())
+            for assignment, body, html_body in zip(assignments, text, html)]
+
+
+class RateLimiter:
+    """
+    Limit of messages per second shared by all the connections sending a batch.
+    Every message gets its own time slot, so the limit holds for any number of threads.
+    """
+    def __init__(self, rate):
+        self.interval = 1 / rate
+        self.next_slot = time.monotonic()
+        self.lock = threading.Lock()
+
+    def wait(self):
+        with self.lock:
+            now = time.monotonic()
+            slot = max(now, self.next_slot)
+            self.next_slot = slot + self.interval
+        if slot > now:
+            time.sleep(slot - now)
+
+
+def send_messages(messages, connection=None, messages_per_connection=MESSAGES_PER_CONNECTION, rate_limiter=None):
+    """
+    Function sending prepared messages over one reused connection.
+    The connection is reopened after `messages_per_connection` messages
+    and after a failure, so one broken message does not stop the rest of the batch.
+
+    :param messages: list of EmailMessage objects
+    :param connection: email backend to use, a new one is created when not given
+    :param messages_per_connection: number of messages sent before the connection is renewed
+    :param rate_limiter: RateLimiter waited on before every message, or None
+    :return: DeliveryReport
+    """
+    report = DeliveryReport()
+    if not messages:
+        return report
+
+    connection = connection or get_connection()
+    sent_on_connection = 0
+    try:
+        for message in messages:
+            if sent_on_connection >= messages_per_connection:
+                _close_quietly(connection)  # the messages were accepted, a failed QUIT does not matter
+                sent_on_connection = 0
+            if rate_limiter:
+                rate_limiter.wait()
+            try:
+                if sent_on_connection == 0:
+                    connection.open()
+                connection.send_messages([message])
+            except Exception as e:
+                report.failed.append((message, e))
+                _close_quietly(connection)
+                sent_on_connection = 0
+            else:
+                report.sent.append(message)
+                sent_on_connection += 1
+    finally:
+        _close_quietly(connection)
+    return report
+
+
+def send_parallel(messages, workers=None, messages_per_connection=MESSAGES_PER_CONNECTION, rate=None):
+    """
+    Function sending prepared messages over several SMTP connections at the same time.
+    SMTP is slow because of round trips, not bandwidth, so a big draw is split into chunks
+    sent by a bounded pool of threads, each chunk over its own connection (see send_messages).
+    Chunks are at most `messages_per_connection` long and small enough to keep every worker busy.
+
+    :param messages: list of EmailMessage objects
+    :param workers: maximum number of connections open at the same time (settings.EMAIL_WORKERS by default)
+    :param messages_per_connection: maximum number of messages sent over one connection
+    :param rate: maximum number of messages per second toward EMAIL_HOST, for all workers together
+                 (settings.EMAIL_RATE_LIMIT by default, 0 or None for no limit)
+    :return: DeliveryReport of all the messages
+    """
+    report = DeliveryReport()
+    if not messages:
+        return report
+    workers = workers or getattr(settings, 'EMAIL_WORKERS', EMAIL_WORKERS)
+    rate = rate if rate is not None else getattr(settings, 'EMAIL_RATE_LIMIT', None)
+    rate_limiter = RateLimiter(rate) if rate else None
+
+    chunk_size = max(1, min(messages_per_connection, -(-len(messages) // workers)))
+    chunks = [messages[start:start + chunk_size] for start in range(0, len(messages), chunk_size)]
+    if len(chunks) == 1:
+        return send_messages(chunks[0], messages_per_connection=messages_per_connection, rate_limiter=rate_limiter)
+
+    with ThreadPoolExecutor(max_workers=min(workers, len(chunks)), thread_name_prefix='smtp') as pool:
+        reports = pool.map(
+            lambda chunk: send_messages(chunk, messages_per_connection=messages_per_connection,
+                                        rate_limiter=rate_limiter),
+            chunks,
+        )
+        for chunk_report in reports:
+            report.sent += chunk_report.sent
+            report.failed += chunk_report.failed
+    return report
+
+
+def _close_quietly(connection):
+    try:
+        connection.close()
+    except Exception:
+        pass
@@ -0,0 +1,38 @@
+import time
+from django.core.management.base import BaseCommand
+from secret_santa.outbox import claim_batch, deliver_batch
+from secret_santa.quick_game import sweep_jobs
+
+
+class Command(BaseCommand):
+    """
+    Worker delivering emails stored in the outbox by the game views.
+    When the outbox is empty it also deletes the finished emails of expired quick games.
+
+    Usage:
+        python manage.py deliver_outbox [--batch-size 400] [--max-attempts 5] [--interval 5] [--once]
+    """
+    help = 'Delivers pending Secret Santa emails from the outbox.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=400,
+                            help='Emails claimed per batch, sent over EMAIL_WORKERS connections.')
+        parser.add_argument('--max-attempts', type=int, default=5,
+                            help='Attempts before an email is marked as failed.')
+        parser.add_argument('--interval', type=float, default=5,
+                            help='Seconds to sleep when the outbox is empty.')
+        parser.add_argument('--once', action='store_true',
+                            help='Exit when there is nothing left to deliver.')
+
+    def handle(self, *args, **options):
+        while True:
+            emails = claim_batch(options['batch_size'])
+            if emails:
+                sent, failed = deliver_batch(emails, options['max_attempts'])
+                retried = len(emails) - sent - failed
+                self.stdout.write(f'Delivered {sent}, failed {failed}, retrying {retried}.')
+                continue
+            sweep_jobs()
+            if options['once']:
+                break
+            time.sleep(options['interval'])
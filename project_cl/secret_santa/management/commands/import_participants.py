@@ -0,0 +1,59 @@
+import sys
+from decimal import Decimal
+from django.contrib.auth.models import User
+from django.core.exceptions import ValidationError
+from django.core.management.base import BaseCommand, CommandError
+from secret_santa.imports import IMPORT_BATCH_SIZE, import_participants
+
+
+class Command(BaseCommand):
+    """
+    Imports participants of a user from a CSV file (first_name, last_name, email, optional wishlist).
+
+    Usage:
+        python manage.py import_participants <username> <file.csv | -> [--group NAME --price-limit 50 --currency PLN]
+                                             [--batch-size 1000]
+    """
+    help = 'Imports Secret Santa participants from a CSV file.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('username', help='Creator of the participants.')
+        parser.add_argument('path', help='CSV file, or - to read standard input.')
+        parser.add_argument('--group', help='Create a group of all participants listed in the file.')
+        parser.add_argument('--price-limit', type=Decimal, help='Price limit of the created group.')
+        parser.add_argument('--currency', default='PLN', help='Currency of the created group.')
+        parser.add_argument('--batch-size', type=int, default=IMPORT_BATCH_SIZE,
+                            help='Participants inserted with one query.')
+
+    def handle(self, *args, **options):
+        try:
+            user = User.objects.get(username=options['username'])
+        except User.DoesNotExist:
+            raise CommandError(f'User "{options["username"]}" does not exist.')
+        if options['group'] and not options['price_limit']:
+            raise CommandError('--group needs --price-limit.')
+
+        try:
+            if options['path'] == '-':
+                report = self.run_import(user, sys.stdin, options)
+            else:
+                with open(options['path'], encoding='utf-8-sig', newline='') as lines:
+                    report = self.run_import(user, lines, options)
+        except (OSError, ValidationError) as e:
+            raise CommandError(e.messages[0] if isinstance(e, ValidationError) else str(e))
+
+        for line, message in report.errors:
+            self.stderr.write(f'Line {line}: {message}')
+        self.stdout.write(f'Added {report.created}, already existing {report.duplicates}, '
+                          f'skipped {len(report.errors)}.')
+        if report.group:
+            self.stdout.write(f'Created group "{report.group.name}" (id {report.group.id}).')
+
+    def run_import(self, user, lines, options):
+        return import_participants(
+            user, lines,
+            group_name=options['group'],
+            price_limit=options['price_limit'],
+            currency=options['currency'],
+            batch_size=options['batch_size'],
+        )
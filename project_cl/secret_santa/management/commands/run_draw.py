@@ -0,0 +1,88 @@
+from datetime import date
+from decimal import Decimal
+from pathlib import Path
+from django.core.exceptions import ValidationError
+from django.core.management.base import BaseCommand, CommandError
+from secret_santa.draw import DrawInfeasible
+from secret_santa.imports import import_participants
+from secret_santa.large_draw import DRAW_CHUNK_SIZE, run_large_draw
+from secret_santa.models import Event, Group
+
+
+class Command(BaseCommand):
+    """
+    Draws a group of any size outside of a request, e.g. a company of 20,000 players.
+    The group is given by id, or imported from a CSV file (first_name, last_name, email, optional wishlist)
+    as a new group of the event's organizer.
+
+    Usage:
+        python manage.py run_draw <event_id> <date> (--group ID | --file players.csv --price-limit 50 [--currency PLN])
+                                  [--avoid-repeats 1] [--chunk-size 2000] [--no-outbox] [--maildir PATH]
+    """
+    help = 'Draws a large Secret Santa group and saves its pairs and emails in chunks.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('event', type=int, help='Id of the event of the game.')
+        parser.add_argument('date', type=date.fromisoformat, help='Date of the gift exchange (YYYY-MM-DD).')
+        source = parser.add_mutually_exclusive_group(required=True)
+        source.add_argument('--group', type=int, help='Id of the group to draw.')
+        source.add_argument('--file', help='CSV file of players to import as a new group and draw.')
+        parser.add_argument('--price-limit', type=Decimal, help='Price limit of the group created from --file.')
+        parser.add_argument('--currency', default='PLN', help='Currency of the group created from --file.')
+        parser.add_argument('--avoid-repeats', type=int, default=1,
+                            help='Previous draws of the group whose pairs should not repeat.')
+        parser.add_argument('--chunk-size', type=int, default=DRAW_CHUNK_SIZE,
+                            help='Pairs saved and emails rendered at a time.')
+        parser.add_argument('--no-outbox', action='store_true',
+                            help='Do not queue the emails for deliver_outbox.')
+        parser.add_argument('--maildir', help='Also write the emails to this maildir.')
+
+    def handle(self, *args, **options):
+        try:
+            event = Event.objects.get(pk=options['event'])
+        except Event.DoesNotExist:
+            raise CommandError(f'Event {options["event"]} does not exist.')
+        group = self.get_group(event, options)
+
+        try:
+            report = run_large_draw(
+                event, group, options['date'],
+                avoid_repeats=options['avoid_repeats'],
+                chunk_size=options['chunk_size'],
+                outbox=not options['no_outbox'],
+                maildir=options['maildir'],
+                progress=self.progress,
+            )
+        except DrawInfeasible as e:
+            raise CommandError(f'The draw is not possible (players are given by id): {e}')
+
+        elapsed = sum(report.timings.values())
+        self.stdout.write(f'Drew game {report.draw.id}: {report.players} players in {elapsed:.1f} s '
+                          f'({report.players / max(elapsed, 1e-9):.0f} pairs/s).')
+        for stage, seconds in report.timings.items():
+            self.stdout.write(f'  {stage}: {seconds:.2f} s')
+        self.stdout.write(f'Queued {report.queued} emails in the outbox, wrote {report.spooled} to the maildir.')
+
+    def get_group(self, event, options):
+        if options['group']:
+            try:
+                return Group.objects.get(pk=options['group'], creator=event.organizer)
+            except Group.DoesNotExist:
+                raise CommandError(f'Group {options["group"]} of the event organizer does not exist.')
+
+        if not options['price_limit']:
+            raise CommandError('--file needs --price-limit.')
+        try:
+            with open(options['file'], encoding='utf-8-sig', newline='') as lines:
+                report = import_participants(event.organizer, lines, group_name=Path(options['file']).stem[:64],
+                                             price_limit=options['price_limit'], currency=options['currency'])
+        except (OSError, ValidationError) as e:
+            raise CommandError(e.messages[0] if isinstance(e, ValidationError) else str(e))
+        for line, message in report.errors:
+            self.stderr.write(f'Line {line}: {message}')
+        self.stdout.write(f'Imported {report.created} players ({report.duplicates} already existing) '
+                          f'as group "{report.group.name}" (id {report.group.id}).')
+        return report.group
+
+    def progress(self, stage, done, total, seconds):
+        self.stdout.write(f'{stage}: {done}/{total} ({done / max(seconds, 1e-9):.0f}/s)')
@@ -0,0 +1,37 @@
+import time
+from django.core.management.base import BaseCommand
+from secret_santa.scheduler import claim_due, run_batch
+
+
+class Command(BaseCommand):
+    """
+    Scheduler drawing the games set up to run at a later time.
+    Several schedulers can run at the same time - every draw is claimed by one of them.
+
+    Usage:
+        python manage.py run_scheduled_draws [--batch-size 50] [--interval 60] [--once]
+    From cron, e.g. every minute:
+        * * * * * python manage.py run_scheduled_draws --once
+    """
+    help = 'Draws the Secret Santa games whose scheduled time has come.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=50,
+                            help='Scheduled draws claimed per batch.')
+        parser.add_argument('--interval', type=float, default=60,
+                            help='Seconds to sleep when nothing is due.')
+        parser.add_argument('--once', action='store_true',
+                            help='Exit when nothing is left to draw.')
+
+    def handle(self, *args, **options):
+        while True:
+            start = time.perf_counter()
+            scheduled_draws = claim_due(options['batch_size'])
+            if scheduled_draws:
+                done, failed = run_batch(scheduled_draws)
+                elapsed = time.perf_counter() - start
+                self.stdout.write(f'Drew {done}, failed {failed} in {elapsed * 1000:.0f} ms.')
+                continue
+            if options['once']:
+                break
+            time.sleep(options['interval'])
@@ -0,0 +1,50 @@
+# Generated by Django 3.2.19 on 2026-10-18 15:02
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('secret_santa', '0016_outboxemail'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Draw',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('price_limit', models.DecimalField(decimal_places=2, max_digits=10)),
+                ('currency', models.CharField(choices=[('USD', 'U.S. dollar (USD)'), ('EUR', 'Euro (EUR)'), ('JPY', 'Japanese yen (JPY)'), ('GBP', 'Sterling (GBP)'), ('CNY', 'Renminbi (CNY)'), ('AUD', 'Australian dollar (AUD)'), ('CAD', 'Canadian dollar (CAD)'), ('CHF', 'Swiss franc (CHF)'), ('HKD', 'Hong Kong dollar (HKD)'), ('SGD', 'Singapore dollar (SGD)'), ('SEK', 'Swedish krona (SEK)'), ('KRW', 'South Korean won (KRW)'), ('NOK', 'Norwegian krone (NOK)'), ('NZD', 'New Zealand dollar (NZD)'), ('INR', 'Indian rupee (INR)'), ('MXN', 'Mexican peso (MXN)'), ('TWD', 'New Taiwan dollar (TWD)'), ('ZAR', 'South African rand (ZAR)'), ('BRL', 'Brazilian real (BRL)'), ('DKK', 'Danish krone (DKK)'), ('PLN', 'Polish złoty (PLN)'), ('THB', 'Thai baht (THB)'), ('ILS', 'Israeli new shekel (ILS)'), ('IDR', 'Indonesian rupiah (IDR)'), ('CZK', 'Czech koruna (CZK)'), ('AED', 'UAE dirham (AED)'), ('TRY', 'Turkish lira (TRY)'), ('HUF', 'Hungarian forint (HUF)'), ('CLP', 'Chilean peso (CLP)'), ('SAR', 'Saudi riyal (SAR)'), ('PHP', 'Philippine peso (PHP)'), ('MYR', 'Malaysian ringgit (MYR)'), ('COP', 'Colombian peso (COP)'), ('RUB', 'Russian ruble (RUB)'), ('RON', 'Romanian leu (RON)'), ('PEN', 'Peruvian sol (PEN)'), ('BHD', 'Bahraini dinar (BHD)'), ('BGN', 'Bulgarian lev (BGN)'), ('ARS', 'Argentine peso (ARS)')], default='PLN', max_length=3)),
+                ('event', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='secret_santa.event')),
+                ('group', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='secret_santa.group')),
+            ],
+        ),
+        migrations.AddField(
+            model_name='giftpair',
+            name='draw',
+            field=models.ForeignKey(null=True, on_delete=django.db.models.deletion.CASCADE, related_name='pairs', to='secret_santa.draw'),
+        ),
+        migrations.AlterField(
+            model_name='giftpair',
+            name='date',
+            field=models.DateField(null=True),
+        ),
+        migrations.AlterField(
+            model_name='giftpair',
+            name='event',
+            field=models.ForeignKey(null=True, on_delete=django.db.models.deletion.CASCADE, to='secret_santa.event'),
+        ),
+        migrations.AlterField(
+            model_name='giftpair',
+            name='group',
+            field=models.ForeignKey(null=True, on_delete=django.db.models.deletion.CASCADE, to='secret_santa.group'),
+        ),
+        migrations.AddField(
+            model_name='outboxemail',
+            name='draw',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='emails', to='secret_santa.draw'),
+        ),
+    ]
@@ -0,0 +1,55 @@
+# Generated by Django 3.2.19 on 2026-10-18 15:02
+
+from django.db import migrations
+
+
+def create_draws(apps, schema_editor):
+    """
+    Every game_number grouping of gift pairs becomes one Draw row.
+    Old pairs all share game_number 0, so event, group and date are part of the key too.
+    """
+    Draw = apps.get_model('secret_santa', 'Draw')
+    GiftPair = apps.get_model('secret_santa', 'GiftPair')
+    Group = apps.get_model('secret_santa', 'Group')
+    db_alias = schema_editor.connection.alias
+
+    groupings = (
+        GiftPair.objects.using(db_alias).order_by('game_number', 'event_id', 'group_id', 'date')
+        .values_list('game_number', 'event_id', 'group_id', 'date')
+        .distinct()
+    )
+    groups = {group.id: group for group in Group.objects.using(db_alias)}
+    for game_number, event_id, group_id, date in groupings:
+        group = groups[group_id]
+        draw = Draw.objects.using(db_alias).create(
+            event_id=event_id,
+            group_id=group_id,
+            date=date,
+            price_limit=group.price_limit,
+            currency=group.currency,
+        )
+        GiftPair.objects.using(db_alias).filter(
+            game_number=game_number, event_id=event_id, group_id=group_id, date=date,
+        ).update(draw=draw)
+
+
+def restore_game_numbers(apps, schema_editor):
+    Draw = apps.get_model('secret_santa', 'Draw')
+    GiftPair = apps.get_model('secret_santa', 'GiftPair')
+    db_alias = schema_editor.connection.alias
+
+    for draw in Draw.objects.using(db_alias):
+        GiftPair.objects.using(db_alias).filter(draw=draw).update(
+            game_number=draw.id, event_id=draw.event_id, group_id=draw.group_id, date=draw.date,
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('secret_santa', '0017_draw'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_draws, restore_game_numbers),
+    ]
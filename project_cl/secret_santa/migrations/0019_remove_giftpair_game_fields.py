@@ -0,0 +1,35 @@
+# Generated by Django 3.2.19 on 2026-10-18 15:02
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('secret_santa', '0018_giftpair_draw_data'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='giftpair',
+            name='draw',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='pairs', to='secret_santa.draw'),
+        ),
+        migrations.RemoveField(
+            model_name='giftpair',
+            name='date',
+        ),
+        migrations.RemoveField(
+            model_name='giftpair',
+            name='event',
+        ),
+        migrations.RemoveField(
+            model_name='giftpair',
+            name='game_number',
+        ),
+        migrations.RemoveField(
+            model_name='giftpair',
+            name='group',
+        ),
+    ]
@@ -0,0 +1,55 @@
+# Generated by Django 3.2.19 on 2026-10-18 14:21
+
+from django.db import migrations, models
+import django.db.models.deletion
+import django.db.models.functions.text
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('secret_santa', '0019_remove_giftpair_game_fields'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='draw',
+            name='event',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, to='secret_santa.event'),
+        ),
+        migrations.AlterField(
+            model_name='draw',
+            name='group',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, to='secret_santa.group'),
+        ),
+        migrations.AlterField(
+            model_name='giftpair',
+            name='draw',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='pairs', to='secret_santa.draw'),
+        ),
+        migrations.AlterField(
+            model_name='giftpair',
+            name='giver',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='gifts_given', to='secret_santa.participant'),
+        ),
+        migrations.AddIndex(
+            model_name='draw',
+            index=models.Index(fields=['event', 'date', 'id'], name='draw_event_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='draw',
+            index=models.Index(fields=['group', 'date'], name='draw_group_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='giftpair',
+            index=models.Index(fields=['giver', 'draw'], name='giftpair_giver_draw_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='giftpair',
+            index=models.Index(fields=['draw', 'id'], name='giftpair_draw_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='participant',
+            index=models.Index(django.db.models.functions.text.Lower('email'), name='participant_email_lower_idx'),
+        ),
+    ]
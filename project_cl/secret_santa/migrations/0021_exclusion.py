@@ -0,0 +1,24 @@
+# Generated by Django 3.2.19 on 2026-10-18 14:27
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('secret_santa', '0020_lookup_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Exclusion',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('mutual', models.BooleanField(default=True)),
+                ('giver', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='secret_santa.participant')),
+                ('group', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='exclusions', to='secret_santa.group')),
+                ('receiver', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='secret_santa.participant')),
+            ],
+        ),
+    ]
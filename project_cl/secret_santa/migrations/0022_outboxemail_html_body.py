@@ -0,0 +1,18 @@
+# Generated by Django 3.2.19 on 2026-10-18 15:18
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('secret_santa', '0021_exclusion'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='outboxemail',
+            name='html_body',
+            field=models.TextField(blank=True),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 3.2.19 on 2026-10-18 15:24
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('secret_santa', '0022_outboxemail_html_body'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='event',
+            name='groups',
+            field=models.ManyToManyField(blank=True, related_name='events', to='secret_santa.Group'),
+        ),
+    ]
@@ -0,0 +1,36 @@
+# Generated by Django 3.2.19 on 2026-10-18 15:30
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('secret_santa', '0023_event_groups'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ScheduledDraw',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('avoid_repeats', models.PositiveSmallIntegerField(default=1)),
+                ('run_at', models.DateTimeField()),
+                ('status', models.CharField(choices=[('pending', 'Pending'), ('running', 'Running'), ('done', 'Done'), ('failed', 'Failed')], default='pending', max_length=8)),
+                ('error', models.TextField(blank=True)),
+                ('claimed_at', models.DateTimeField(blank=True, null=True)),
+                ('finished_at', models.DateTimeField(blank=True, null=True)),
+                ('duration_ms', models.PositiveIntegerField(blank=True, null=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('draw', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='secret_santa.draw')),
+                ('event', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='scheduled_draws', to='secret_santa.event')),
+                ('group', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='scheduled_draws', to='secret_santa.group')),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='scheduleddraw',
+            index=models.Index(fields=['status', 'run_at'], name='scheduled_status_run_idx'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 3.2.19 on 2026-10-18 16:06
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('secret_santa', '0024_scheduleddraw'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='outboxemail',
+            name='job',
+            field=models.CharField(blank=True, db_index=True, max_length=32),
+        ),
+    ]
@@ -1,5 +1,7 @@
 from django.db import models
+from django.db.models.functions import Lower
 from django.contrib.auth.models import User
+from django.utils import timezone
 
 
 class Event(models.Model):
@@ -9,11 +11,21 @@ class Event(models.Model):
     name = models.CharField(max_length=64)
     description = models.TextField()
     organizer = models.ForeignKey(User, on_delete=models.CASCADE)
+    groups = models.ManyToManyField('Group', blank=True, related_name='events')  # drawn together by EventDrawView
 
     def __str__(self):
         return self.name
 
 
+class ParticipantQuerySet(models.QuerySet):
+    def with_email(self, email):
+        """
+        Case-insensitive email match.
+        Written as LOWER(email) = ... so it can use participant_email_lower_idx.
+        """
+        return self.alias(email_lower=Lower('email')).filter(email_lower=email.lower())
+
+
 class Participant(models.Model):
     """
     Model created for players that can be then assigned to a group.
@@ -24,6 +36,13 @@ class Participant(models.Model):
     wishlist = models.TextField(blank=True, null=True)
     creator = models.ForeignKey(User, on_delete=models.CASCADE, default=None)
 
+    objects = ParticipantQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            models.Index(Lower('email'), name='participant_email_lower_idx'),
+        ]
+
     @property
     def name(self):
         return "{} {}".format(self.first_name, self.last_name)
@@ -93,16 +112,146 @@ class Group(models.Model):
         return self.name
 
 
+class Exclusion(models.Model):
+    """
+    Model containing a rule of a group: the giver never draws the receiver.
+    Mutual rules work both ways (e.g. couples).
+    """
+    group = models.ForeignKey(Group, on_delete=models.CASCADE, related_name='exclusions')
+    giver = models.ForeignKey(Participant, on_delete=models.CASCADE, related_name='+')
+    receiver = models.ForeignKey(Participant, on_delete=models.CASCADE, related_name='+')
+    mutual = models.BooleanField(default=True)
+
+    def __str__(self):
+        arrow = '<->' if self.mutual else '->'
+        return f'{self.giver} {arrow} {self.receiver} (In group: {self.group})'
+
+
+class Draw(models.Model):
+    """
+    Model containing a single shuffle of a group for an event.
+    Its id is the game number, and the price limit is copied from the group
+    so later edits of the group do not change past games.
+    """
+    # event and group are the leading columns of the composite indexes below
+    event = models.ForeignKey(Event, on_delete=models.CASCADE, db_index=False)
+    group = models.ForeignKey(Group, on_delete=models.CASCADE, db_index=False)
+    date = models.DateField()
+    price_limit = models.DecimalField(max_digits=10, decimal_places=2)
+    currency = models.CharField(
+        max_length=3,
+        choices=Group.CURRENCY_CHOICES,
+        default='PLN',
+    )
+
+    class Meta:
+        indexes = [
+            # dashboard: games of an organizer's events ordered by (date, id)
+            models.Index(fields=['event', 'date', 'id'], name='draw_event_date_idx'),
+            # previous games of a group
+            models.Index(fields=['group', 'date'], name='draw_group_date_idx'),
+        ]
+
+    def __str__(self):
+        return f'Game {self.id}: {self.group} for event: {self.event} ({self.date})'
+
+
 class GiftPair(models.Model):
     """
     Model containing shuffles results.
     """
-    giver = models.ForeignKey(Participant, on_delete=models.CASCADE, related_name='gifts_given')
+    # giver and draw are the leading columns of the composite indexes below
+    giver = models.ForeignKey(Participant, on_delete=models.CASCADE, related_name='gifts_given', db_index=False)
     receiver = models.ForeignKey(Participant, on_delete=models.CASCADE, related_name='gifts_received')
-    event = models.ForeignKey(Event, on_delete=models.CASCADE)
-    group = models.ForeignKey(Group, on_delete=models.CASCADE)
+    draw = models.ForeignKey(Draw, on_delete=models.CASCADE, related_name='pairs', db_index=False)
+
+    class Meta:
+        indexes = [
+            # lookup and My games: gifts of a participant joined with their draws
+            models.Index(fields=['giver', 'draw'], name='giftpair_giver_draw_idx'),
+            # dashboard: pairs of a page of draws ordered by (draw, id)
+            models.Index(fields=['draw', 'id'], name='giftpair_draw_id_idx'),
+        ]
+
+    def __str__(self):
+        return f'Giver: {self.giver} -> Receiver: {self.receiver} (In game: {self.draw_id})'
+
+
+class OutboxEmail(models.Model):
+    """
+    Model containing rendered emails waiting to be delivered by the outbox worker.
+    Rows are written in the same transaction as the shuffle results.
+    Emails of quick games have no draw, only the id of their job.
+    """
+    PENDING = 'pending'
+    SENDING = 'sending'
+    SENT = 'sent'
+    FAILED = 'failed'
+
+    STATUS_CHOICES = [
+        (PENDING, 'Pending'),
+        (SENDING, 'Sending'),
+        (SENT, 'Sent'),
+        (FAILED, 'Failed'),
+    ]
+
+    draw = models.ForeignKey(Draw, on_delete=models.SET_NULL, blank=True, null=True, related_name='emails')
+    job = models.CharField(max_length=32, blank=True, db_index=True)  # quick game id, see quick_game.py
+    recipient = models.EmailField()
+    subject = models.CharField(max_length=255)
+    body = models.TextField()
+    html_body = models.TextField(blank=True)
+    status = models.CharField(max_length=8, choices=STATUS_CHOICES, default=PENDING)
+    attempts = models.PositiveIntegerField(default=0)
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    claimed_at = models.DateTimeField(blank=True, null=True)
+    sent_at = models.DateTimeField(blank=True, null=True)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'next_attempt_at'], name='outbox_status_next_idx'),
+        ]
+
+    def __str__(self):
+        return f'{self.subject} -> {self.recipient} ({self.status})'
+
+
+class ScheduledDraw(models.Model):
+    """
+    Model containing games set up to be drawn later by the run_scheduled_draws command.
+    The finished run keeps its draw (or the reason it failed) and how long it took.
+    """
+    PENDING = 'pending'
+    RUNNING = 'running'
+    DONE = 'done'
+    FAILED = 'failed'
+
+    STATUS_CHOICES = [
+        (PENDING, 'Pending'),
+        (RUNNING, 'Running'),
+        (DONE, 'Done'),
+        (FAILED, 'Failed'),
+    ]
+
+    event = models.ForeignKey(Event, on_delete=models.CASCADE, related_name='scheduled_draws')
+    group = models.ForeignKey(Group, on_delete=models.CASCADE, related_name='scheduled_draws')
     date = models.DateField()
-    game_number = models.PositiveIntegerField(default=0)
+    avoid_repeats = models.PositiveSmallIntegerField(default=1)
+    run_at = models.DateTimeField()
+    status = models.CharField(max_length=8, choices=STATUS_CHOICES, default=PENDING)
+    draw = models.ForeignKey(Draw, on_delete=models.SET_NULL, blank=True, null=True, related_name='+')
+    error = models.TextField(blank=True)
+    claimed_at = models.DateTimeField(blank=True, null=True)
+    finished_at = models.DateTimeField(blank=True, null=True)
+    duration_ms = models.PositiveIntegerField(blank=True, null=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'run_at'], name='scheduled_status_run_idx'),
+        ]
 
     def __str__(self):
-        return f'Giver: {self.giver} -> Receiver: {self.receiver} (In group: {self.group} for event: {self.event})'
+        return f'{self.group} in {self.event} at {self.run_at} ({self.status})'
@@ -0,0 +1,125 @@
+from datetime import timedelta
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Case, EmailField, F, Q, Value, When
+from django.utils import timezone
+from .mail import EMAIL_WORKERS, MESSAGES_PER_CONNECTION, build_message, send_parallel
+from .models import OutboxEmail
+
+
+BACKOFF_BASE = 30  # seconds, doubled after every failed attempt
+BACKOFF_MAX = 60 * 60
+CLAIM_TIMEOUT = 10 * 60  # claims older than this belong to a crashed worker
+
+
+def claim_batch(batch_size):
+    """
+    Function claiming a batch of due outbox emails for delivery.
+    Rows are locked while they are flagged, so several workers never claim the same email.
+
+    :param batch_size: maximum number of emails to claim
+    :return: list of claimed OutboxEmail objects
+    """
+    now = timezone.now()
+    stale = now - timedelta(seconds=CLAIM_TIMEOUT)
+    with transaction.atomic():
+        ids = list(
+            OutboxEmail.objects.select_for_update(skip_locked=True)
+            .filter(
+                Q(status=OutboxEmail.PENDING, next_attempt_at__lte=now)
+                | Q(status=OutboxEmail.SENDING, claimed_at__lt=stale)
+            )
+            .order_by('next_attempt_at', 'id')
+            .values_list('id', flat=True)[:batch_size]
+        )
+        OutboxEmail.objects.filter(id__in=ids).update(status=OutboxEmail.SENDING, claimed_at=now)
+    return list(OutboxEmail.objects.filter(id__in=ids).order_by('id'))
+
+
+def backoff_delay(attempts):
+    """
+    Function returning the delay before the next delivery attempt.
+
+    :param attempts: number of failed attempts so far
+    :return: timedelta
+    """
+    return timedelta(seconds=min(BACKOFF_BASE * 2 ** (attempts - 1), BACKOFF_MAX))
+
+
+def round_size(workers=None, rate=None):
+    """
+    Function returning how many claimed emails are sent before their claims are refreshed.
+    A round is one chunk per connection, and with a rate limit it is short enough to finish
+    in half of CLAIM_TIMEOUT, so other workers never take over emails that are still being sent.
+
+    :param workers: number of parallel connections (settings.EMAIL_WORKERS by default)
+    :param rate: messages per second (settings.EMAIL_RATE_LIMIT by default)
+    :return: number of emails
+    """
+    workers = workers or getattr(settings, 'EMAIL_WORKERS', EMAIL_WORKERS)
+    rate = rate if rate is not None else getattr(settings, 'EMAIL_RATE_LIMIT', None)
+    size = workers * MESSAGES_PER_CONNECTION
+    if rate:
+        size = min(size, int(rate * CLAIM_TIMEOUT / 2))
+    return max(1, size)
+
+
+def deliver_batch(emails, max_attempts):
+    """
+    Function delivering claimed outbox emails over a few parallel connections.
+    Failed emails are scheduled again with exponential backoff
+    until they run out of attempts.
+
+    The batch is sent in rounds (see round_size). The results of a round are saved
+    right away and the claims of the emails still waiting are refreshed, so a long batch
+    (slow server, low EMAIL_RATE_LIMIT) never looks like the claim of a crashed worker.
+
+    :param emails: list of claimed OutboxEmail objects
+    :param max_attempts: number of attempts before an email is marked as failed
+    :return: tuple (sent, failed) with the number of emails in each state
+    """
+    sent = failed = 0
+    size = round_size()
+    for start in range(0, len(emails), size):
+        batch = emails[start:start + size]
+        round_sent, round_failed = _deliver_round(batch, max_attempts)
+        sent += round_sent
+        failed += round_failed
+        waiting = [email.id for email in emails[start + size:]]
+        if waiting:
+            OutboxEmail.objects.filter(id__in=waiting, status=OutboxEmail.SENDING).update(claimed_at=timezone.now())
+    return sent, failed
+
+
+def _deliver_round(emails, max_attempts):
+    messages = [build_message(email.subject, email.body, email.recipient, email.html_body) for email in emails]
+    report = send_parallel(messages)
+    errors = {id(message): error for message, error in report.failed}
+
+    sent = failed = 0
+    for email, message in zip(emails, messages):
+        email.attempts += 1
+        error = errors.get(id(message))
+        if error is None:
+            email.status = OutboxEmail.SENT
+            email.sent_at = timezone.now()
+            sent += 1
+        else:
+            email.last_error = str(error)
+            if email.attempts >= max_attempts:
+                email.status = OutboxEmail.FAILED
+                failed += 1
+            else:
+                email.status = OutboxEmail.PENDING
+                email.next_attempt_at = timezone.now() + backoff_delay(email.attempts)
+        email.claimed_at = None
+    OutboxEmail.objects.bulk_update(
+        emails, ['status', 'attempts', 'next_attempt_at', 'claimed_at', 'sent_at', 'last_error'])
+    # quick games are not saved, so their delivered emails keep no pairs (see quick_game.py)
+    finished = [email.id for email in emails if email.job and email.status != OutboxEmail.PENDING]
+    if finished:
+        OutboxEmail.objects.filter(id__in=finished).update(
+            subject='', body='', html_body='',
+            recipient=Case(When(status=OutboxEmail.SENT, then=Value('')), default=F('recipient'),
+                           output_field=EmailField()))
+    return sent, failed
@@ -0,0 +1,84 @@
+from datetime import date
+from django.db.models import Q
+
+
+PAGE_SIZE = 20
+
+
+class KeysetPage:
+    """
+    One page of results returned by keyset_page.
+
+    Attributes:
+        - items: list of objects on the page.
+        - next_cursor: cursor of the next page or None when this is the last one.
+    """
+    def __init__(self, items, next_cursor):
+        self.items = items
+        self.next_cursor = next_cursor
+
+    def __iter__(self):
+        return iter(self.items)
+
+    def __len__(self):
+        return len(self.items)
+
+    def __bool__(self):
+        return bool(self.items)
+
+
+def encode_cursor(day, pk):
+    return f'{day.isoformat()}_{pk}'
+
+
+def decode_cursor(cursor):
+    """
+    Function reading a cursor created by encode_cursor.
+    Invalid cursors are treated like no cursor (first page).
+
+    :param cursor: string from the request or None
+    :return: tuple (date, pk) or None
+    """
+    try:
+        day, pk = cursor.split('_')
+        return date.fromisoformat(day), int(pk)
+    except (AttributeError, ValueError):
+        return None
+
+
+def keyset_page(queryset, cursor=None, date_field='date', descending=False, page_size=PAGE_SIZE):
+    """
+    Function returning one page of a queryset ordered by (date, id).
+    Instead of OFFSET, the page starts right after the last row of the previous page,
+    so the cost of a page does not grow with the number of rows before it.
+
+    :param queryset: queryset to paginate
+    :param cursor: cursor of the requested page (see encode_cursor) or None for the first page
+    :param date_field: lookup path of the date used for ordering, e.g. 'draw__date'
+    :param descending: newest rows first (used by the archives)
+    :param page_size: number of rows on a page
+    :return: KeysetPage
+    """
+    if descending:
+        queryset = queryset.order_by(f'-{date_field}', '-id')
+    else:
+        queryset = queryset.order_by(date_field, 'id')
+
+    position = decode_cursor(cursor)
+    if position:
+        day, pk = position
+        direction = 'lt' if descending else 'gt'
+        queryset = queryset.filter(
+            Q(**{f'{date_field}__{direction}': day}) | Q(**{date_field: day, f'id__{direction}': pk})
+        )
+
+    items = list(queryset[:page_size + 1])
+    next_cursor = None
+    if len(items) > page_size:
+        items = items[:page_size]
+        last = items[-1]
+        day = last
+        for name in date_field.split('__'):
+            day = getattr(day, name)
+        next_cursor = encode_cursor(day, last.id)
+    return KeysetPage(items, next_cursor)
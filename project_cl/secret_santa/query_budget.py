@@ -0,0 +1,238 @@
+import asyncio
+import logging
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from django.conf import settings
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+
+
+logger = logging.getLogger(__name__)
+
+# Maximum number of queries of one request, per URL name from project_cl/urls.py.
+# Budgets include the session and user queries of logged in requests and must not
+# depend on the amount of data (number of groups, players or games).
+# New games, quick games and imports insert rows with bulk_create in batches (imports: IMPORT_BATCH_SIZE,
+# SQLite: ~999 parameters), so big groups and files need one extra query per batch.
+# Backends that cannot return ids from bulk inserts (SQLite on Django 3.2) save the new rows of
+# bulk_create_with_ids one by one. Those queries are counted apart (QueryStats.per_row) and left out
+# of the budgets, so a budget is the same on every backend: one bulk INSERT.
+# Exports stream their rows after the view returns, so their single export query is not counted.
+QUERY_BUDGETS = {
+    'index': 2,
+    'quick_game': 2,
+    'quick-game-status': 4,
+    'login': 9,
+    'logout': 4,
+    'base': 8,
+    'games-archive': 4,
+    'export-all': 2,
+    'export-event': 3,
+    'export-game': 3,
+    'add-event': 7,
+    'edit-event': 10,
+    'delete-event': 5,
+    'add-group': 9,
+    'edit-group': 9,
+    'delete-group': 13,
+    'add-exclusion': 8,
+    'add-player': 6,
+    'edit-player': 8,
+    'delete-player': 7,
+    'import-players': 8,
+    'new-game': 13,
+    'draw-event': 15,
+    'register': 2,
+    'change-password': 12,
+    'delete_account': 28,
+    'my-gift-pairs': 4,
+    'my-gift-pairs-archive': 4,
+    'email-lookup': 2,
+    'email-lookup-archive': 4,
+    'success': 2,
+    'cache-stats': 2,
+    'api-participants': 10,
+    'api-groups': 7,
+    'api-group-members': 9,
+    'api-draws': 13,
+    'api-draw': 4,
+}
+
+
+class QueryStats:
+    """
+    Queries executed during one request, collected by QueryBudgetMiddleware.
+
+    Attributes:
+        - queries: list of tuples (sql, params, seconds).
+        - count: number of queries.
+        - per_row: number of queries saving rows one by one (see row_by_row), not checked against the budget.
+        - budgeted: number of queries checked against the budget.
+        - duplicates: number of queries repeated with the same SQL and parameters.
+        - similar: number of queries repeated with the same SQL and other parameters (N+1).
+        - seconds: total time spent in the database.
+    """
+    def __init__(self):
+        self.queries = []
+        self.per_row = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.queries.append((sql, params, time.perf_counter() - start))
+            if _row_by_row.get():
+                self.per_row += 1
+
+    @property
+    def count(self):
+        return len(self.queries)
+
+    @property
+    def budgeted(self):
+        return self.count - self.per_row
+
+    @property
+    def duplicates(self):
+        return self.count - len({(sql, repr(params)) for sql, params, seconds in self.queries})
+
+    @property
+    def similar(self):
+        return self.count - len({sql for sql, params, seconds in self.queries}) - self.duplicates
+
+    @property
+    def seconds(self):
+        return sum(seconds for sql, params, seconds in self.queries)
+
+    def __repr__(self):
+        return f'<QueryStats count={self.count} duplicates={self.duplicates} similar={self.similar}>'
+
+
+# Stats of the request being handled. Context variables follow the request into the threads
+# of sync_to_async, so queries of async views are counted too.
+_request_stats = ContextVar('query_stats', default=None)
+_row_by_row = ContextVar('row_by_row', default=False)
+
+
+@contextmanager
+def row_by_row():
+    """
+    Context manager marking the queries of rows saved one by one where the database cannot do it
+    with one query (see bulk.py). Their number grows with the rows, so they are not checked against budgets.
+    """
+    token = _row_by_row.set(True)
+    try:
+        yield
+    finally:
+        _row_by_row.reset(token)
+
+
+def record_query(execute, sql, params, many, context):
+    stats = _request_stats.get()
+    if stats is None:
+        return execute(sql, params, many, context)
+    return stats(execute, sql, params, many, context)
+
+
+@receiver(connection_created)
+def install_query_recorder(sender, connection, **kwargs):
+    """
+    Adds record_query to the execute wrappers of every database connection, in every thread.
+    It goes first in the list, so wrappers added and removed with connection.execute_wrapper() are not affected.
+    """
+    if record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.insert(0, record_query)
+
+
+def budget_for(request):
+    """
+    Function returning the query budget of the view that handled a request.
+
+    :param request: HttpRequest object
+    :return: tuple (url name or None, budget or None)
+    """
+    match = getattr(request, 'resolver_match', None)
+    url_name = match.url_name if match else None
+    return url_name, QUERY_BUDGETS.get(url_name)
+
+
+class QueryBudgetMiddleware:
+    """
+    Middleware counting queries, duplicate queries and database time of every request.
+    Stats are stored as request.query_stats. Requests over the budget of their URL
+    are logged, and in debug mode every response gets X-Query-* headers.
+    Works with both WSGI and ASGI (async views).
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if asyncio.iscoroutinefunction(get_response):
+            # lets Django see the middleware as a coroutine function, like MiddlewareMixin does
+            self._is_coroutine = asyncio.coroutines._is_coroutine
+
+    def __call__(self, request):
+        if asyncio.iscoroutinefunction(self.get_response):
+            return self.__acall__(request)
+        # connections opened before this module was imported have no recorder yet
+        for connection in connections.all():
+            install_query_recorder(None, connection)
+
+        stats = QueryStats()
+        request.query_stats = stats
+        token = _request_stats.set(stats)
+        try:
+            response = self.get_response(request)
+        finally:
+            _request_stats.reset(token)
+        return self.finish(request, response)
+
+    async def __acall__(self, request):
+        stats = QueryStats()
+        request.query_stats = stats
+        token = _request_stats.set(stats)
+        try:
+            response = await self.get_response(request)
+        finally:
+            _request_stats.reset(token)
+        return self.finish(request, response)
+
+    @staticmethod
+    def finish(request, response):
+        stats = request.query_stats
+        url_name, budget = budget_for(request)
+        if budget is not None and stats.budgeted > budget:
+            logger.warning('%s: %d queries, budget is %d (%d duplicate, %d similar)',
+                           url_name, stats.budgeted, budget, stats.duplicates, stats.similar)
+        if settings.DEBUG:
+            response['X-Query-Count'] = stats.count
+            response['X-Query-Duplicates'] = stats.duplicates
+            response['X-Query-Similar'] = stats.similar
+            response['X-Query-Time-Ms'] = f'{stats.seconds * 1000:.1f}'
+            if budget is not None:
+                response['X-Query-Budget'] = budget
+        return response
+
+
+def assert_query_budget(response):
+    """
+    Test helper failing when the request of a test client response went over its query budget.
+
+    :param response: response returned by django.test.Client
+    :raises AssertionError: when the view has no budget or used more queries than it
+    """
+    request = response.wsgi_request
+    stats = request.query_stats
+    url_name, budget = budget_for(request)
+    if budget is None:
+        raise AssertionError(f'{url_name or request.path} has no query budget in QUERY_BUDGETS.')
+    if stats.budgeted > budget:
+        queries = '\n'.join(f'{i}. {sql}' for i, (sql, params, seconds) in enumerate(stats.queries, start=1))
+        raise AssertionError(
+            f'{url_name} executed {stats.budgeted} queries, budget is {budget} '
+            f'({stats.duplicates} duplicate, {stats.similar} similar):\n{queries}'
+        )
@@ -0,0 +1,146 @@
+import csv
+import random
+import uuid
+from datetime import timedelta
+from django.core.exceptions import ValidationError
+from django.core.validators import validate_email
+from django.db.models import Count
+from django.utils import timezone
+from .mail import render_assignments
+from .models import OutboxEmail
+
+
+QUICK_GAME_MIN_PLAYERS = 3
+QUICK_GAME_MAX_PLAYERS = 10000
+QUICK_GAME_MAX_UPLOAD_BYTES = 1024 * 1024
+JOB_TIMEOUT = 60 * 60  # seconds the status of a job can be polled
+
+# Quick games are never saved as games. Their emails wait in the outbox, tagged with the id of the job,
+# so any web process can show the progress and deliver_outbox sends them even after a restart.
+# Delivered emails are blanked right away (failed ones keep only their address for the status page),
+# and deliver_outbox deletes the finished emails of a job after JOB_TIMEOUT (sweep_jobs).
+
+
+def read_players(lines):
+    """
+    Function reading players pasted or uploaded as "name, email" lines.
+    Empty lines and a "name, email" header are skipped.
+
+    :param lines: iterable of text lines
+    :return: list of tuples (name, email)
+    :raises ValidationError: when a line is invalid or there are more than QUICK_GAME_MAX_PLAYERS players
+    """
+    players = []
+    for line, row in enumerate(csv.reader(lines), start=1):
+        row = [value.strip() for value in row]
+        if not any(row):
+            continue
+        if line == 1 and [value.lower() for value in row] == ['name', 'email']:
+            continue
+        if len(row) != 2 or not row[0]:
+            raise ValidationError(f'Line {line}: expected "name, email".')
+        try:
+            validate_email(row[1])
+        except ValidationError:
+            raise ValidationError(f'Line {line}: "{row[1]}" is not a valid email.')
+        players.append((row[0], row[1]))
+        if len(players) > QUICK_GAME_MAX_PLAYERS:
+            raise ValidationError(f'A quick game can have at most {QUICK_GAME_MAX_PLAYERS} players.')
+    return players
+
+
+def check_players(players):
+    """
+    Function checking the number of players and duplicate emails (case-insensitive).
+
+    :param players: list of tuples (name, email)
+    :raises ValidationError: when the game is too small, too big or an email repeats
+    """
+    if len(players) < QUICK_GAME_MIN_PLAYERS:
+        raise ValidationError(f'A quick game needs at least {QUICK_GAME_MIN_PLAYERS} players.')
+    if len(players) > QUICK_GAME_MAX_PLAYERS:
+        raise ValidationError(f'A quick game can have at most {QUICK_GAME_MAX_PLAYERS} players.')
+
+    seen = set()
+    duplicates = []
+    for name, email in players:
+        email = email.lower()
+        if email in seen and email not in duplicates:
+            duplicates.append(email)
+        seen.add(email)
+    if duplicates:
+        more = f' and {len(duplicates) - 5} more' if len(duplicates) > 5 else ''
+        raise ValidationError(f'Duplicate emails: {", ".join(duplicates[:5])}{more}.')
+
+
+def quick_game_emails(participants, max_price, currency, date):
+    """
+    Function drawing a quick game and rendering its emails.
+    Players are shuffled and every one of them gives a gift to the next one.
+
+    :param participants: list of tuples (name, email), shuffled in place
+    :param max_price: maximum price for gifts
+    :param currency: currency of max_price
+    :param date: date of gift exchange
+    :return: list of tuples (recipient, subject, body, html)
+    """
+    random.shuffle(participants)
+    assignments = [(giver_name, giver_email, participants[(i + 1) % len(participants)][0], None)
+                   for i, (giver_name, giver_email) in enumerate(participants)]
+    return render_assignments(assignments, max_price, currency, date)
+
+
+def start_job(emails):
+    """
+    Function storing the emails of a quick game in the outbox, tagged with a new job id.
+    The deliver_outbox worker sends them like the emails of saved games.
+
+    :param emails: list of tuples (recipient, subject, body, html) from quick_game_emails
+    :return: job id to poll with job_status
+    """
+    job_id = uuid.uuid4().hex
+    OutboxEmail.objects.bulk_create([
+        OutboxEmail(job=job_id, recipient=recipient, subject=subject, body=body, html_body=html)
+        for recipient, subject, body, html in emails
+    ])
+    return job_id
+
+
+def job_status(job_id):
+    """
+    Function returning the progress of a job, counted from its outbox emails.
+    Needs one query, and one more to list the failed addresses.
+
+    :param job_id: id returned by start_job
+    :return: dict with status (queued, sending or done), total, sent and failed (list of emails),
+             or None when the job is unknown or expired
+    """
+    emails = OutboxEmail.objects.filter(job=job_id, created_at__gte=timezone.now() - timedelta(seconds=JOB_TIMEOUT))
+    counts = dict(emails.order_by().values_list('status').annotate(count=Count('id')))
+    total = sum(counts.values())
+    if not total:
+        return None
+    sent = counts.get(OutboxEmail.SENT, 0)
+    failed = []
+    if counts.get(OutboxEmail.FAILED):
+        failed = list(emails.filter(status=OutboxEmail.FAILED).order_by('id').values_list('recipient', flat=True))
+    if sent + len(failed) == total:
+        status = 'done'
+    elif sent or failed or counts.get(OutboxEmail.SENDING):
+        status = 'sending'
+    else:
+        status = 'queued'
+    return {'status': status, 'total': total, 'sent': sent, 'failed': failed}
+
+
+def sweep_jobs():
+    """
+    Function deleting the delivered and failed emails of quick games older than JOB_TIMEOUT.
+
+    :return: number of deleted emails
+    """
+    count, per_model = OutboxEmail.objects.filter(
+        job__gt='', status__in=[OutboxEmail.SENT, OutboxEmail.FAILED],
+        created_at__lt=timezone.now() - timedelta(seconds=JOB_TIMEOUT),
+    ).delete()
+    return count
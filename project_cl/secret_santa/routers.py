@@ -0,0 +1,133 @@
+import asyncio
+import time
+from contextvars import ContextVar
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS
+from django.urls import Resolver404, resolve
+
+
+REPLICA_LAG_SECONDS = 15  # how long a user reads from the primary after their own write
+PIN_COOKIE = 'primary_until'
+
+# Routing state of the request being handled. It is a mutable object, so a write
+# made in a thread of sync_to_async is seen by the middleware too.
+_request_routing = ContextVar('request_routing', default=None)
+
+
+class RequestRouting:
+    """
+    Attributes:
+        - replica: the view is read-only and the user has not written recently.
+        - pinned: the user has written recently, so everything is read from the primary database.
+        - wrote: the request has written to the database.
+    """
+    def __init__(self, read_only, pinned):
+        self.replica = read_only and not pinned
+        self.pinned = pinned
+        self.wrote = False
+
+
+def replica_alias():
+    return getattr(settings, 'REPLICA_DATABASE', None)
+
+
+def reads_from_replica():
+    """
+    Function telling if the reads of the current request go to the replica.
+    """
+    routing = _request_routing.get()
+    return bool(replica_alias() and routing and routing.replica and not routing.wrote)
+
+
+def pinned_to_primary():
+    """
+    Function telling if the user of the current request has written in the last REPLICA_LAG_SECONDS.
+    """
+    routing = _request_routing.get()
+    return bool(replica_alias() and routing and routing.pinned)
+
+
+class ReplicaRouter:
+    """
+    Database router sending the reads of read-only views (views with read_only = True)
+    to the settings.REPLICA_DATABASE alias. Everything else uses the default database.
+    After a write a user is pinned to the default database for REPLICA_LAG_SECONDS
+    (see ReplicaMiddleware), so they always see their own changes.
+    Without REPLICA_DATABASE the router does nothing.
+    """
+    def db_for_read(self, model, **hints):
+        if not replica_alias():
+            return None
+        return replica_alias() if reads_from_replica() else DEFAULT_DB_ALIAS
+
+    def db_for_write(self, model, **hints):
+        routing = _request_routing.get()
+        if routing:
+            routing.wrote = True
+        if not replica_alias():
+            return None
+        # objects read from the replica are saved to the primary as well
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # the replica holds the same rows as the primary
+        return True
+
+
+def is_read_only(request):
+    try:
+        match = resolve(request.path_info)
+    except Resolver404:
+        return False
+    view = getattr(match.func, 'view_class', match.func)
+    return getattr(view, 'read_only', False)
+
+
+def is_pinned(request):
+    try:
+        return float(request.COOKIES.get(PIN_COOKIE, 0)) > time.time()
+    except ValueError:
+        return False
+
+
+class ReplicaMiddleware:
+    """
+    Middleware marking requests of read-only views, whose reads can go to the replica,
+    and pinning users to the primary database after their own writes (read-your-writes).
+    The pin is a cookie holding the time until which the user reads from the primary.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if asyncio.iscoroutinefunction(get_response):
+            # lets Django see the middleware as a coroutine function, like MiddlewareMixin does
+            self._is_coroutine = asyncio.coroutines._is_coroutine
+
+    def __call__(self, request):
+        if asyncio.iscoroutinefunction(self.get_response):
+            return self.__acall__(request)
+        routing = RequestRouting(is_read_only(request), is_pinned(request))
+        token = _request_routing.set(routing)
+        try:
+            response = self.get_response(request)
+        finally:
+            _request_routing.reset(token)
+        return self.finish(routing, response)
+
+    async def __acall__(self, request):
+        routing = RequestRouting(is_read_only(request), is_pinned(request))
+        token = _request_routing.set(routing)
+        try:
+            response = await self.get_response(request)
+        finally:
+            _request_routing.reset(token)
+        return self.finish(routing, response)
+
+    @staticmethod
+    def finish(routing, response):
+        if routing.wrote and replica_alias():
+            response.set_cookie(PIN_COOKIE, str(time.time() + REPLICA_LAG_SECONDS),
+                                max_age=REPLICA_LAG_SECONDS, httponly=True, samesite='Lax')
+        return response
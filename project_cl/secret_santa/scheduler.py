@@ -0,0 +1,86 @@
+import logging
+import time
+from datetime import timedelta
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+from .draw import DrawInfeasible, create_draw
+from .models import ScheduledDraw
+
+
+CLAIM_TIMEOUT = 30 * 60  # claims older than this belong to a crashed scheduler
+
+logger = logging.getLogger(__name__)
+
+
+def claim_due(batch_size):
+    """
+    Function claiming a batch of scheduled draws whose time has come.
+    Rows are locked while they are flagged, so several schedulers never run the same draw.
+
+    :param batch_size: maximum number of draws to claim
+    :return: list of claimed ScheduledDraw objects with their events and groups
+    """
+    now = timezone.now()
+    stale = now - timedelta(seconds=CLAIM_TIMEOUT)
+    with transaction.atomic():
+        ids = list(
+            ScheduledDraw.objects.select_for_update(skip_locked=True)
+            .filter(
+                Q(status=ScheduledDraw.PENDING, run_at__lte=now)
+                | Q(status=ScheduledDraw.RUNNING, claimed_at__lt=stale)
+            )
+            .order_by('run_at', 'id')
+            .values_list('id', flat=True)[:batch_size]
+        )
+        ScheduledDraw.objects.filter(id__in=ids).update(status=ScheduledDraw.RUNNING, claimed_at=now)
+    return list(ScheduledDraw.objects.filter(id__in=ids).select_related('event', 'group').order_by('run_at', 'id'))
+
+
+def run_scheduled(scheduled):
+    """
+    Function drawing a claimed scheduled draw and recording the result and how long it took.
+    The game is saved in the same transaction as the result, so a scheduler dying in between
+    leaves the draw claimed and another one runs it again after CLAIM_TIMEOUT.
+    Any error fails only this draw, so the rest of the batch still runs.
+
+    :param scheduled: claimed ScheduledDraw object
+    :return: the ScheduledDraw object, done or failed
+    """
+    start = time.perf_counter()
+    try:
+        with transaction.atomic():
+            scheduled.draw = create_draw(scheduled.event, scheduled.group, scheduled.date, scheduled.avoid_repeats)
+            scheduled.status = ScheduledDraw.DONE
+            scheduled.finished_at = timezone.now()
+            scheduled.duration_ms = round((time.perf_counter() - start) * 1000)
+            scheduled.save(update_fields=['status', 'draw', 'error', 'finished_at', 'duration_ms'])
+    except Exception as e:
+        if not isinstance(e, DrawInfeasible):
+            logger.exception('Scheduled draw %s failed', scheduled.pk)
+        scheduled.draw = None
+        scheduled.status = ScheduledDraw.FAILED
+        scheduled.error = str(e) or e.__class__.__name__
+        scheduled.finished_at = timezone.now()
+        scheduled.duration_ms = round((time.perf_counter() - start) * 1000)
+        # update() instead of save(): the row may be gone with its group or event
+        ScheduledDraw.objects.filter(pk=scheduled.pk).update(
+            status=scheduled.status, draw=None, error=scheduled.error,
+            finished_at=scheduled.finished_at, duration_ms=scheduled.duration_ms)
+    return scheduled
+
+
+def run_batch(scheduled_draws):
+    """
+    Function running claimed scheduled draws one after another.
+
+    :param scheduled_draws: list of claimed ScheduledDraw objects
+    :return: tuple (done, failed) with the number of draws in each state
+    """
+    done = failed = 0
+    for scheduled in scheduled_draws:
+        if run_scheduled(scheduled).status == ScheduledDraw.DONE:
+            done += 1
+        else:
+            failed += 1
+    return done, failed
@@ -0,0 +1,115 @@
+import threading
+from django.db import transaction
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_save
+from django.dispatch import receiver
+from .assignments import invalidate_emails, invalidate_givers, invalidate_participants
+from .fragments import event_stamp_key, group_stamp_key, players_stamp_key, touch, touch_games
+from .models import Draw, Event, GiftPair, Group, Participant
+
+
+# Cached assignments show the event name, the date and the receiver's name and wishlist,
+# so a change of any of them removes the cached pages of every affected giver.
+# Draws are saved with bulk_create, which sends no signals - create_draw invalidates those itself.
+# The same saves store new stamps of the cached dashboard fragments (see fragments.py).
+# Changes of the players of a group (forms, the admin, add() and remove()) store a new stamp of the group.
+#
+# Deletes are handled by post_delete receivers, so Model.delete(), QuerySet.delete(), the admin
+# and cascades (e.g. deleting a group or an account) are all covered. Deleted gift pairs only know
+# the ids of their givers, so the ids are collected and their emails are read with one query
+# when the transaction commits, however many pairs the delete removed.
+
+_deleted = threading.local()
+
+
+def _pending(name):
+    if not hasattr(_deleted, name):
+        setattr(_deleted, name, set())
+    return getattr(_deleted, name)
+
+
+def _flush_deleted_pairs():
+    # the first callback of a transaction handles the pairs of all of them, the others find nothing
+    giver_ids, draw_ids = set(_pending('giver_ids')), set(_pending('draw_ids'))
+    _pending('giver_ids').clear()
+    _pending('draw_ids').clear()
+    if giver_ids:
+        invalidate_emails(Participant.objects.filter(pk__in=giver_ids).values_list('email', flat=True))
+    if draw_ids:
+        touch(*[event_stamp_key(event_id) for event_id
+                in Draw.objects.filter(pk__in=draw_ids).values_list('event_id', flat=True).distinct()])
+
+
+@receiver(post_save, sender=GiftPair)
+def gift_pair_changed(sender, instance, **kwargs):
+    invalidate_givers(GiftPair.objects.filter(pk=instance.pk))
+    touch_games(GiftPair.objects.filter(pk=instance.pk))
+
+
+@receiver(pre_save, sender=Participant)
+def remember_old_email(sender, instance, **kwargs):
+    if instance.pk:
+        instance._old_email = Participant.objects.filter(pk=instance.pk).values_list('email', flat=True).first()
+
+
+@receiver(post_save, sender=Participant)
+def participant_changed(sender, instance, **kwargs):
+    invalidate_emails([getattr(instance, '_old_email', None)])
+    invalidate_participants(Participant.objects.filter(pk=instance.pk))
+    touch(players_stamp_key(instance.creator_id))
+
+
+@receiver(post_save, sender=Draw)
+def draw_changed(sender, instance, **kwargs):
+    invalidate_givers(GiftPair.objects.filter(draw=instance))
+    touch(event_stamp_key(instance.event_id))
+
+
+@receiver(post_save, sender=Event)
+def event_changed(sender, instance, **kwargs):
+    invalidate_givers(GiftPair.objects.filter(draw__event=instance))
+    touch(event_stamp_key(instance.pk))
+
+
+@receiver(post_save, sender=Group)
+def group_changed(sender, instance, **kwargs):
+    touch(group_stamp_key(instance.pk))
+
+
+@receiver(m2m_changed, sender=Group.participants.through)
+def group_members_changed(sender, instance, action, reverse, **kwargs):
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+    if reverse:
+        # groups of a player: every group list of the creator shows the players stamp
+        touch(players_stamp_key(instance.creator_id))
+    else:
+        touch(group_stamp_key(instance.pk))
+
+
+@receiver(post_delete, sender=GiftPair)
+def gift_pair_deleted(sender, instance, **kwargs):
+    _pending('giver_ids').add(instance.giver_id)
+    _pending('draw_ids').add(instance.draw_id)
+    transaction.on_commit(_flush_deleted_pairs)
+
+
+@receiver(post_delete, sender=Participant)
+def participant_deleted(sender, instance, **kwargs):
+    # givers of the participant lose their pairs through the cascade to GiftPair
+    invalidate_emails([instance.email])
+    touch(players_stamp_key(instance.creator_id))
+
+
+@receiver(post_delete, sender=Draw)
+def draw_deleted(sender, instance, **kwargs):
+    touch(event_stamp_key(instance.event_id))
+
+
+@receiver(post_delete, sender=Event)
+def event_deleted(sender, instance, **kwargs):
+    touch(event_stamp_key(instance.pk))
+
+
+@receiver(post_delete, sender=Group)
+def group_deleted(sender, instance, **kwargs):
+    touch(group_stamp_key(instance.pk))
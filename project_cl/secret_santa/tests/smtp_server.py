@@ -0,0 +1,122 @@
+"""
+Local stand-in for an SMTP server, used by the tests and benchmarks/bench_smtp.py.
+
+It speaks just enough SMTP for smtplib (and so for Django's SMTP backend) and waits
+`latency` seconds before accepting every message, like a remote server does.
+Recipients containing "reject" are refused, and with `broken_quit` the reply to QUIT is invalid.
+"""
+import socketserver
+import threading
+import time
+
+
+class SMTPHandler(socketserver.StreamRequestHandler):
+    def reply(self, line):
+        self.wfile.write(line.encode() + b'\r\n')
+
+    def handle(self):
+        server = self.server
+        server.session_started()
+        messages = 0
+        ended = False
+        try:
+            self.reply('220 localhost stand-in SMTP')
+            while True:
+                line = self.rfile.readline()
+                if not line:
+                    break
+                verb = line.decode(errors='replace').strip().split(' ', 1)[0].upper()
+                if verb == 'EHLO':
+                    self.reply('250-localhost')
+                    self.reply('250 8BITMIME')
+                elif verb == 'HELO':
+                    self.reply('250 localhost')
+                elif verb == 'RCPT' and b'reject' in line.lower():
+                    self.reply('550 recipient refused')
+                elif verb in ('MAIL', 'RCPT', 'RSET', 'NOOP'):
+                    self.reply('250 OK')
+                elif verb == 'DATA':
+                    self.reply('354 end data with <CR><LF>.<CR><LF>')
+                    data = []
+                    for data_line in self.rfile:
+                        if data_line in (b'.\r\n', b'.\n'):
+                            break
+                        data.append(data_line)
+                    time.sleep(server.latency)
+                    server.message_received(b''.join(data))
+                    messages += 1
+                    self.reply('250 queued')
+                elif verb == 'QUIT':
+                    # counted as closed before the reply, when the client may already open the next connection
+                    server.session_ended(messages)
+                    ended = True
+                    # a reply longer than smtplib reads makes quit() raise SMTPResponseException
+                    self.reply('221 ' + 'x' * 9000 if server.broken_quit else '221 bye')
+                    break
+                else:
+                    self.reply('502 not implemented')
+        finally:
+            if not ended:
+                server.session_ended(messages)
+
+
+class SlowSMTPServer(socketserver.ThreadingTCPServer):
+    """
+    Threaded stand-in SMTP server on a free local port.
+
+    Attributes:
+        - latency: seconds spent on every message.
+        - broken_quit: True to answer QUIT with a reply smtplib cannot read.
+        - messages: list of received raw messages.
+        - sessions: list with the number of messages received over every finished connection.
+        - peak_sessions: largest number of connections open at the same time.
+    Usage:
+        with SlowSMTPServer(latency=0.05) as server:
+            ... EMAIL_HOST='127.0.0.1', EMAIL_PORT=server.port ...
+    """
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, latency=0.0):
+        super().__init__(('127.0.0.1', 0), SMTPHandler)
+        self.latency = latency
+        self.broken_quit = False
+        self.messages = []
+        self.sessions = []
+        self.open_sessions = 0
+        self.peak_sessions = 0
+        self.lock = threading.Lock()
+
+    @property
+    def port(self):
+        return self.server_address[1]
+
+    def session_started(self):
+        with self.lock:
+            self.open_sessions += 1
+            self.peak_sessions = max(self.peak_sessions, self.open_sessions)
+
+    def session_ended(self, messages):
+        with self.lock:
+            self.open_sessions -= 1
+            self.sessions.append(messages)
+
+    def message_received(self, data):
+        with self.lock:
+            self.messages.append(data)
+
+    def wait_idle(self, timeout=5):
+        """
+        Waits until every connection is closed, so sessions are complete.
+        """
+        deadline = time.monotonic() + timeout
+        while self.open_sessions and time.monotonic() < deadline:
+            time.sleep(0.01)
+
+    def __enter__(self):
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self
+
+    def __exit__(self, *args):
+        self.shutdown()
+        self.server_close()
@@ -1,19 +1,66 @@
+import asyncio
+import csv
+import io
+import json
+import mailbox
+import os
 import random
-from django.urls import reverse
+import tempfile
+import time
+from datetime import date, timedelta
+from decimal import Decimal
+from asgiref.sync import sync_to_async
+from django.urls import get_resolver, resolve, reverse
 from django.http import HttpResponse
-from django.test import TestCase
+from django.test import TestCase, override_settings
 import pytest
 from django.test import Client
 from django.contrib.auth.models import User
-from secret_santa.models import Group, Event, Participant
+from unittest import mock
+from django.core.management import CommandError, call_command
+from django.db import DatabaseError, connection, connections
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from secret_santa.models import Draw, Exclusion, Group, Event, GiftPair, OutboxEmail, Participant, ScheduledDraw
 from django.contrib.auth import authenticate, login, logout
-from secret_santa.forms import EventForm, GroupForm, ParticipantForm
-from secret_santa.views import secret_santa
+from secret_santa.forms import EventForm, GameForm, GroupForm, ParticipantForm
 from django.core import mail
+from django.core.cache import cache
+from django.core.cache.utils import make_template_fragment_key
+from django.core.handlers.asgi import ASGIHandler
+from django.core.handlers.base import BaseHandler
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.mail.backends import locmem
+from secret_santa.assignments import cache_key, cache_stats
+from secret_santa.checks import check_shared_cache
+from secret_santa.exports import EXPORT_COLUMNS, export_rows
+from secret_santa.fragments import cached_fragments, players_stamp_key
+from secret_santa.imports import import_participants
+from secret_santa.draw import DrawInfeasible, create_draw, draw_event, draw_pairs, history_pairs
+from secret_santa.mail import (MESSAGES_PER_CONNECTION, DeliveryReport, build_message, format_price,
+                               render_assignments, send_messages, send_parallel)
+from secret_santa.outbox import CLAIM_TIMEOUT, claim_batch, deliver_batch, round_size
+from secret_santa.pagination import keyset_page
+from secret_santa.quick_game import JOB_TIMEOUT, job_status, quick_game_emails, start_job, sweep_jobs
+from secret_santa.scheduler import claim_due, run_batch
+from secret_santa.query_budget import QUERY_BUDGETS, QueryStats, assert_query_budget, row_by_row
+from secret_santa.routers import PIN_COOKIE, REPLICA_LAG_SECONDS
+from secret_santa.tests.smtp_server import SlowSMTPServer
 
 
 ### main views ###
 
+
+def deliver_job(response):
+    """
+    Delivers the outbox emails of a quick game (redirect response of the quick game view)
+    with one attempt, like the deliver_outbox worker, and returns the status of the job.
+    """
+    job_id = response.url.rstrip('/').split('/')[-1]
+    call_command('deliver_outbox', '--once', '--max-attempts', '1', stdout=io.StringIO())
+    return job_status(job_id)
+
+
 class LoggedUserViewTest(TestCase):
     def setUp(self):
         self.client = Client()
@@ -53,6 +100,102 @@ class LoggedUserViewTest(TestCase):
         self.assertContains(response, 'Your created games')
 
 
+class LoggedUserViewQueryTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='testuser', password='testpassword')
+        self.client.login(username='testuser', password='testpassword')
+        self.event = Event.objects.create(name='Test Event', organizer=self.user)
+
+    def seed(self, games, groups, players):
+        participants = [
+            Participant.objects.create(first_name=f'Player {i}', last_name='Test',
+                                       email=f'player{i}@example.com', creator=self.user)
+            for i in range(players)
+        ]
+        for i in range(groups):
+            group = Group.objects.create(name=f'Group {i}', creator=self.user, price_limit=50)
+            group.participants.add(*participants)
+        for i in range(games):
+            draw = Draw.objects.create(event=self.event, group=group, date='2099-12-24', price_limit=50)
+            GiftPair.objects.bulk_create([
+                GiftPair(giver=giver, receiver=participants[(j + 1) % players], draw=draw)
+                for j, giver in enumerate(participants)
+            ])
+
+    def test_query_count_is_constant(self):
+        self.seed(games=1, groups=1, players=3)
+        with self.assertNumQueries(8):
+            self.client.get(reverse('base'))
+
+        self.seed(games=20, groups=10, players=15)
+        with self.assertNumQueries(8):
+            response = self.client.get(reverse('base'))
+        self.assertEqual(len(response.context['game_data']), 12)
+        self.assertContains(response, 'Pair: Player 14 Test -> Player 0 Test', count=11)
+        self.assertIsNotNone(response.context['next_cursor'])
+
+
+class PaginationTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='testuser', password='testpassword', email='giver@example.com')
+        self.client.login(username='testuser', password='testpassword')
+        event = Event.objects.create(name='Test Event', organizer=self.user)
+        group = Group.objects.create(name='Test Group', creator=self.user, price_limit=50)
+        self.giver = Participant.objects.create(first_name='Giver', last_name='Test',
+                                                email='giver@example.com', creator=self.user)
+        receiver = Participant.objects.create(first_name='Receiver', last_name='Test',
+                                              email='receiver@example.com', creator=self.user)
+        for day in ['2001-12-24', '2002-12-24', '2098-12-24', '2099-12-24', '2099-12-24']:
+            draw = Draw.objects.create(event=event, group=group, date=day, price_limit=50)
+            GiftPair.objects.create(giver=self.giver, receiver=receiver, draw=draw)
+
+    def test_keyset_pages_do_not_overlap(self):
+        pairs = GiftPair.objects.filter(giver=self.giver)
+        first = keyset_page(pairs, date_field='draw__date', page_size=2)
+        second = keyset_page(pairs, first.next_cursor, date_field='draw__date', page_size=2)
+        third = keyset_page(pairs, second.next_cursor, date_field='draw__date', page_size=2)
+
+        ids = [pair.id for page in (first, second, third) for pair in page]
+        self.assertEqual(ids, list(pairs.order_by('draw__date', 'id').values_list('id', flat=True)))
+        self.assertIsNone(third.next_cursor)
+
+    def test_dashboard_loads_upcoming_games_only(self):
+        response = self.client.get(reverse('base'))
+        self.assertEqual([game['date'].year for game in response.context['game_data']], [2098, 2099, 2099])
+
+        response = self.client.get(reverse('games-archive'))
+        self.assertEqual([game['date'].year for game in response.context['game_data']], [2002, 2001])
+
+    def test_my_gift_pairs_upcoming_and_archive(self):
+        response = self.client.get(reverse('my-gift-pairs'))
+        self.assertEqual(len(response.context['gift_pairs']), 3)
+
+        response = self.client.get(reverse('my-gift-pairs-archive'))
+        self.assertEqual([pair['date'].year for pair in response.context['gift_pairs']], [2002, 2001])
+
+    def test_lookup_upcoming_and_archive(self):
+        response = self.client.post(reverse('email-lookup'), {'email': 'giver@example.com'})
+        self.assertEqual(len(response.context['gift_pairs']), 3)
+
+        response = self.client.post(reverse('email-lookup-archive'), {'email': 'giver@example.com'})
+        self.assertEqual(len(response.context['gift_pairs']), 2)
+        self.assertContains(response, 'Past results for giver@example.com')
+
+    def test_lookup_ignores_case_and_covers_every_creator(self):
+        other = User.objects.create_user(username='otheruser', password='testpassword')
+        event = Event.objects.create(name='Other Event', organizer=other)
+        group = Group.objects.create(name='Other Group', creator=other, price_limit=20)
+        copy = Participant.objects.create(first_name='Giver', last_name='Copy', email='GIVER@example.com', creator=other)
+        draw = Draw.objects.create(event=event, group=group, date='2099-12-31', price_limit=20)
+        GiftPair.objects.create(giver=copy, receiver=self.giver, draw=draw)
+
+        response = self.client.post(reverse('email-lookup'), {'email': 'Giver@Example.com'})
+
+        self.assertEqual(len(response.context['gift_pairs']), 4)
+        self.assertContains(response, 'Other Event')
+
+
 class QuickGameViewTests(TestCase):
     def test_quick_game_view_form_displayed(self):
         response = self.client.get(reverse('quick_game'))
@@ -76,6 +219,113 @@ class QuickGameViewTests(TestCase):
         }
         response = self.client.post(reverse('quick_game'), data)
         self.assertEqual(response.status_code, 302)
+        self.assertEqual(deliver_job(response)['sent'], 3)
+
+    def game_data(self, **data):
+        return {'max_price': 50, 'currency': 'USD', 'date': '2023-12-25', 'num_players': 3, **data}
+
+    def test_pasted_players_are_sent_in_background(self):
+        players = '\n'.join(f'Player {i}, player{i}@example.com' for i in range(50))
+        response = self.client.post(reverse('quick_game'), self.game_data(players=players))
+
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(job_status(response.url.rstrip('/').split('/')[-1]),
+                         {'status': 'queued', 'total': 50, 'sent': 0, 'failed': []})
+        status = deliver_job(response)
+        self.assertEqual((status['status'], status['total'], status['sent'], status['failed']), ('done', 50, 50, []))
+        self.assertEqual(sorted(message.to[0] for message in mail.outbox),
+                         sorted(f'player{i}@example.com' for i in range(50)))
+        # only the emails are saved, without a game
+        self.assertFalse(Participant.objects.exists())
+        self.assertFalse(OutboxEmail.objects.filter(draw__isnull=False).exists())
+
+        page = self.client.get(response.url)
+        self.assertContains(page, 'All emails were sent!')
+        self.assertContains(page, 'Sent: 50 of 50')
+        self.assertEqual(self.client.get(response.url, {'format': 'json'}).json()['sent'], 50)
+
+    def test_uploaded_players_and_form_fields_are_combined(self):
+        upload = SimpleUploadedFile('players.csv', b'\xef\xbb\xbfname,email\nAnna,anna@example.com\nBob,bob@example.com\n')
+        response = self.client.post(reverse('quick_game'), self.game_data(
+            players_file=upload, player_name_1='Carl', player_email_1='carl@example.com'))
+
+        self.assertEqual(deliver_job(response)['sent'], 3)
+        self.assertEqual(sorted(message.to[0] for message in mail.outbox),
+                         ['anna@example.com', 'bob@example.com', 'carl@example.com'])
+
+    def test_duplicate_emails_are_rejected(self):
+        players = 'Anna, anna@example.com\nBob, bob@example.com\nAnna Again, ANNA@example.com'
+        with mock.patch('secret_santa.views.start_job') as start_job:
+            response = self.client.post(reverse('quick_game'), self.game_data(players=players))
+
+        self.assertContains(response, 'error: Duplicate emails: anna@example.com.')
+        start_job.assert_not_called()
+
+    def test_invalid_pasted_line(self):
+        response = self.client.post(reverse('quick_game'), self.game_data(players='Anna, anna@example.com\nBob'))
+        self.assertContains(response, 'Line 2: expected')
+
+    def test_player_limits(self):
+        with mock.patch('secret_santa.quick_game.QUICK_GAME_MAX_PLAYERS', 3):
+            response = self.client.post(reverse('quick_game'), self.game_data(
+                players='\n'.join(f'P{i}, p{i}@example.com' for i in range(4))))
+        self.assertContains(response, 'at most 3 players')
+
+        response = self.client.post(reverse('quick_game'), self.game_data(num_players=10 ** 9))
+        self.assertContains(response, 'error: A quick game can have at most')
+
+        response = self.client.post(reverse('quick_game'), self.game_data(players='Anna, anna@example.com'))
+        self.assertContains(response, 'error: A quick game needs at least 3 players.')
+
+    def test_upload_size_is_limited(self):
+        upload = SimpleUploadedFile('players.csv', b'Anna, anna@example.com\n' * 10)
+        with mock.patch('secret_santa.forms.QUICK_GAME_MAX_UPLOAD_BYTES', 100):
+            response = self.client.post(reverse('quick_game'), self.game_data(players_file=upload))
+        self.assertContains(response, 'The file can have at most')
+
+    def test_failed_emails_are_reported(self):
+        class FailingBackend(locmem.EmailBackend):
+            def send_messages(self, messages):
+                if messages[0].to == ['bob@example.com']:
+                    raise ConnectionError('refused')
+                return super().send_messages(messages)
+
+        players = 'Anna, anna@example.com\nBob, bob@example.com\nCarl, carl@example.com'
+        with mock.patch('secret_santa.mail.get_connection', return_value=FailingBackend()):
+            response = self.client.post(reverse('quick_game'), self.game_data(players=players))
+            status = deliver_job(response)
+
+        self.assertEqual((status['status'], status['sent'], status['failed']), ('done', 2, ['bob@example.com']))
+        self.assertEqual(list(OutboxEmail.objects.exclude(recipient='').values_list('recipient', 'body')),
+                         [('bob@example.com', '')])
+
+    def test_job_is_kept_in_the_database(self):
+        players = 'Anna, anna@example.com\nBob, bob@example.com\nCarl, carl@example.com'
+        response = self.client.post(reverse('quick_game'), self.game_data(players=players))
+        cache.clear()  # another worker process has a cache of its own
+
+        self.assertEqual(self.client.get(response.url, {'format': 'json'}).json()['status'], 'queued')
+        self.assertEqual(deliver_job(response)['status'], 'done')
+        with mock.patch('secret_santa.quick_game.timezone.now',
+                        return_value=timezone.now() + timedelta(seconds=JOB_TIMEOUT + 1)):
+            self.assertEqual(self.client.get(response.url).status_code, 404)
+
+    def test_delivered_emails_keep_no_pairs(self):
+        players = 'Anna, anna@example.com\nBob, bob@example.com\nCarl, carl@example.com'
+        response = self.client.post(reverse('quick_game'), self.game_data(players=players))
+        self.assertTrue(all(email.body for email in OutboxEmail.objects.all()))
+
+        self.assertEqual(deliver_job(response)['sent'], 3)
+        self.assertEqual(set(OutboxEmail.objects.values_list('recipient', 'subject', 'body', 'html_body')),
+                         {('', '', '', '')})
+
+        with mock.patch('secret_santa.quick_game.timezone.now',
+                        return_value=timezone.now() + timedelta(seconds=JOB_TIMEOUT + 1)):
+            self.assertEqual(sweep_jobs(), 3)
+        self.assertFalse(OutboxEmail.objects.exists())
+
+    def test_unknown_job(self):
+        self.assertEqual(self.client.get(reverse('quick-game-status', args=['missing'])).status_code, 404)
 
 
 class GameViewTests(TestCase):
@@ -440,9 +690,9 @@ class SecretSantaTests(TestCase):
         currency = 'USD'
         date = '2023-12-25'
 
-        secret_santa(participants, max_price, currency, date)
+        emails = quick_game_emails(participants, max_price, currency, date)
 
-        self.assertEqual(len(mail.outbox), 0)
+        self.assertEqual(emails, [])
 
     def test_secret_santa_valid_participants(self):
         participants = [
@@ -456,15 +706,1835 @@ class SecretSantaTests(TestCase):
 
         random.seed(42)
 
-        secret_santa(participants, max_price, currency, date)
+        emails = quick_game_emails(participants, max_price, currency, date)
 
-        self.assertEqual(len(mail.outbox), len(participants))
+        self.assertEqual(len(emails), len(participants))
 
         for i, (name, email) in enumerate(participants):
             expected_subject = 'Secret Santa'
             expected_message = f'Hi {name},\n\nYou are {participants[(i+1)%len(participants)][0]}\'s Secret Santa!'
-            expected_message += f'\n\nThe maximum price for gifts is {max_price} {currency}.'
+            expected_message += f'\n\nThe maximum price for gifts is 50.00 {currency}.'
             expected_message += f'\nThe exchange date is {date}.'
             expected_message += f'\n\nBest wishes,\nSecret Santa'
-            self.assertEqual(mail.outbox[i].subject, expected_subject)
-            self.assertEqual(mail.outbox[i].body, expected_message)
+            recipient, subject, body, html = emails[i]
+            self.assertEqual(recipient, email)
+            self.assertEqual(subject, expected_subject)
+            self.assertEqual(body, expected_message)
+            self.assertIn(f'Hi {name}', html)
+
+
+### OUTBOX SECTION ###
+
+
+class OutboxTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='testuser', password='testpassword')
+        self.client.login(username='testuser', password='testpassword')
+        self.event = Event.objects.create(name='Test Event', organizer=self.user)
+        self.group = Group.objects.create(name='Test Group', creator=self.user, price_limit=50, currency='PLN')
+        for letter in 'ABC':
+            self.group.participants.add(Participant.objects.create(
+                first_name=letter, last_name='Player', email=f'{letter.lower()}@example.com', creator=self.user))
+
+    def run_game(self):
+        return self.client.post(reverse('new-game'), {
+            'event': self.event.id,
+            'group': self.group.id,
+            'date': '2023-12-25',
+        })
+
+    def test_game_queues_emails_instead_of_sending(self):
+        response = self.run_game()
+
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(GiftPair.objects.count(), 3)
+        self.assertEqual(OutboxEmail.objects.filter(status=OutboxEmail.PENDING).count(), 3)
+        self.assertEqual(len(mail.outbox), 0)
+
+    def test_worker_delivers_queued_emails(self):
+        self.run_game()
+
+        call_command('deliver_outbox', once=True, stdout=mock.Mock())
+
+        self.assertEqual(len(mail.outbox), 3)
+        self.assertEqual(OutboxEmail.objects.filter(status=OutboxEmail.SENT).count(), 3)
+        self.assertEqual(
+            sorted(message.to[0] for message in mail.outbox),
+            ['a@example.com', 'b@example.com', 'c@example.com'])
+
+    def test_worker_retries_with_backoff_then_fails(self):
+        email = OutboxEmail.objects.create(recipient='a@example.com', subject='Secret Santa', body='Hi')
+
+        with mock.patch.object(locmem.EmailBackend, 'send_messages', side_effect=OSError('SMTP down')):
+            call_command('deliver_outbox', once=True, max_attempts=2, stdout=mock.Mock())
+            email.refresh_from_db()
+            self.assertEqual(email.status, OutboxEmail.PENDING)
+            self.assertEqual(email.attempts, 1)
+            self.assertGreater(email.next_attempt_at, timezone.now())
+            self.assertEqual(email.last_error, 'SMTP down')
+
+            OutboxEmail.objects.filter(pk=email.pk).update(next_attempt_at=timezone.now())
+            call_command('deliver_outbox', once=True, max_attempts=2, stdout=mock.Mock())
+            email.refresh_from_db()
+            self.assertEqual(email.status, OutboxEmail.FAILED)
+            self.assertEqual(email.attempts, 2)
+
+
+    @override_settings(EMAIL_RATE_LIMIT=0.01)  # rounds of 3 emails with the 10 minute claim timeout
+    def test_long_batch_is_not_reclaimed_by_another_worker(self):
+        for i in range(6):
+            OutboxEmail.objects.create(recipient=f'{i}@example.com', subject='Secret Santa', body='Hi')
+        start = timezone.now()
+        clock = {'now': start}
+        reclaimed = []
+
+        def slow_send(messages):
+            # every round takes 60% of the claim timeout, and another worker looks for stale claims
+            clock['now'] += timedelta(seconds=CLAIM_TIMEOUT * 0.6)
+            reclaimed.extend(claim_batch(10))
+            report = DeliveryReport()
+            report.sent = list(messages)
+            return report
+
+        with mock.patch.object(timezone, 'now', lambda: clock['now']), \
+                mock.patch('secret_santa.outbox.send_parallel', slow_send):
+            emails = claim_batch(10)
+            self.assertEqual(deliver_batch(emails, max_attempts=3), (6, 0))
+
+        self.assertEqual(reclaimed, [])
+        self.assertEqual(OutboxEmail.objects.filter(status=OutboxEmail.SENT).count(), 6)
+
+    def test_round_size_fits_the_claim_timeout(self):
+        self.assertEqual(round_size(workers=4), 4 * MESSAGES_PER_CONNECTION)
+        self.assertEqual(round_size(workers=4, rate=0.5), int(0.5 * CLAIM_TIMEOUT / 2))
+        self.assertEqual(round_size(workers=4, rate=0.0001), 1)
+
+class BatchedMailTests(TestCase):
+    def test_send_messages_reuses_one_connection(self):
+        connection = mail.get_connection()
+        messages = [build_message('Secret Santa', 'Hi', f'{i}@example.com') for i in range(5)]
+
+        with mock.patch.object(connection, 'open', wraps=connection.open) as opened:
+            report = send_messages(messages, connection=connection)
+
+        self.assertEqual(opened.call_count, 1)
+        self.assertEqual(len(report.sent), 5)
+        self.assertEqual(len(mail.outbox), 5)
+
+    def test_send_messages_renews_connection_after_limit(self):
+        connection = mail.get_connection()
+        messages = [build_message('Secret Santa', 'Hi', f'{i}@example.com') for i in range(5)]
+
+        with mock.patch.object(connection, 'open', wraps=connection.open) as opened:
+            send_messages(messages, connection=connection, messages_per_connection=2)
+
+        self.assertEqual(opened.call_count, 3)
+
+    def test_send_messages_reports_failures_and_continues(self):
+        original = locmem.EmailBackend.send_messages
+
+        def refuse_b(backend, messages):
+            if messages[0].to == ['b@example.com']:
+                raise OSError('Recipient refused')
+            return original(backend, messages)
+
+        messages = [build_message('Secret Santa', 'Hi', f'{letter}@example.com') for letter in 'abc']
+        with mock.patch.object(locmem.EmailBackend, 'send_messages', autospec=True, side_effect=refuse_b):
+            report = send_messages(messages)
+
+        self.assertEqual(report.failed_recipients, ['b@example.com'])
+        self.assertEqual([message.to[0] for message in mail.outbox], ['a@example.com', 'c@example.com'])
+
+
+class AssignmentEmailTests(TestCase):
+    def test_price_uses_currency_decimals(self):
+        self.assertEqual(format_price(Decimal('1250'), 'PLN'), '1,250.00 PLN')
+        self.assertEqual(format_price(5000, 'JPY'), '5,000 JPY')
+        self.assertEqual(format_price('12.5', 'BHD'), '12.500 BHD')
+
+    def test_render_batch(self):
+        emails = render_assignments([
+            ('Anna', 'anna@example.com', 'Bob', 'Socks\n<b>Books</b>'),
+            ('Bob', 'bob@example.com', 'Anna', None),
+        ], Decimal('50'), 'EUR', date(2099, 12, 24))
+
+        self.assertEqual([email[:2] for email in emails],
+                         [('anna@example.com', 'Secret Santa'), ('bob@example.com', 'Secret Santa')])
+        recipient, subject, body, html = emails[0]
+        self.assertEqual(body, "Hi Anna,\n\nYou are Bob's Secret Santa!\n\nTheir wishlist:\nSocks\n<b>Books</b>"
+                               "\n\nThe maximum price for gifts is 50.00 EUR.\nThe exchange date is 2099-12-24."
+                               "\n\nBest wishes,\nSecret Santa")
+        self.assertIn('Socks<br>&lt;b&gt;Books&lt;/b&gt;', html)
+        self.assertIn('<strong>50.00 EUR</strong>', html)
+        self.assertNotIn('wishlist', emails[1][2])
+        self.assertNotIn('Anna,', emails[1][3])
+
+    def test_templates_are_compiled_once(self):
+        render_assignments([('A', 'a@example.com', 'B', None)], 10, 'USD', '2099-12-24')
+        with mock.patch('secret_santa.mail.get_template') as get_template:
+            render_assignments([('A', 'a@example.com', 'B', None)], 10, 'USD', '2099-12-24')
+        get_template.assert_not_called()
+
+    def test_draw_email_has_wishlist_and_html_part(self):
+        user = User.objects.create_user(username='testuser', password='testpassword')
+        event = Event.objects.create(name='Christmas', organizer=user)
+        group = Group.objects.create(name='Office', creator=user, price_limit=1000, currency='JPY')
+        group.participants.add(*[
+            Participant.objects.create(first_name=letter, last_name='Player', email=f'{letter.lower()}@example.com',
+                                       wishlist=f'Gift for {letter}', creator=user)
+            for letter in 'ABC'
+        ])
+        create_draw(event, group, '2099-12-24')
+
+        for pair in GiftPair.objects.select_related('giver', 'receiver'):
+            email = OutboxEmail.objects.get(recipient=pair.giver.email)
+            self.assertIn(f'Gift for {pair.receiver.first_name}', email.body)
+            self.assertIn('1,000 JPY', email.body)
+            self.assertIn(f'Gift for {pair.receiver.first_name}', email.html_body)
+
+        call_command('deliver_outbox', once=True, stdout=mock.Mock())
+        self.assertEqual(len(mail.outbox), 3)
+        self.assertTrue(all(message.alternatives[0][1] == 'text/html' for message in mail.outbox))
+
+
+### DRAW PERSISTENCE SECTION ###
+
+
+class DrawPersistenceTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='testuser', password='testpassword')
+        self.client.login(username='testuser', password='testpassword')
+        self.event = Event.objects.create(name='Test Event', organizer=self.user)
+
+    def make_group(self, size):
+        group = Group.objects.create(name=f'Group of {size}', creator=self.user, price_limit=50, currency='PLN')
+        group.participants.add(*[
+            Participant.objects.create(first_name=f'Player {i}', last_name=f'Group {size}',
+                                       email=f'player{i}.group{size}@example.com', creator=self.user)
+            for i in range(size)
+        ])
+        return group
+
+    def run_game(self, group):
+        return self.client.post(reverse('new-game'), {
+            'event': self.event.id,
+            'group': group.id,
+            'date': '2023-12-25',
+        })
+
+    def test_pairs_are_inserted_in_one_statement(self):
+        for size in (3, 12):
+            group = self.make_group(size)
+            with CaptureQueriesContext(connection) as queries:
+                self.run_game(group)
+            inserts = [q['sql'] for q in queries.captured_queries
+                       if q['sql'].startswith('INSERT INTO "secret_santa_giftpair"')]
+            self.assertEqual(len(inserts), 1)
+            self.assertEqual(GiftPair.objects.filter(draw__group=group).count(), size)
+
+    def test_failed_draw_leaves_no_pairs(self):
+        group = self.make_group(4)
+
+        with mock.patch.object(OutboxEmail.objects, 'bulk_create', side_effect=DatabaseError):
+            with self.assertRaises(DatabaseError):
+                self.run_game(group)
+
+        self.assertFalse(GiftPair.objects.exists())
+
+    def test_each_game_gets_its_own_draw(self):
+        group = self.make_group(3)
+
+        self.run_game(group)
+        self.run_game(group)
+
+        first, second = Draw.objects.order_by('id')
+        self.assertNotEqual(first.id, second.id)
+        self.assertEqual(first.pairs.count(), 3)
+        self.assertEqual(second.pairs.count(), 3)
+        self.assertEqual((second.event, second.group, str(second.date)), (self.event, group, '2023-12-25'))
+        self.assertEqual((second.price_limit, second.currency), (50, 'PLN'))
+        self.assertEqual(OutboxEmail.objects.filter(draw=second).count(), 3)
+
+    def test_query_count_does_not_depend_on_group_size(self):
+        self.run_game(self.make_group(3))
+        counts = []
+        for size in (3, 30):
+            group = self.make_group(size)
+            with CaptureQueriesContext(connection) as queries:
+                self.run_game(group)
+            counts.append(len(queries))
+        self.assertEqual(counts[0], counts[1])
+
+    def test_same_email_stored_by_another_creator(self):
+        other = User.objects.create_user(username='otheruser', password='testpassword')
+        Participant.objects.create(first_name='Player 0', last_name='Copy',
+                                   email='player0.group3@example.com', creator=other)
+        group = self.make_group(3)
+
+        response = self.run_game(group)
+
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(
+            set(GiftPair.objects.values_list('giver', flat=True)),
+            set(group.participants.values_list('id', flat=True)))
+
+
+### ASSIGNMENT CACHE SECTION ###
+
+
+class AssignmentCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='testuser', password='testpassword', email='giver@example.com')
+        self.client.login(username='testuser', password='testpassword')
+        self.event = Event.objects.create(name='Christmas', organizer=self.user)
+        self.group = Group.objects.create(name='Family', creator=self.user, price_limit=50)
+        self.giver = Participant.objects.create(first_name='Giver', last_name='Test',
+                                                email='giver@example.com', creator=self.user)
+        self.receiver = Participant.objects.create(first_name='Receiver', last_name='Test',
+                                                   email='receiver@example.com', creator=self.user)
+        self.draw = Draw.objects.create(event=self.event, group=self.group, date='2099-12-24', price_limit=50)
+        GiftPair.objects.create(giver=self.giver, receiver=self.receiver, draw=self.draw)
+
+    def lookup(self):
+        return self.client.post(reverse('email-lookup'), {'email': 'giver@example.com'})
+
+    def test_repeated_lookup_is_served_from_cache(self):
+        self.lookup()
+        with self.assertNumQueries(2):  # session and user only
+            response = self.lookup()
+
+        self.assertContains(response, 'Receiver: Receiver Test')
+        self.assertEqual(cache_stats()['hits'], 1)
+        self.assertEqual(cache_stats()['misses'], 1)
+
+    def test_my_gift_pairs_shares_the_lookup_cache(self):
+        self.lookup()
+        response = self.client.get(reverse('my-gift-pairs'))
+
+        self.assertContains(response, 'Receiver: Receiver Test')
+        self.assertEqual(cache_stats()['hits'], 1)
+
+    def test_saving_models_invalidates_the_cache(self):
+        self.lookup()
+
+        self.receiver.first_name = 'Renamed'
+        self.receiver.save()
+        self.assertContains(self.lookup(), 'Receiver: Renamed Test')
+
+        self.event.name = 'Winter party'
+        self.event.save()
+        self.assertContains(self.lookup(), 'Event: Winter party')
+
+        with self.captureOnCommitCallbacks(execute=True):
+            GiftPair.objects.all().delete()
+        self.assertContains(self.lookup(), 'No gift pairs found.')
+
+    def test_deleting_models_invalidates_the_cache(self):
+        self.lookup()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.receiver.delete()
+        self.assertContains(self.lookup(), 'No gift pairs found.')
+
+        GiftPair.objects.create(giver=self.giver, receiver=self.giver, draw=self.draw)
+        self.lookup()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.group.delete()
+        self.assertContains(self.lookup(), 'No gift pairs found.')
+
+        self.draw = Draw.objects.create(event=self.event, group=Group.objects.create(
+            name='Friends', creator=self.user, price_limit=50), date='2099-12-24', price_limit=50)
+        GiftPair.objects.create(giver=self.giver, receiver=self.giver, draw=self.draw)
+        self.lookup()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.delete()
+        self.assertContains(self.lookup(), 'No gift pairs found.')
+
+    def test_queryset_deletes_invalidate_the_cache(self):
+        for model in (Group, Event, Draw, Participant):
+            with self.subTest(model=model.__name__):
+                draw = Draw.objects.create(
+                    event=Event.objects.create(name='Party', organizer=self.user),
+                    group=Group.objects.create(name='Team', creator=self.user, price_limit=50),
+                    date='2099-12-24', price_limit=50)
+                receiver = Participant.objects.create(first_name=model.__name__, last_name='Receiver',
+                                                      email=f'{model.__name__}@example.com', creator=self.user)
+                GiftPair.objects.create(giver=self.giver, receiver=receiver, draw=draw)
+                self.lookup()
+                self.assertContains(self.lookup(), f'Receiver: {model.__name__} Receiver')
+
+                target = {Group: draw.group_id, Event: draw.event_id, Draw: draw.pk, Participant: receiver.pk}
+                with self.captureOnCommitCallbacks(execute=True):
+                    model.objects.filter(pk=target[model]).delete()
+
+                self.assertNotContains(self.lookup(), f'Receiver: {model.__name__} Receiver')
+
+    def test_new_draw_invalidates_the_cache(self):
+        self.lookup()
+        third = Participant.objects.create(first_name='Third', last_name='Test',
+                                           email='third@example.com', creator=self.user)
+        self.group.participants.add(self.giver, self.receiver, third)
+
+        self.client.post(reverse('new-game'), {'event': self.event.id, 'group': self.group.id, 'date': '2099-12-25'})
+
+        self.assertEqual(len(self.lookup().context['gift_pairs']), 2)
+
+    def test_cache_stats_are_staff_only(self):
+        response = self.client.get(reverse('cache-stats'))
+        self.assertEqual(response.status_code, 302)
+
+        self.user.is_staff = True
+        self.user.save()
+        response = self.client.get(reverse('cache-stats'))
+        self.assertEqual(response.json(), {'hits': 0, 'misses': 0, 'hit_ratio': None})
+
+
+### EXCLUSIONS SECTION ###
+
+
+class DrawEngineTests(TestCase):
+    def assert_valid(self, participants, pairs, exclusions=()):
+        self.assertEqual(sorted(giver for giver, receiver in pairs), sorted(participants))
+        self.assertEqual(sorted(receiver for giver, receiver in pairs), sorted(participants))
+        for giver, receiver in pairs:
+            self.assertNotEqual(giver, receiver)
+            self.assertNotIn((giver, receiver), exclusions)
+
+    def test_exclusions_are_respected(self):
+        participants = list(range(12))
+        # three teams of four, nobody draws a teammate
+        exclusions = {(a, b) for a in participants for b in participants if a // 4 == b // 4}
+        for seed in range(50):
+            pairs = draw_pairs(participants, exclusions, rng=random.Random(seed))
+            self.assert_valid(participants, pairs, exclusions)
+
+    def test_only_one_assignment_left(self):
+        participants = ['a', 'b', 'c', 'd']
+        exclusions = {(giver, receiver) for giver in participants for receiver in participants
+                      if participants.index(receiver) != (participants.index(giver) + 1) % 4}
+        for seed in range(20):
+            pairs = draw_pairs(participants, exclusions, rng=random.Random(seed))
+            self.assertEqual(sorted(pairs), [('a', 'b'), ('b', 'c'), ('c', 'd'), ('d', 'a')])
+
+    def test_matching_fallback(self):
+        participants = list(range(30))
+        exclusions = {(a, b) for a in participants for b in participants if a // 10 == b // 10}
+        with mock.patch('secret_santa.draw.SWAP_ATTEMPTS', 0):
+            for seed in range(20):
+                pairs = draw_pairs(participants, exclusions, rng=random.Random(seed))
+                self.assert_valid(participants, pairs, exclusions)
+
+    def test_giver_excluded_from_everyone(self):
+        with self.assertRaisesMessage(DrawInfeasible, 'a cannot give a gift to anyone.'):
+            draw_pairs(['a', 'b', 'c'], [('a', 'b'), ('a', 'c')])
+
+    def test_receiver_excluded_by_everyone(self):
+        with self.assertRaisesMessage(DrawInfeasible, 'Nobody can give a gift to c.'):
+            draw_pairs(['a', 'b', 'c'], [('a', 'c'), ('b', 'c')])
+
+    def test_too_many_givers_for_too_few_receivers(self):
+        # a, b and c may only give gifts to d and e
+        exclusions = [(giver, receiver) for giver in 'abc' for receiver in 'abc']
+        with self.assertRaisesMessage(DrawInfeasible, 'can only give gifts to'):
+            draw_pairs(list('abcde'), exclusions)
+
+    def test_one_participant(self):
+        with self.assertRaises(DrawInfeasible):
+            draw_pairs(['a'])
+
+
+class ExclusionViewTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='testuser', password='testpassword')
+        self.client.login(username='testuser', password='testpassword')
+        self.event = Event.objects.create(name='Test Event', organizer=self.user)
+        self.players = [
+            Participant.objects.create(first_name=f'Player {i}', last_name='Test',
+                                       email=f'player{i}@example.com', creator=self.user)
+            for i in range(4)
+        ]
+        self.group = Group.objects.create(name='Test Group', creator=self.user, price_limit=50, currency='PLN')
+        self.group.participants.add(*self.players)
+
+    def run_game(self):
+        return self.client.post(reverse('new-game'), {
+            'event': self.event.id,
+            'group': self.group.id,
+            'date': '2023-12-25',
+        })
+
+    def test_add_exclusion(self):
+        response = self.client.post(reverse('add-exclusion', args=[self.group.id]), {
+            'giver': self.players[0].id,
+            'receiver': self.players[1].id,
+            'mutual': 'on',
+        })
+
+        self.assertEqual(response.status_code, 302)
+        exclusion = Exclusion.objects.get()
+        self.assertEqual((exclusion.group, exclusion.giver, exclusion.receiver, exclusion.mutual),
+                         (self.group, self.players[0], self.players[1], True))
+
+    def test_exclusion_needs_two_players(self):
+        response = self.client.post(reverse('add-exclusion', args=[self.group.id]), {
+            'giver': self.players[0].id,
+            'receiver': self.players[0].id,
+        })
+
+        self.assertContains(response, 'Choose two different players.')
+        self.assertFalse(Exclusion.objects.exists())
+
+    def test_game_respects_exclusions(self):
+        # couples 0-1 and 2-3 never draw each other
+        Exclusion.objects.create(group=self.group, giver=self.players[0], receiver=self.players[1])
+        Exclusion.objects.create(group=self.group, giver=self.players[2], receiver=self.players[3])
+        couples = {(0, 1), (1, 0), (2, 3), (3, 2)}
+        ids = [player.id for player in self.players]
+
+        for _ in range(10):
+            self.run_game()
+
+        for giver_id, receiver_id in GiftPair.objects.values_list('giver_id', 'receiver_id'):
+            self.assertNotIn((ids.index(giver_id), ids.index(receiver_id)), couples)
+
+    def test_impossible_game_is_not_saved(self):
+        for receiver in self.players[1:]:
+            Exclusion.objects.create(group=self.group, giver=self.players[0], receiver=receiver, mutual=False)
+
+        response = self.run_game()
+
+        self.assertContains(response, 'The draw is not possible: Player 0 Test cannot give a gift to anyone.')
+        self.assertFalse(Draw.objects.exists())
+        self.assertFalse(OutboxEmail.objects.exists())
+
+
+### HISTORY SECTION ###
+
+
+class HistoryDrawTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='testuser', password='testpassword')
+        self.client.login(username='testuser', password='testpassword')
+        self.event = Event.objects.create(name='Test Event', organizer=self.user)
+        self.players = [
+            Participant.objects.create(first_name=f'Player {i}', last_name='Test',
+                                       email=f'player{i}@example.com', creator=self.user)
+            for i in range(5)
+        ]
+        self.group = Group.objects.create(name='Test Group', creator=self.user, price_limit=50, currency='PLN')
+        self.group.participants.add(*self.players)
+
+    def run_game(self, day, avoid_repeats=1):
+        return self.client.post(reverse('new-game'), {
+            'event': self.event.id,
+            'group': self.group.id,
+            'date': day,
+            'avoid_repeats': avoid_repeats,
+        })
+
+    def pairs_of(self, draw):
+        return set(draw.pairs.values_list('giver_id', 'receiver_id'))
+
+    def test_pairs_from_last_draws_are_not_repeated(self):
+        for year in range(2020, 2024):
+            self.run_game(f'{year}-12-24', avoid_repeats=3)
+
+        draws = list(Draw.objects.order_by('date'))
+        for i, draw in enumerate(draws):
+            for previous in draws[max(0, i - 3):i]:
+                self.assertFalse(self.pairs_of(draw) & self.pairs_of(previous))
+
+    def test_history_uses_one_query(self):
+        for year in range(2020, 2023):
+            self.run_game(f'{year}-12-24', avoid_repeats=0)
+
+        with self.assertNumQueries(1):
+            previous_pairs = history_pairs(self.group, 2)
+
+        draws = Draw.objects.order_by('-date')[:2]
+        self.assertEqual(previous_pairs, self.pairs_of(draws[0]) | self.pairs_of(draws[1]))
+
+    def test_empty_avoid_repeats_means_no_history(self):
+        form = GameForm({'event': self.event.id, 'group': self.group.id, 'date': '2023-12-24',
+                         'avoid_repeats': ''}, user=self.user)
+        self.assertTrue(form.is_valid())
+        self.assertEqual(form.cleaned_data['avoid_repeats'], 0)
+
+    def test_history_of_other_groups_is_ignored(self):
+        other = Group.objects.create(name='Other Group', creator=self.user, price_limit=50, currency='PLN')
+        other.participants.add(*self.players)
+        draw = Draw.objects.create(event=self.event, group=other, date='2023-12-24', price_limit=50)
+        GiftPair.objects.create(draw=draw, giver=self.players[0], receiver=self.players[1])
+
+        self.assertEqual(history_pairs(self.group, 5), set())
+
+    def test_repeats_are_minimal_when_unavoidable(self):
+        # with three players there are only two possible circles,
+        # so after both of them every pair is a repeat
+        participants = ['a', 'b', 'c']
+        history = {('a', 'b'), ('b', 'c'), ('c', 'a')}
+        pairs = draw_pairs(participants, avoid=history)
+        self.assertEqual(set(pairs), {('a', 'c'), ('c', 'b'), ('b', 'a')})
+
+        history |= set(pairs)
+        pairs = draw_pairs(participants, avoid=history)
+        self.assertEqual(sorted(receiver for giver, receiver in pairs), participants)
+
+    def test_single_repeat_instead_of_failure(self):
+        # d can only give to a without repeating; a, b and c avoid each other in a circle
+        participants = list('abcd')
+        history = {('a', 'b'), ('b', 'c'), ('c', 'a'), ('d', 'b'), ('d', 'c')}
+        exclusions = {('a', 'd'), ('b', 'd')}
+        for seed in range(20):
+            pairs = draw_pairs(participants, exclusions, rng=random.Random(seed), avoid=history)
+            self.assertFalse(set(pairs) & exclusions)
+            self.assertEqual(len(set(pairs) & history), 1)
+
+    def test_avoid_repeats_is_optional(self):
+        response = self.client.post(reverse('new-game'), {
+            'event': self.event.id,
+            'group': self.group.id,
+            'date': '2023-12-24',
+        })
+
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(Draw.objects.count(), 1)
+
+
+### QUERY BUDGET SECTION ###
+
+
+class QueryBudgetTests(TestCase):
+    def setUp(self):
+        cache.clear()
+
+    def seed(self, scale):
+        """
+        Creates a logged in user with `scale` events, groups of `scale` players,
+        exclusions and games, so growing data shows up as a growing number of queries.
+        """
+        user = User.objects.create_user(username=f'user{scale}', email=f'player0.scale{scale}@example.com',
+                                        password='testpassword')
+        self.client.login(username=f'user{scale}', password='testpassword')
+        players = [
+            Participant.objects.create(first_name=f'Player {i}', last_name=f'Scale {scale}',
+                                       email=f'player{i}.scale{scale}@example.com', creator=user)
+            for i in range(scale + 3)
+        ]
+        events = [Event.objects.create(name=f'Event {i}', organizer=user) for i in range(scale)]
+        groups = []
+        for i in range(scale):
+            group = Group.objects.create(name=f'Group {i}', creator=user, price_limit=50, currency='PLN')
+            group.participants.add(*players)
+            Exclusion.objects.create(group=group, giver=players[0], receiver=players[1])
+            groups.append(group)
+        for i, (event, group) in enumerate(zip(events, groups)):
+            event.groups.add(group)
+            for day in ('2000-12-24', '2999-12-24'):
+                draw = Draw.objects.create(event=event, group=group, date=day, price_limit=50)
+                GiftPair.objects.bulk_create([
+                    GiftPair(draw=draw, giver=giver, receiver=players[(j + 1) % len(players)])
+                    for j, giver in enumerate(players)
+                ])
+        return user, events[0], groups[0], players
+
+    def requests(self, scale):
+        user, event, group, players = self.seed(scale)
+        player = players[-1]
+        email = {'email': f'player0.scale{scale}@example.com'}
+        return [
+            ('get', reverse('index'), None),
+            ('get', reverse('quick_game'), None),
+            ('post', reverse('quick_game'), {'max_price': 50, 'currency': 'PLN', 'date': '2999-12-24',
+                                             'num_players': 0,
+                                             'players': '\n'.join(f'{p.name}, {p.email}' for p in players)}),
+            ('get', reverse('quick-game-status', args=[start_job(quick_game_emails(
+                [(p.name, p.email) for p in players[:3]], 50, 'PLN', '2999-12-24'))]), None),
+            ('get', reverse('login'), None),
+            ('get', reverse('base'), None),
+            ('get', reverse('games-archive'), None),
+            ('get', reverse('export-all'), None),
+            ('get', reverse('export-event', args=[event.id]), None),
+            ('get', reverse('export-game', args=[Draw.objects.filter(event=event).first().id]), None),
+            ('get', reverse('add-event'), None),
+            ('get', reverse('edit-event', args=[event.id]), None),
+            ('get', reverse('delete-event', args=[event.id]), None),
+            ('get', reverse('add-group'), None),
+            ('get', reverse('edit-group', args=[group.id]), None),
+            ('get', reverse('delete-group', args=[group.id]), None),
+            ('get', reverse('add-exclusion', args=[group.id]), None),
+            ('get', reverse('add-player'), None),
+            ('get', reverse('edit-player', args=[player.id]), None),
+            ('get', reverse('delete-player', args=[player.id]), None),
+            ('get', reverse('new-game'), None),
+            ('post', reverse('new-game'), {'event': event.id, 'group': group.id, 'date': '2999-12-25',
+                                           'avoid_repeats': 2}),
+            ('post', reverse('new-game'), {'event': event.id, 'group': group.id, 'date': '2999-12-25',
+                                           'run_at': '2999-12-01 09:00'}),
+            ('get', reverse('draw-event', args=[event.id]), None),
+            ('post', reverse('draw-event', args=[event.id]), {'date': '2999-12-27', 'avoid_repeats': 2}),
+            ('get', reverse('register'), None),
+            ('get', reverse('change-password'), None),
+            ('get', reverse('delete_account', args=[user.id]), None),
+            ('get', reverse('my-gift-pairs'), None),
+            ('get', reverse('my-gift-pairs-archive'), None),
+            ('post', reverse('email-lookup'), email),
+            ('post', reverse('email-lookup-archive'), email),
+            ('get', reverse('success'), None),
+            ('get', reverse('cache-stats'), None),
+            ('get', reverse('api-participants') + '?limit=2&fields=id,email', None),
+            ('get', reverse('api-groups'), None),
+            ('get', reverse('api-draws'), None),
+            ('get', reverse('api-draw', args=[Draw.objects.filter(event=event).first().id]), None),
+            ('post', reverse('api-participants'), {'participants': [
+                {'first_name': 'Api', 'last_name': f'{i}', 'email': f'api{i}@example.com'} for i in range(scale + 3)]}),
+            ('patch', reverse('api-participants'), {'participants': [
+                {'id': p.id, 'wishlist': 'Books'} for p in players]}),
+            ('post', reverse('api-groups'), {'name': 'Api group', 'price_limit': 20, 'currency': 'PLN',
+                                             'participants': [p.id for p in players[:3]]}),
+            ('post', reverse('api-draws'), {'event': event.id, 'group': group.id, 'date': '2999-12-26',
+                                            'avoid_repeats': 2}),
+            ('post', reverse('api-draws'), {'event': event.id, 'group': group.id, 'date': '2999-12-26',
+                                            'run_at': '2999-12-01 09:00'}),
+            ('post', reverse('add-event'), {'name': 'New event', 'description': 'New', 'organizer': user.id}),
+            ('post', reverse('edit-event', args=[event.id]), {'name': 'Renamed', 'description': 'New',
+                                                              'organizer': user.id}),
+            ('post', reverse('add-group'), {'name': 'New group', 'creator': user.id, 'price_limit': 20,
+                                            'currency': 'PLN', 'participants': [p.id for p in players[:3]]}),
+            ('post', reverse('add-exclusion', args=[group.id]), {'giver': players[1].id,
+                                                                 'receiver': players[2].id}),
+            ('post', reverse('edit-player', args=[player.id]), {'first_name': 'Renamed', 'last_name': 'Player',
+                                                                'email': 'renamed@example.com',
+                                                                'creator': user.id}),
+            ('post', reverse('edit-group', args=[group.id]), {
+                'name': 'Renamed', 'creator': user.id, 'price_limit': 60, 'currency': 'EUR',
+                'participants': [p.id for p in group.participants.all()]}),
+            ('post', reverse('api-group-members', args=[group.id]), {'remove': [players[0].id]}),
+            ('post', reverse('delete-player', args=[player.id]), None),
+            ('post', reverse('delete-group', args=[group.id]), None),
+            ('post', reverse('delete-event', args=[event.id]), None),
+            ('get', reverse('import-players'), None),
+            ('post', reverse('import-players'), {
+                'file': SimpleUploadedFile('players.csv', b'first_name,last_name,email\n' + b''.join(
+                    f'Imported,{i},imported{i}@example.com\n'.encode() for i in range(scale + 3))),
+                'group_name': 'Imported', 'price_limit': 20, 'currency': 'PLN'}),
+            ('post', reverse('add-player'), {'first_name': 'New', 'last_name': 'Player',
+                                             'email': 'new.player@example.com', 'creator': user.id}),
+            ('delete', reverse('api-participants'), {'ids': [p.id for p in players[3:-1]]}),
+            ('post', reverse('change-password'), {'old_password': 'testpassword',
+                                                  'new_password1': 'Secret-Santa-123',
+                                                  'new_password2': 'Secret-Santa-123'}),
+            ('get', reverse('logout'), None),
+            ('post', reverse('login'), {'username': f'user{scale}', 'password': 'Secret-Santa-123'}),
+            ('post', reverse('register'), {'username': f'new{scale}', 'email': 'new@example.com',
+                                           'first_name': 'New', 'last_name': 'User',
+                                           'password1': 'Secret-Santa-123', 'password2': 'Secret-Santa-123'}),
+            ('post', reverse('delete_account', args=[user.id]), None),
+        ]
+
+    def run_requests(self, scale):
+        counts = []
+        for method, url, data in self.requests(scale):
+            if url.startswith('/api/') and method != 'get':
+                response = getattr(self.client, method)(url, data, content_type='application/json')
+            else:
+                response = getattr(self.client, method)(url, data)
+            self.assertIn(response.status_code, (200, 201, 202, 302), url)
+            assert_query_budget(response)
+            counts.append((url.split('/')[1], response.wsgi_request.query_stats.budgeted))
+        return counts
+
+    def test_views_stay_within_budget(self):
+        self.run_requests(5)
+
+    def test_query_counts_do_not_depend_on_data(self):
+        small = self.run_requests(2)
+        cache.clear()
+        large = self.run_requests(8)
+        self.assertEqual(small, large)
+
+    def test_every_url_has_a_budget(self):
+        names = [pattern.name for pattern in get_resolver().url_patterns if getattr(pattern, 'name', None)]
+        self.assertEqual(sorted(names), sorted(QUERY_BUDGETS))
+
+    def test_over_budget_fails(self):
+        self.seed(2)
+        response = self.client.get(reverse('base'))
+
+        with mock.patch.dict(QUERY_BUDGETS, {'base': 1}):
+            with self.assertRaisesMessage(AssertionError, 'base executed'):
+                assert_query_budget(response)
+
+    def test_duplicate_queries_are_counted(self):
+        stats = QueryStats()
+        with connection.execute_wrapper(stats):
+            for pk in (1, 1, 2):
+                list(Participant.objects.filter(pk=pk))
+
+        self.assertEqual((stats.count, stats.duplicates, stats.similar), (3, 1, 1))
+
+    def test_rows_saved_one_by_one_are_not_budgeted(self):
+        stats = QueryStats()
+        with connection.execute_wrapper(stats):
+            list(Participant.objects.all())
+            with row_by_row():
+                for pk in (1, 2):
+                    list(Participant.objects.filter(pk=pk))
+
+        self.assertEqual((stats.count, stats.per_row, stats.budgeted), (3, 2, 1))
+
+    @override_settings(DEBUG=True)
+    def test_debug_headers(self):
+        self.seed(1)
+        response = self.client.get(reverse('base'))
+
+        self.assertEqual(response['X-Query-Count'], str(response.wsgi_request.query_stats.count))
+        self.assertEqual(response['X-Query-Budget'], str(QUERY_BUDGETS['base']))
+        self.assertIn('X-Query-Duplicates', response)
+        self.assertIn('X-Query-Time-Ms', response)
+
+    def test_no_headers_without_debug(self):
+        response = self.client.get(reverse('index'))
+
+        self.assertNotIn('X-Query-Count', response)
+
+
+### IMPORT SECTION ###
+
+
+class ImportPlayersTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='testuser', password='testpassword')
+        self.client.login(username='testuser', password='testpassword')
+        Participant.objects.create(first_name='Existing', last_name='Player', email='Existing@Example.com',
+                                   creator=self.user)
+
+    def csv_file(self, rows, header='first_name,last_name,email,wishlist'):
+        content = '\n'.join([header] + rows) + '\n'
+        return SimpleUploadedFile('players.csv', content.encode('utf-8'), content_type='text/csv')
+
+    def players(self, count):
+        return [f'Player,{i},player{i}@example.com,Books' for i in range(count)]
+
+    def test_import_players(self):
+        rows = self.players(3) + [
+            'Copy,Player,existing@example.com,',  # already on the list
+            'Again,Player,PLAYER0@example.com,',  # repeated in the file
+            'Broken,Player,not-an-email,',
+            ',Nameless,nameless@example.com,',
+        ]
+
+        response = self.client.post(reverse('import-players'), {'file': self.csv_file(rows), 'currency': 'PLN'})
+
+        report = response.context['report']
+        self.assertEqual((report.created, report.duplicates), (3, 2))
+        self.assertEqual([line for line, message in report.errors], [7, 8])
+        self.assertEqual(Participant.objects.filter(creator=self.user).count(), 4)
+        self.assertEqual(Participant.objects.get(email='player1@example.com').wishlist, 'Books')
+        self.assertFalse(Group.objects.exists())
+
+    def test_import_is_batched(self):
+        with CaptureQueriesContext(connection) as queries:
+            report = import_participants(self.user, ['first_name,last_name,email'] + [
+                f'Player,{i},player{i}@example.com' for i in range(25)], batch_size=10)
+
+        inserts = [q['sql'] for q in queries.captured_queries
+                   if q['sql'].startswith('INSERT INTO "secret_santa_participant"')]
+        selects = [q['sql'] for q in queries.captured_queries if q['sql'].startswith('SELECT')]
+        self.assertEqual(report.created, 25)
+        self.assertEqual(len(inserts), 3)
+        self.assertEqual(len(selects), 1)  # existing emails of the creator
+
+    def test_import_creates_group(self):
+        rows = self.players(2) + ['Copy,Player,existing@example.com,']
+
+        response = self.client.post(reverse('import-players'), {
+            'file': self.csv_file(rows), 'group_name': 'Company', 'price_limit': 30, 'currency': 'EUR'})
+
+        group = response.context['report'].group
+        self.assertEqual((group.name, group.price_limit, group.currency, group.creator),
+                         ('Company', 30, 'EUR', self.user))
+        self.assertEqual(set(group.participants.values_list('email', flat=True)),
+                         {'player0@example.com', 'player1@example.com', 'Existing@Example.com'})
+
+    def test_import_invalidates_the_cache(self):
+        cache.set(cache_key('player0@example.com'), 'stale')
+        cache.set(players_stamp_key(self.user.id), 1, None)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            import_participants(self.user, ['first_name,last_name,email'] + [
+                f'Player,{i},player{i}@example.com' for i in range(3)], group_name='Office', price_limit=20)
+
+        self.assertIsNone(cache.get(cache_key('player0@example.com')))
+        self.assertNotEqual(cache.get(players_stamp_key(self.user.id)), 1)
+
+    def test_too_small_group_rolls_back(self):
+        response = self.client.post(reverse('import-players'), {
+            'file': self.csv_file(self.players(2)), 'group_name': 'Pair', 'price_limit': 30, 'currency': 'PLN'})
+
+        self.assertContains(response, 'Group must contain at least 3 players.')
+        self.assertEqual(Participant.objects.count(), 1)
+        self.assertFalse(Group.objects.exists())
+
+    def test_missing_columns(self):
+        response = self.client.post(reverse('import-players'), {
+            'file': self.csv_file(['Player,0'], header='first_name,last_name'), 'currency': 'PLN'})
+
+        self.assertContains(response, 'Missing CSV columns: email.')
+        self.assertEqual(Participant.objects.count(), 1)
+
+    def test_management_command(self):
+        with tempfile.NamedTemporaryFile('w', suffix='.csv', delete=False) as players:
+            players.write('\n'.join(['First_Name,Last_Name,Email'] + [
+                f'Player,{i},player{i}@example.com' for i in range(4)]))
+        self.addCleanup(os.remove, players.name)
+        out = io.StringIO()
+
+        call_command('import_participants', 'testuser', players.name, '--group', 'Office',
+                     '--price-limit', '25', stdout=out)
+
+        self.assertIn('Added 4, already existing 0, skipped 0.', out.getvalue())
+        self.assertEqual(Group.objects.get(name='Office').participants.count(), 4)
+
+
+### EXPORT SECTION ###
+
+
+class ExportTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='testuser', password='testpassword')
+        self.client.login(username='testuser', password='testpassword')
+        self.players = [
+            Participant.objects.create(first_name=f'Player {i}', last_name='Test', email=f'player{i}@example.com',
+                                       wishlist=f'Gift {i}' if i else None, creator=self.user)
+            for i in range(3)
+        ]
+        self.group = Group.objects.create(name='Office', creator=self.user, price_limit=50, currency='EUR')
+        self.event = Event.objects.create(name='Christmas', organizer=self.user)
+        self.draw = self.make_draw(self.event, '2099-12-24')
+
+    def make_draw(self, event, day):
+        draw = Draw.objects.create(event=event, group=self.group, date=day, price_limit=50, currency='EUR')
+        GiftPair.objects.bulk_create([
+            GiftPair(draw=draw, giver=giver, receiver=self.players[(i + 1) % 3])
+            for i, giver in enumerate(self.players)
+        ])
+        return draw
+
+    def content(self, response):
+        return b''.join(response.streaming_content).decode()
+
+    def test_game_csv(self):
+        response = self.client.get(reverse('export-game', args=[self.draw.id]))
+
+        self.assertTrue(response.streaming)
+        self.assertEqual(response['Content-Type'], 'text/csv')
+        self.assertIn(f'filename="game-{self.draw.id}.csv"', response['Content-Disposition'])
+        rows = list(csv.DictReader(io.StringIO(self.content(response))))
+        self.assertEqual(len(rows), 3)
+        self.assertEqual(rows[0], {
+            'game': str(self.draw.id), 'event': 'Christmas', 'group': 'Office', 'date': '2099-12-24',
+            'price_limit': '50.00', 'currency': 'EUR',
+            'giver_name': 'Player 0 Test', 'giver_email': 'player0@example.com', 'giver_wishlist': '',
+            'receiver_name': 'Player 1 Test', 'receiver_email': 'player1@example.com', 'receiver_wishlist': 'Gift 1',
+        })
+
+    def test_event_jsonl(self):
+        other_event = Event.objects.create(name='Birthday', organizer=self.user)
+        self.make_draw(other_event, '2099-06-01')
+        second = self.make_draw(self.event, '2100-12-24')
+
+        response = self.client.get(reverse('export-event', args=[self.event.id]), {'format': 'jsonl'})
+
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+        rows = [json.loads(line) for line in self.content(response).splitlines()]
+        self.assertEqual([row['game'] for row in rows], [self.draw.id] * 3 + [second.id] * 3)
+        self.assertEqual({row['event'] for row in rows}, {'Christmas'})
+
+    def test_all_games_of_the_user(self):
+        other = User.objects.create_user(username='otheruser', password='testpassword')
+        Event.objects.create(name='Not mine', organizer=other)
+        self.make_draw(self.event, '2000-12-24')
+
+        response = self.client.get(reverse('export-all'))
+
+        rows = list(csv.DictReader(io.StringIO(self.content(response))))
+        self.assertEqual(len(rows), 6)
+        self.assertEqual(rows[0]['date'], '2000-12-24')
+
+    def test_games_of_other_users_are_not_exported(self):
+        other = User.objects.create_user(username='otheruser', password='testpassword')
+        self.client.login(username='otheruser', password='testpassword')
+
+        self.assertEqual(self.client.get(reverse('export-game', args=[self.draw.id])).status_code, 404)
+        self.assertEqual(self.client.get(reverse('export-event', args=[self.event.id])).status_code, 404)
+        self.assertEqual(self.content(self.client.get(reverse('export-all'))).splitlines(),
+                         [','.join(EXPORT_COLUMNS)])
+
+    def test_login_required(self):
+        self.client.logout()
+        response = self.client.get(reverse('export-all'))
+        self.assertRedirects(response, reverse('login'), fetch_redirect_response=False)
+
+    def test_unknown_format(self):
+        response = self.client.get(reverse('export-all'), {'format': 'xlsx'})
+        self.assertContains(response, 'error: Unknown export format')
+
+    def test_rows_are_fetched_in_chunks(self):
+        with mock.patch('secret_santa.exports.EXPORT_CHUNK_SIZE', 2):
+            with mock.patch('django.db.models.query.QuerySet.iterator', autospec=True,
+                            side_effect=lambda queryset, chunk_size: iter(list(queryset))) as iterator:
+                rows = list(export_rows(GiftPair.objects.all()))
+
+        self.assertEqual(len(rows), 3)
+        self.assertEqual(iterator.call_args.kwargs['chunk_size'], 2)
+
+
+### API SECTION ###
+
+
+class ApiTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='testuser', password='testpassword')
+        self.client.login(username='testuser', password='testpassword')
+        self.players = [
+            Participant.objects.create(first_name=f'Player {i}', last_name='Test', email=f'player{i}@example.com',
+                                       creator=self.user)
+            for i in range(4)
+        ]
+        self.group = Group.objects.create(name='Office', creator=self.user, price_limit=50, currency='EUR')
+        self.group.participants.add(*self.players[:3])
+        self.event = Event.objects.create(name='Christmas', organizer=self.user)
+
+    def send(self, method, url, data):
+        return getattr(self.client, method)(url, data, content_type='application/json')
+
+    def test_login_required(self):
+        self.client.logout()
+        response = self.client.get(reverse('api-participants'))
+        self.assertEqual(response.status_code, 401)
+        self.assertEqual(response.json(), {'error': 'Authentication required.'})
+
+    def test_participants_are_paginated_with_selected_fields(self):
+        Participant.objects.create(first_name='Other', last_name='User', email='other@example.com',
+                                   creator=User.objects.create_user(username='otheruser'))
+
+        response = self.client.get(reverse('api-participants'), {'limit': 3, 'fields': 'id,email'})
+        data = response.json()
+        self.assertEqual(data['results'], [{'id': p.id, 'email': p.email} for p in self.players[:3]])
+
+        data = self.client.get(data['next']).json()
+        self.assertEqual(data['results'], [{'id': self.players[3].id, 'email': 'player3@example.com'}])
+        self.assertIsNone(data['next'])
+
+    def test_invalid_list_parameters(self):
+        response = self.client.get(reverse('api-participants'), {'fields': 'id,password'})
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json()['error'], 'Unknown fields: password.')
+        self.assertEqual(self.client.get(reverse('api-participants'), {'limit': 501}).status_code, 400)
+        self.assertEqual(self.client.get(reverse('api-participants'), {'cursor': 'x'}).status_code, 400)
+
+    def test_batch_create_participants(self):
+        response = self.send('post', reverse('api-participants'), {'participants': [
+            {'first_name': 'New', 'last_name': f'{i}', 'email': f'new{i}@example.com'} for i in range(3)]})
+
+        self.assertEqual(response.status_code, 201)
+        created = Participant.objects.filter(email__startswith='new').order_by('id')
+        self.assertEqual(response.json(), {'ids': [p.id for p in created]})
+        self.assertTrue(all(p.creator == self.user for p in created))
+
+    def test_batch_create_is_all_or_nothing(self):
+        response = self.send('post', reverse('api-participants'), {'participants': [
+            {'first_name': 'New', 'last_name': 'Player', 'email': 'new@example.com'},
+            {'first_name': 'Bad', 'last_name': 'Player', 'email': 'not-an-email'},
+        ]})
+
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(list(response.json()['errors']), ['1'])
+        self.assertIn('email', response.json()['errors']['1'])
+        self.assertFalse(Participant.objects.filter(email='new@example.com').exists())
+
+    def test_batch_rejects_repeated_emails(self):
+        response = self.send('post', reverse('api-participants'), {'participants': [
+            {'first_name': 'New', 'last_name': 'Player', 'email': 'new@example.com'},
+            {'first_name': 'Other', 'last_name': 'Player', 'email': 'other@example.com'},
+            {'first_name': 'Copy', 'last_name': 'Player', 'email': 'NEW@example.com'},
+        ]})
+
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json()['errors'], {'2': {'email': ['Repeated in this batch.']}})
+        self.assertFalse(Participant.objects.filter(email__iexact='new@example.com').exists())
+
+    def test_batch_is_limited(self):
+        with mock.patch('secret_santa.api.API_MAX_BATCH', 2):
+            response = self.send('post', reverse('api-participants'), {'participants': [{}, {}, {}]})
+        self.assertEqual(response.status_code, 413)
+
+    def test_invalid_json(self):
+        response = self.client.post(reverse('api-participants'), 'not json', content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json()['error'], 'Request body is not valid JSON.')
+
+    def test_batch_update_participants(self):
+        draw = Draw.objects.create(event=self.event, group=self.group, date='2999-12-24', price_limit=50)
+        GiftPair.objects.create(draw=draw, giver=self.players[0], receiver=self.players[1])
+        self.client.post(reverse('email-lookup'), {'email': 'player0@example.com'})
+
+        response = self.send('patch', reverse('api-participants'), {'participants': [
+            {'id': self.players[1].id, 'wishlist': 'Books'},
+            {'id': self.players[2].id, 'email': 'changed@example.com'},
+        ]})
+
+        self.assertEqual(response.status_code, 200)
+        self.players[1].refresh_from_db()
+        self.players[2].refresh_from_db()
+        self.assertEqual((self.players[1].first_name, self.players[1].wishlist), ('Player 1', 'Books'))
+        self.assertEqual(self.players[2].email, 'changed@example.com')
+        # the giver of the changed receiver sees the new wishlist
+        self.assertContains(self.client.post(reverse('email-lookup'), {'email': 'player0@example.com'}), 'Books')
+
+    def test_batch_update_of_unknown_participant(self):
+        other = Participant.objects.create(first_name='Other', last_name='User', email='other@example.com',
+                                           creator=User.objects.create_user(username='otheruser'))
+
+        response = self.send('patch', reverse('api-participants'), {'participants': [
+            {'id': other.id, 'first_name': 'Mine'}]})
+
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json()['errors'], {'0': {'id': ['Unknown participant.']}})
+        other.refresh_from_db()
+        self.assertEqual(other.first_name, 'Other')
+
+    def test_batch_delete_participants(self):
+        other = Participant.objects.create(first_name='Other', last_name='User', email='other@example.com',
+                                           creator=User.objects.create_user(username='otheruser'))
+
+        response = self.send('delete', reverse('api-participants'), {'ids': [self.players[3].id, other.id]})
+
+        self.assertEqual(response.json(), {'deleted': 1})
+        self.assertFalse(Participant.objects.filter(pk=self.players[3].id).exists())
+        self.assertTrue(Participant.objects.filter(pk=other.id).exists())
+
+    def test_create_group_needs_three_players(self):
+        response = self.send('post', reverse('api-groups'), {
+            'name': 'Pair', 'price_limit': 20, 'currency': 'PLN', 'participants': [p.id for p in self.players[:2]]})
+
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json()['errors'], {'__all__': ['Group must contain at least 3 players.']})
+
+        response = self.send('post', reverse('api-groups'), {
+            'name': 'Trio', 'price_limit': 20, 'currency': 'PLN', 'participants': [p.id for p in self.players[:3]]})
+        self.assertEqual(response.status_code, 201)
+        group = Group.objects.get(pk=response.json()['id'])
+        self.assertEqual((group.name, group.creator, group.participants.count()), ('Trio', self.user, 3))
+
+    def test_groups_list_participants(self):
+        response = self.client.get(reverse('api-groups'))
+        self.assertEqual(response.json()['results'], [{
+            'id': self.group.id, 'name': 'Office', 'price_limit': '50.00', 'currency': 'EUR',
+            'participants': [p.id for p in self.players[:3]],
+        }])
+
+    def test_group_members(self):
+        url = reverse('api-group-members', args=[self.group.id])
+
+        response = self.send('post', url, {'add': [self.players[3].id], 'remove': [self.players[0].id]})
+        self.assertEqual(response.json()['participants'], [p.id for p in self.players[1:]])
+        self.assertEqual(set(self.group.participants.all()), set(self.players[1:]))
+
+        response = self.send('post', url, {'remove': [self.players[1].id]})
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(self.group.participants.count(), 3)
+
+    def test_group_members_of_other_users(self):
+        self.client.login(username=User.objects.create_user(username='otheruser', password='testpassword').username,
+                          password='testpassword')
+        response = self.send('post', reverse('api-group-members', args=[self.group.id]), {'remove': []})
+        self.assertEqual(response.status_code, 404)
+
+    def test_run_draw(self):
+        response = self.send('post', reverse('api-draws'), {
+            'event': self.event.id, 'group': self.group.id, 'date': '2999-12-24'})
+
+        self.assertEqual(response.status_code, 201)
+        draw = Draw.objects.get()
+        self.assertEqual(response.json(), {'id': draw.id})
+        self.assertEqual(response['Location'], reverse('api-draw', args=[draw.id]))
+        self.assertEqual(OutboxEmail.objects.filter(draw=draw).count(), 3)
+
+        data = self.client.get(reverse('api-draw', args=[draw.id])).json()
+        self.assertEqual((data['date'], data['currency'], len(data['pairs'])), ('2999-12-24', 'EUR', 3))
+        self.assertEqual(self.client.get(reverse('api-draws')).json()['results'][0]['id'], draw.id)
+
+    def test_schedule_draw(self):
+        response = self.send('post', reverse('api-draws'), {
+            'event': self.event.id, 'group': self.group.id, 'date': '2999-12-24', 'run_at': '2999-12-01 09:00'})
+
+        self.assertEqual(response.status_code, 202)
+        scheduled = ScheduledDraw.objects.get()
+        self.assertEqual(response.json()['scheduled'], scheduled.id)
+        self.assertEqual((scheduled.status, scheduled.group, scheduled.draw), (ScheduledDraw.PENDING, self.group, None))
+        self.assertFalse(Draw.objects.exists())
+        self.assertFalse(OutboxEmail.objects.exists())
+
+    def test_run_draw_validation(self):
+        response = self.send('post', reverse('api-draws'), {'event': self.event.id, 'date': '2999-12-24'})
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('group', response.json()['errors'])
+
+        Exclusion.objects.create(group=self.group, giver=self.players[0], receiver=self.players[1])
+        Exclusion.objects.create(group=self.group, giver=self.players[0], receiver=self.players[2])
+        response = self.send('post', reverse('api-draws'), {
+            'event': self.event.id, 'group': self.group.id, 'date': '2999-12-24'})
+        self.assertEqual(response.status_code, 409)
+        self.assertFalse(Draw.objects.exists())
+
+
+### ASYNC VIEWS SECTION ###
+
+
+class AsyncViewTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='testuser', password='testpassword', email='giver@example.com')
+        event = Event.objects.create(name='Christmas', organizer=self.user)
+        group = Group.objects.create(name='Office', creator=self.user, price_limit=50)
+        giver = Participant.objects.create(first_name='Giver', last_name='Test', email='giver@example.com',
+                                           creator=self.user)
+        receiver = Participant.objects.create(first_name='Receiver', last_name='Test', email='receiver@example.com',
+                                              wishlist='Socks', creator=self.user)
+        draw = Draw.objects.create(event=event, group=group, date='2999-12-24', price_limit=50)
+        GiftPair.objects.create(draw=draw, giver=giver, receiver=receiver)
+
+    def test_read_views_are_async(self):
+        for name in ['index', 'email-lookup', 'email-lookup-archive', 'my-gift-pairs', 'my-gift-pairs-archive']:
+            self.assertTrue(asyncio.iscoroutinefunction(resolve(reverse(name)).func), name)
+
+    def test_middleware_stack_stays_async(self):
+        modes = []
+        adapt_method_mode = BaseHandler.adapt_method_mode
+
+        def spy(handler, is_async, *args, **kwargs):
+            modes.append(is_async)
+            return adapt_method_mode(handler, is_async, *args, **kwargs)
+
+        with mock.patch.object(BaseHandler, 'adapt_method_mode', spy):
+            ASGIHandler()
+
+        # a sync only middleware would make Django run the views below it in a thread
+        self.assertTrue(modes)
+        self.assertTrue(all(modes))
+
+    async def test_lookup_over_asgi(self):
+        with self.settings(DEBUG=True):
+            response = await self.async_client.post(reverse('email-lookup'), 'email=GIVER%40example.com',
+                                                    content_type='application/x-www-form-urlencoded')
+
+        self.assertContains(response, 'Receiver Test')
+        self.assertContains(response, 'Socks')
+        self.assertEqual(response['X-Query-Count'], '2')
+
+    async def test_my_gift_pairs_over_asgi(self):
+        await sync_to_async(self.async_client.force_login)(self.user)
+
+        response = await self.async_client.get(reverse('my-gift-pairs'))
+        self.assertContains(response, 'Receiver Test')
+
+        response = await self.async_client.get(reverse('index'))
+        self.assertTemplateUsed(response, 'index.html')
+
+
+### READ REPLICA SECTION ###
+
+
+class ReplicaRouterTests(TestCase):
+    """
+    Reads of read-only views go to a second SQLite database standing in for the replica.
+    Rows are created on the primary only, so the replica behaves like one that lags behind.
+    """
+    databases = {'default', 'replica'}
+
+    @classmethod
+    def setUpClass(cls):
+        cls.replica_dir = tempfile.TemporaryDirectory()
+        connections.settings['replica'] = {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': os.path.join(cls.replica_dir.name, 'replica.sqlite3'),
+        }
+        call_command('migrate', database='replica', verbosity=0)
+        super().setUpClass()
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        connections['replica'].close()
+        del connections['replica']
+        del connections.settings['replica']
+        cls.replica_dir.cleanup()
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='organizer', password='testpassword')
+        event = Event.objects.create(name='Christmas', organizer=self.user)
+        group = Group.objects.create(name='Office', creator=self.user, price_limit=50)
+        giver = Participant.objects.create(first_name='Giver', last_name='Test', email='giver@example.com',
+                                           creator=self.user)
+        receiver = Participant.objects.create(first_name='Receiver', last_name='Test', email='receiver@example.com',
+                                              creator=self.user)
+        draw = Draw.objects.create(event=event, group=group, date='2999-12-24', price_limit=50)
+        GiftPair.objects.create(draw=draw, giver=giver, receiver=receiver)
+
+    def lookup(self):
+        return self.client.post(reverse('email-lookup'), {'email': 'giver@example.com'})
+
+    def test_without_replica_everything_uses_default(self):
+        self.assertContains(self.lookup(), 'Receiver Test')
+        self.assertFalse(GiftPair.objects.using('replica').exists())
+
+    @override_settings(REPLICA_DATABASE='replica')
+    def test_lookup_reads_from_replica(self):
+        with CaptureQueriesContext(connections['replica']) as replica_queries:
+            response = self.lookup()
+
+        self.assertNotContains(response, 'Receiver Test')  # the replica has not received the game yet
+        self.assertTrue(replica_queries.captured_queries)
+        self.assertNotIn(PIN_COOKIE, response.cookies)
+
+    @override_settings(REPLICA_DATABASE='replica')
+    async def test_async_lookup_reads_from_replica(self):
+        response = await self.async_client.post(reverse('email-lookup'), 'email=giver%40example.com',
+                                                content_type='application/x-www-form-urlencoded')
+        self.assertNotContains(response, 'Receiver Test')
+
+    @override_settings(REPLICA_DATABASE='replica')
+    def test_write_pins_user_to_primary(self):
+        response = self.client.post(reverse('login'), {'username': 'organizer', 'password': 'testpassword'})
+        self.assertIn(PIN_COOKIE, response.cookies)
+        self.assertEqual(response.cookies[PIN_COOKIE]['max-age'], REPLICA_LAG_SECONDS)
+
+        # the session exists on the primary only
+        response = self.client.get(reverse('base'))
+        self.assertContains(response, 'Christmas')
+        self.assertContains(self.lookup(), 'Receiver Test')
+
+        self.client.cookies[PIN_COOKIE] = str(time.time() - 1)
+        cache.clear()
+        self.assertNotContains(self.lookup(), 'Receiver Test')
+
+    @override_settings(REPLICA_DATABASE='replica')
+    def test_export_streams_from_replica(self):
+        self.client.post(reverse('login'), {'username': 'organizer', 'password': 'testpassword'})
+        response = self.client.get(reverse('export-all'))
+        self.assertIn('Receiver Test', b''.join(response.streaming_content).decode())
+
+        # sessions are copied to the replica before the user is unpinned
+        session = self.client.session
+        type(session).get_model_class().objects.using('replica').create(
+            session_key=session.session_key, session_data=session.encode(dict(session)),
+            expire_date=timezone.now() + timezone.timedelta(days=1))
+        User.objects.using('replica').create(id=self.user.id, username='organizer', password=self.user.password)
+        del self.client.cookies[PIN_COOKIE]
+        response = self.client.get(reverse('export-all'))
+        self.assertEqual(b''.join(response.streaming_content).decode().count('\n'), 1)  # header only
+
+    @override_settings(REPLICA_DATABASE='replica')
+    def test_writes_go_to_primary(self):
+        self.client.post(reverse('login'), {'username': 'organizer', 'password': 'testpassword'})
+        self.client.post(reverse('add-player'), {'first_name': 'New', 'last_name': 'Player',
+                                                 'email': 'new@example.com', 'creator': self.user.id})
+
+        self.assertTrue(Participant.objects.using('default').filter(email='new@example.com').exists())
+        self.assertFalse(Participant.objects.using('replica').exists())
+
+    @override_settings(REPLICA_DATABASE='replica')
+    def test_pinned_lookup_skips_cache_of_replica_rows(self):
+        self.assertNotContains(self.lookup(), 'Receiver Test')
+
+        self.client.cookies[PIN_COOKIE] = str(time.time() + REPLICA_LAG_SECONDS)
+        self.assertContains(self.lookup(), 'Receiver Test')
+
+
+### DASHBOARD FRAGMENTS SECTION ###
+
+
+class DashboardFragmentTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='testuser', password='testpassword')
+        self.client.login(username='testuser', password='testpassword')
+        self.players = [
+            Participant.objects.create(first_name=f'Player {i}', last_name='Test', email=f'player{i}@example.com',
+                                       creator=self.user)
+            for i in range(3)
+        ]
+        self.event = Event.objects.create(name='Christmas', description='', organizer=self.user)
+        self.group = Group.objects.create(name='Office', creator=self.user, price_limit=50)
+        self.group.participants.add(*self.players)
+        draw = Draw.objects.create(event=self.event, group=self.group, date='2099-12-24', price_limit=50)
+        GiftPair.objects.bulk_create([
+            GiftPair(draw=draw, giver=giver, receiver=self.players[(i + 1) % 3])
+            for i, giver in enumerate(self.players)
+        ])
+
+    def dashboard(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('base'))
+        sql = [query['sql'] for query in queries.captured_queries]
+        return response, sql
+
+    def test_repeat_render_skips_pairs_and_members(self):
+        response, sql = self.dashboard()
+        self.assertContains(response, 'Pair: Player 0 Test -> Player 1 Test')
+        self.assertTrue(any('secret_santa_giftpair' in query for query in sql))
+        self.assertTrue(any('secret_santa_group_participants' in query for query in sql))
+
+        response, sql = self.dashboard()
+        self.assertContains(response, 'Pair: Player 0 Test -> Player 1 Test')
+        self.assertContains(response, 'Player 2 Test | player2@example.com')
+        self.assertFalse(any('secret_santa_giftpair' in query for query in sql))
+        self.assertFalse(any('secret_santa_group_participants' in query for query in sql))
+
+    def test_card_evicted_before_render_still_shows_pairs(self):
+        self.dashboard()
+
+        def evicted_after_check(name, versions):
+            found = cached_fragments(name, versions)
+            cache.delete_many([make_template_fragment_key(name, [version]) for version in found])
+            return found
+
+        with mock.patch('secret_santa.views.cached_fragments', side_effect=evicted_after_check):
+            response, sql = self.dashboard()
+        self.assertContains(response, 'Pair: Player 0 Test -> Player 1 Test')
+
+        response, sql = self.dashboard()
+        self.assertContains(response, 'Pair: Player 0 Test -> Player 1 Test')
+        self.assertFalse(any('secret_santa_giftpair' in query for query in sql))
+
+    def test_members_changed_outside_the_form(self):
+        extra = Participant.objects.create(first_name='New', last_name='Player', email='new@example.com',
+                                           creator=self.user)
+        self.dashboard()
+        self.group.participants.add(extra)  # e.g. in the admin
+
+        response, sql = self.dashboard()
+        members = response.content.decode().split('Your created players')[0]
+        self.assertIn('New Player | new@example.com', members)
+
+    def test_process_local_cache_is_reported(self):
+        locmem = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}
+        shared = {'default': {'BACKEND': 'django.core.cache.backends.db.DatabaseCache', 'LOCATION': 'cache'}}
+        with override_settings(DEBUG=False, CACHES=locmem):
+            self.assertEqual([error.id for error in check_shared_cache(None)], ['secret_santa.W001'])
+        with override_settings(DEBUG=False, CACHES=shared):
+            self.assertEqual(check_shared_cache(None), [])
+
+    def test_player_edit_changes_cards_and_members(self):
+        self.dashboard()
+        self.client.post(reverse('edit-player', args=[self.players[1].id]), {
+            'first_name': 'Renamed', 'last_name': 'Test', 'email': 'player1@example.com', 'creator': self.user.id})
+
+        response, sql = self.dashboard()
+        self.assertContains(response, 'Pair: Player 0 Test -> Renamed Test')
+        self.assertContains(response, 'Renamed Test | player1@example.com')
+
+    def test_event_edit_changes_cards(self):
+        self.dashboard()
+        self.client.post(reverse('edit-event', args=[self.event.id]), {
+            'name': 'Winter party', 'description': 'Party', 'organizer': self.user.id})
+
+        response, sql = self.dashboard()
+        self.assertContains(response, 'Event: Winter party')
+
+    def test_group_members_change(self):
+        extra = Participant.objects.create(first_name='New', last_name='Player', email='new@example.com',
+                                           creator=self.user)
+        self.dashboard()
+        self.client.post(reverse('edit-group', args=[self.group.id]), {
+            'name': 'Office', 'price_limit': 50, 'currency': 'PLN', 'creator': self.user.id,
+            'participants': [extra.id] + [player.id for player in self.players[1:]]})
+
+        response, sql = self.dashboard()
+        members = response.content.decode().split('Your created players')[0]
+        self.assertIn('New Player | new@example.com', members)
+        self.assertNotIn('Player 0 Test | player0@example.com', members)
+        # the game was drawn before, so its card still shows the old pairs
+        self.assertContains(response, 'Pair: Player 0 Test -> Player 1 Test')
+
+    def test_player_delete_changes_cards_and_members(self):
+        self.dashboard()
+        self.client.post(reverse('delete-player', args=[self.players[2].id]))
+
+        response, sql = self.dashboard()
+        self.assertNotContains(response, 'Player 2 Test')
+
+    def test_api_batch_update_changes_cards(self):
+        self.dashboard()
+        self.client.patch(reverse('api-participants'),
+                          json.dumps({'participants': [{'id': self.players[1].id, 'first_name': 'Api'}]}),
+                          content_type='application/json')
+
+        response, sql = self.dashboard()
+        self.assertContains(response, 'Pair: Player 0 Test -> Api Test')
+
+
+### SMTP FAN-OUT SECTION ###
+
+
+class ParallelSmtpTests(TestCase):
+    def setUp(self):
+        self.server = SlowSMTPServer().__enter__()
+        self.addCleanup(self.server.__exit__)
+        settings = override_settings(
+            EMAIL_BACKEND='django.core.mail.backends.smtp.EmailBackend', EMAIL_HOST='127.0.0.1',
+            EMAIL_PORT=self.server.port, EMAIL_USE_TLS=False, EMAIL_HOST_USER='santa@example.com',
+            EMAIL_HOST_PASSWORD='', EMAIL_TIMEOUT=5, EMAIL_WORKERS=3, EMAIL_RATE_LIMIT=0)
+        settings.enable()
+        self.addCleanup(settings.disable)
+
+    def messages(self, count, reject=()):
+        recipients = [f'reject{i}@example.com' if i in reject else f'{i}@example.com' for i in range(count)]
+        return [build_message('Secret Santa', 'Hi', recipient) for recipient in recipients]
+
+    def test_workers_and_messages_per_connection_are_capped(self):
+        self.server.latency = 0.01
+        report = send_parallel(self.messages(30), messages_per_connection=4)
+        self.server.wait_idle()
+
+        self.assertEqual(len(report.sent), 30)
+        self.assertEqual(len(self.server.messages), 30)
+        self.assertEqual(self.server.peak_sessions, 3)
+        self.assertEqual(len(self.server.sessions), 8)
+        self.assertLessEqual(max(self.server.sessions), 4)
+
+    def test_failed_quit_at_the_connection_cap_does_not_stop_the_chunk(self):
+        self.server.broken_quit = True
+        report = send_messages(self.messages(5), messages_per_connection=2)
+        self.server.wait_idle()
+
+        self.assertEqual((len(report.sent), report.failed), (5, []))
+        self.assertEqual(len(self.server.messages), 5)
+        self.assertEqual(sorted(self.server.sessions), [1, 2, 2])
+
+    def test_parallel_is_faster_than_one_connection(self):
+        self.server.latency = 0.05
+        start = time.perf_counter()
+        send_messages(self.messages(12))
+        serial = time.perf_counter() - start
+
+        start = time.perf_counter()
+        report = send_parallel(self.messages(12))
+        parallel = time.perf_counter() - start
+
+        self.assertEqual(len(report.sent), 12)
+        self.assertLess(parallel, serial / 2)
+
+    def test_failures_are_reported_together(self):
+        report = send_parallel(self.messages(9, reject={1, 7}))
+
+        self.assertEqual(len(report.sent), 7)
+        self.assertEqual(sorted(report.failed_recipients), ['reject1@example.com', 'reject7@example.com'])
+        self.assertEqual(len(self.server.messages), 7)
+
+    def test_rate_limit_is_shared_by_workers(self):
+        start = time.perf_counter()
+        report = send_parallel(self.messages(6), rate=20)
+
+        self.assertEqual(len(report.sent), 6)
+        self.assertGreaterEqual(time.perf_counter() - start, 5 / 20)
+
+    def test_outbox_worker_sends_over_parallel_connections(self):
+        self.server.latency = 0.05
+        user = User.objects.create_user(username='testuser', password='testpassword')
+        event = Event.objects.create(name='Christmas', organizer=user)
+        group = Group.objects.create(name='Office', creator=user, price_limit=50)
+        group.participants.add(*[
+            Participant.objects.create(first_name=f'Player {i}', last_name='Test', email=f'player{i}@example.com',
+                                       creator=user)
+            for i in range(6)
+        ])
+        create_draw(event, group, '2099-12-24')
+
+        call_command('deliver_outbox', once=True, stdout=mock.Mock())
+        self.server.wait_idle()
+
+        self.assertEqual(OutboxEmail.objects.filter(status=OutboxEmail.SENT).count(), 6)
+        self.assertEqual(len(self.server.messages), 6)
+        self.assertGreater(self.server.peak_sessions, 1)
+
+
+### EVENT DRAW SECTION ###
+
+
+class EventDrawTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='testuser', password='testpassword')
+        self.client.login(username='testuser', password='testpassword')
+        self.event = Event.objects.create(name='Office party', organizer=self.user)
+
+    def make_groups(self, count, size=4):
+        groups = []
+        for g in range(count):
+            group = Group.objects.create(name=f'Team {g}', creator=self.user, price_limit=50, currency='PLN')
+            group.participants.add(*[
+                Participant.objects.create(first_name=f'Player {i}', last_name=f'Team {g}',
+                                           email=f'player{i}.team{g}.{self.event.id}@example.com', creator=self.user)
+                for i in range(size)
+            ])
+            groups.append(group)
+        self.event.groups.add(*groups)
+        return groups
+
+    def test_every_group_is_drawn(self):
+        groups = self.make_groups(3, size=5)
+        response = self.client.post(reverse('draw-event', args=[self.event.id]), {'date': '2999-12-24'})
+
+        self.assertContains(response, 'All groups of Office party are drawn!')
+        self.assertEqual(Draw.objects.filter(event=self.event).count(), 3)
+        for group in groups:
+            draw = Draw.objects.get(event=self.event, group=group)
+            pairs = list(draw.pairs.values_list('giver_id', 'receiver_id'))
+            players = set(group.participants.values_list('id', flat=True))
+            self.assertEqual({giver for giver, receiver in pairs}, players)
+            self.assertEqual({receiver for giver, receiver in pairs}, players)
+            self.assertTrue(all(giver != receiver for giver, receiver in pairs))
+            self.assertEqual(OutboxEmail.objects.filter(draw=draw).count(), 5)
+
+    def test_report_lists_every_group(self):
+        groups = self.make_groups(2, size=3)
+        report = draw_event(self.event, date(2999, 12, 24))
+
+        self.assertTrue(report.saved)
+        self.assertEqual([result['group'] for result in report.groups], groups)
+        self.assertEqual([result['players'] for result in report.groups], [3, 3])
+        self.assertEqual([result['draw'].group for result in report.groups], groups)
+        self.assertEqual(report.failed, [])
+
+    def test_nothing_is_saved_when_a_group_cannot_be_drawn(self):
+        groups = self.make_groups(3)
+        players = list(groups[1].participants.all())
+        for receiver in players[1:]:
+            Exclusion.objects.create(group=groups[1], giver=players[0], receiver=receiver)
+
+        response = self.client.post(reverse('draw-event', args=[self.event.id]), {'date': '2999-12-24'})
+
+        self.assertContains(response, 'Nothing was drawn')
+        self.assertFalse(Draw.objects.exists())
+        self.assertFalse(OutboxEmail.objects.exists())
+        report = response.context['report']
+        self.assertFalse(report.saved)
+        self.assertEqual([result['group'] for result in report.failed], [groups[1]])
+
+    def test_previous_pairs_are_avoided_in_every_group(self):
+        groups = self.make_groups(2)
+        first = draw_event(self.event, date(2998, 12, 24))
+        second = draw_event(self.event, date(2999, 12, 24), avoid_repeats=1)
+        for before, after in zip(first.groups, second.groups):
+            self.assertFalse(set(before['draw'].pairs.values_list('giver_id', 'receiver_id'))
+                             & set(after['draw'].pairs.values_list('giver_id', 'receiver_id')))
+
+    def test_query_count_does_not_depend_on_groups(self):
+        counts = []
+        for count in (2, 6):
+            Event.objects.filter(pk=self.event.pk).delete()
+            self.event = Event.objects.create(name='Office party', organizer=self.user)
+            self.make_groups(count)
+            draw_event(self.event, date(2998, 12, 24))
+            with CaptureQueriesContext(connection) as queries:
+                report = draw_event(self.event, date(2999, 12, 24), avoid_repeats=1)
+            self.assertTrue(report.saved)
+            counts.append(len(queries))
+        # backends that cannot return ids from bulk inserts save the draws one by one (INSERT and post_save)
+        per_draw = 0 if connection.features.can_return_rows_from_bulk_insert else 2
+        self.assertEqual(counts[1] - counts[0], (6 - 2) * per_draw)
+
+    def test_other_organizers_cannot_draw(self):
+        self.make_groups(1)
+        other = User.objects.create_user(username='other', password='testpassword')
+        self.client.force_login(other)
+        response = self.client.post(reverse('draw-event', args=[self.event.id]), {'date': '2999-12-24'})
+        self.assertEqual(response.status_code, 404)
+        self.assertFalse(Draw.objects.exists())
+
+
+### SCHEDULED DRAWS SECTION ###
+
+
+class ScheduledDrawTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='testuser', password='testpassword')
+        self.client.login(username='testuser', password='testpassword')
+        self.event = Event.objects.create(name='Test Event', organizer=self.user)
+        self.group = Group.objects.create(name='Test Group', creator=self.user, price_limit=50, currency='PLN')
+        self.players = [Participant.objects.create(first_name=letter, last_name='Player',
+                                                   email=f'{letter.lower()}@example.com', creator=self.user)
+                        for letter in 'ABCD']
+        self.group.participants.add(*self.players)
+
+    def schedule(self, minutes=-1, **kwargs):
+        return ScheduledDraw.objects.create(event=self.event, group=self.group, date='2999-12-24',
+                                            run_at=timezone.now() + timedelta(minutes=minutes), **kwargs)
+
+    def test_game_form_schedules_the_draw(self):
+        response = self.client.post(reverse('new-game'), {
+            'event': self.event.id, 'group': self.group.id, 'date': '2999-12-24',
+            'avoid_repeats': 2, 'run_at': '2999-12-01 09:00'})
+
+        self.assertContains(response, 'The draw is scheduled for 2999-12-01 09:00')
+        scheduled = ScheduledDraw.objects.get()
+        self.assertEqual(scheduled.status, ScheduledDraw.PENDING)
+        self.assertEqual(scheduled.avoid_repeats, 2)
+        self.assertFalse(Draw.objects.exists())
+
+    def test_time_in_the_past_is_rejected(self):
+        self.client.post(reverse('new-game'), {
+            'event': self.event.id, 'group': self.group.id, 'date': '2999-12-24', 'run_at': '2000-12-01 09:00'})
+        self.assertFalse(ScheduledDraw.objects.exists())
+        self.assertFalse(Draw.objects.exists())
+
+    def test_scheduler_runs_due_draws(self):
+        due = self.schedule()
+        later = self.schedule(minutes=60)
+
+        out = io.StringIO()
+        call_command('run_scheduled_draws', once=True, stdout=out)
+
+        due.refresh_from_db()
+        later.refresh_from_db()
+        self.assertIn('Drew 1, failed 0', out.getvalue())
+        self.assertEqual(due.status, ScheduledDraw.DONE)
+        self.assertEqual(due.draw.pairs.count(), 4)
+        self.assertEqual(OutboxEmail.objects.filter(draw=due.draw).count(), 4)
+        self.assertIsNotNone(due.finished_at)
+        self.assertIsNotNone(due.duration_ms)
+        self.assertEqual(later.status, ScheduledDraw.PENDING)
+
+    def test_infeasible_draw_is_recorded(self):
+        for receiver in self.players[1:]:
+            Exclusion.objects.create(group=self.group, giver=self.players[0], receiver=receiver)
+        scheduled = self.schedule()
+
+        self.assertEqual(run_batch(claim_due(10)), (0, 1))
+
+        scheduled.refresh_from_db()
+        self.assertEqual(scheduled.status, ScheduledDraw.FAILED)
+        self.assertIn('A Player', scheduled.error)
+        self.assertIsNone(scheduled.draw)
+        self.assertFalse(Draw.objects.exists())
+
+    def test_an_error_fails_only_its_draw(self):
+        scheduled = [self.schedule() for _ in range(3)]
+        real_create_draw = create_draw
+
+        def create_draw_failing_once(event, group, day, avoid_repeats=0):
+            if not create_draw_failing_once.failed:
+                create_draw_failing_once.failed = True
+                raise DatabaseError('database went away')
+            return real_create_draw(event, group, day, avoid_repeats)
+        create_draw_failing_once.failed = False
+
+        with mock.patch('secret_santa.scheduler.create_draw', create_draw_failing_once), \
+                self.assertLogs('secret_santa.scheduler', 'ERROR'):
+            self.assertEqual(run_batch(claim_due(10)), (2, 1))
+
+        statuses = [ScheduledDraw.objects.get(pk=s.pk) for s in scheduled]
+        self.assertEqual([s.status for s in statuses],
+                         [ScheduledDraw.FAILED, ScheduledDraw.DONE, ScheduledDraw.DONE])
+        self.assertEqual(statuses[0].error, 'database went away')
+        self.assertEqual(Draw.objects.count(), 2)
+
+    def test_deleted_group_does_not_stop_the_batch(self):
+        first, second = self.schedule(), self.schedule()
+        claimed = claim_due(10)
+        Group.objects.filter(pk=self.group.pk).delete()
+
+        with self.assertLogs('secret_santa.scheduler', 'ERROR'):
+            self.assertEqual(run_batch(claimed), (0, 2))
+        self.assertFalse(ScheduledDraw.objects.exists())
+        self.assertFalse(Draw.objects.exists())
+
+    def test_claimed_draws_are_not_claimed_again(self):
+        scheduled = [self.schedule() for _ in range(3)]
+
+        first = claim_due(2)
+        second = claim_due(2)
+
+        self.assertEqual(first, scheduled[:2])
+        self.assertEqual(second, scheduled[2:])
+        self.assertEqual(claim_due(2), [])
+
+    def test_stale_claims_are_run_again(self):
+        scheduled = self.schedule(status=ScheduledDraw.RUNNING, claimed_at=timezone.now() - timedelta(hours=1))
+        self.assertEqual(claim_due(10), [scheduled])
+
+
+### OFFLINE DRAW SECTION ###
+
+
+class RunDrawCommandTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='testuser', password='testpassword')
+        self.event = Event.objects.create(name='Company party', organizer=self.user)
+        self.group = Group.objects.create(name='Company', creator=self.user, price_limit=50, currency='PLN')
+        self.group.participants.add(*[
+            Participant.objects.create(first_name='Player', last_name=f'{i}', email=f'player{i}@example.com',
+                                       creator=self.user)
+            for i in range(10)
+        ])
+
+    def run_draw(self, *args):
+        out = io.StringIO()
+        call_command('run_draw', str(self.event.id), '2999-12-24', *args, stdout=out, stderr=io.StringIO())
+        return out.getvalue()
+
+    def test_group_is_drawn_in_chunks(self):
+        with CaptureQueriesContext(connection) as queries:
+            out = self.run_draw('--group', str(self.group.id), '--chunk-size', '4')
+
+        inserts = [q['sql'] for q in queries.captured_queries
+                   if q['sql'].startswith('INSERT INTO "secret_santa_giftpair"')]
+        self.assertEqual(len(inserts), 3)
+        draw = Draw.objects.get(event=self.event, group=self.group)
+        pairs = list(draw.pairs.values_list('giver_id', 'receiver_id'))
+        players = set(self.group.participants.values_list('id', flat=True))
+        self.assertEqual({giver for giver, receiver in pairs}, players)
+        self.assertEqual({receiver for giver, receiver in pairs}, players)
+        self.assertTrue(all(giver != receiver for giver, receiver in pairs))
+        self.assertEqual(OutboxEmail.objects.filter(draw=draw).count(), 10)
+        self.assertIn('save: 4/10', out)
+        self.assertIn('save: 10/10', out)
+        self.assertIn(f'Drew game {draw.id}: 10 players', out)
+
+    def test_emails_can_go_to_a_maildir(self):
+        maildir = tempfile.TemporaryDirectory()
+        self.addCleanup(maildir.cleanup)
+
+        out = self.run_draw('--group', str(self.group.id), '--no-outbox', '--maildir', maildir.name)
+
+        self.assertFalse(OutboxEmail.objects.exists())
+        messages = list(mailbox.Maildir(maildir.name))
+        self.assertEqual(len(messages), 10)
+        self.assertEqual(sorted(message['To'] for message in messages),
+                         sorted(f'player{i}@example.com' for i in range(10)))
+        self.assertIn('Queued 0 emails in the outbox, wrote 10 to the maildir.', out)
+
+    def test_players_can_come_from_a_file(self):
+        with tempfile.NamedTemporaryFile('w', suffix='.csv', delete=False) as players:
+            players.write('\n'.join(['first_name,last_name,email'] + [
+                f'Worker,{i},worker{i}@example.com' for i in range(5)]))
+        self.addCleanup(os.remove, players.name)
+
+        out = self.run_draw('--file', players.name, '--price-limit', '20')
+
+        group = Group.objects.get(creator=self.user, name=os.path.basename(players.name)[:-4])
+        self.assertIn(f'as group "{group.name}" (id {group.id})', out)
+        self.assertEqual(Draw.objects.get(event=self.event).group, group)
+        self.assertEqual(GiftPair.objects.filter(draw__group=group).count(), 5)
+
+    def test_impossible_draw_saves_nothing(self):
+        players = list(self.group.participants.all())
+        for receiver in players[1:]:
+            Exclusion.objects.create(group=self.group, giver=players[0], receiver=receiver)
+
+        with self.assertRaisesMessage(CommandError, f'{players[0].id} cannot give a gift to anyone.'):
+            self.run_draw('--group', str(self.group.id))
+        self.assertFalse(Draw.objects.exists())
@@ -1,16 +1,29 @@
+import asyncio
+import io
+from collections import defaultdict
 from datetime import date
-from django.http import HttpResponse
+from functools import partial, update_wrapper
+from asgiref.sync import sync_to_async
+from django.http import Http404, HttpResponse, JsonResponse, StreamingHttpResponse
 from django.shortcuts import get_object_or_404, redirect, render
 from django.urls import reverse_lazy
 from django.views import View
-from .forms import (EmailLookupForm, EventForm,
+from .forms import (EmailLookupForm, EventDrawForm, EventForm, ExclusionForm,
                     GameForm, GroupForm, ParticipantForm,
-                    QucikGameForm, RegisterForm)
-from .models import Event, GiftPair, Group, Participant
-import random
-from django.conf import settings
-from django.core.mail import send_mail
+                    ParticipantImportForm, QucikGameForm, RegisterForm)
+from .assignments import cache_stats, get_assignments
+from .models import Draw, Event, GiftPair, Group, Participant, ScheduledDraw
+from .exports import EXPORT_FORMATS, export_lines, organizer_pairs
+from .imports import import_participants
+from .draw import DrawInfeasible, create_draw, draw_event
+from .quick_game import QUICK_GAME_MAX_PLAYERS, check_players, job_status, quick_game_emails, start_job
+from .pagination import keyset_page
+from .fragments import (cached_fragments, event_stamp_key, fragment_timeout, get_stamps,
+                        group_stamp_key, players_stamp_key)
+from django.core.exceptions import ValidationError
+from django.db.models import prefetch_related_objects
 from django.contrib.auth import authenticate, login, logout
+from django.contrib.admin.views.decorators import staff_member_required
 from django.contrib.auth.views import PasswordChangeView
 from django.views.generic.edit import DeleteView
 from django.contrib.auth.models import User
@@ -20,15 +33,36 @@ from django.contrib.messages.views import SuccessMessageMixin
 ### MAIN VIEW AND ITS' OPTIONS SECTION ###
 
 
-class MainView(View):
+class AsyncView(View):
+    """
+    Base of class-based views with async handlers (async def get/post).
+    Django 3.2 runs only async function views natively, so as_view() returns one: with ASGI
+    the view runs in the event loop and waits for the database and templates (sync_to_async)
+    without holding a worker, with WSGI Django runs it with async_to_sync.
+    """
+    @classmethod
+    def as_view(cls, **initkwargs):
+        view = super().as_view(**initkwargs)
+
+        async def async_view(request, *args, **kwargs):
+            response = view(request, *args, **kwargs)
+            if asyncio.iscoroutine(response):
+                response = await response
+            return response
+
+        update_wrapper(async_view, view)
+        return async_view
+
+
+class MainView(AsyncView):
     """
     First view after entering the website.
 
     Methods:
         - get(self, request): Handles GET requests and renders the index.html template.
     """
-    def get(self, request):
-        return render(request, 'index.html')
+    async def get(self, request):
+        return await sync_to_async(render)(request, 'index.html')
 
 
 class QuickGameView(View):
@@ -39,59 +73,65 @@ class QuickGameView(View):
         - get(self, request): Handles GET requests and renders the quick game form.
         - post(self, request): Handles POST requests and processes the quick game data,
                               including validation and Secret Santa assignment.
+                              Emails are stored in the outbox and the user is redirected to the job status.
+    Players come from the player_name_{i}/player_email_{i} fields, a pasted list and an uploaded file.
     """
     def get(self, request):
         form = QucikGameForm()
         return render(request, 'quick_game.html', {'form': form})
 
     def post(self, request):
-        form = QucikGameForm(request.POST)
+        form = QucikGameForm(request.POST, request.FILES)
         if form.is_valid():
             max_price = form.cleaned_data['max_price']
             currency = form.cleaned_data['currency']
             date = form.cleaned_data['date']
-            num_players = int(request.POST.get('num_players', 0))
+            try:
+                num_players = int(request.POST.get('num_players', 0))
+            except ValueError:
+                return HttpResponse("error: Invalid player data")
+            if num_players > QUICK_GAME_MAX_PLAYERS:
+                return HttpResponse(f"error: A quick game can have at most {QUICK_GAME_MAX_PLAYERS} players.")
 
             participants = []
             for i in range(1, num_players + 1):
                 player_name = request.POST.get(f'player_name_{i}')
                 player_email = request.POST.get(f'player_email_{i}')
+                if not player_name and not player_email:
+                    continue  # empty row of the form, e.g. when the players were pasted
                 if not player_name or not player_email or '@' not in player_email:
                     return HttpResponse("error: Invalid player data")
 
                 participants.append((player_name, player_email))
+            participants += form.cleaned_data['players'] + form.cleaned_data['players_file']
 
-            secret_santa(participants, max_price, currency, date)
+            try:
+                check_players(participants)
+            except ValidationError as e:
+                return HttpResponse(f"error: {e.message}")
 
-            return redirect('success')
+            job_id = start_job(quick_game_emails(participants, max_price, currency, date))
+            return redirect('quick-game-status', job_id=job_id)
         else:
-            return HttpResponse("error: Invalid form data")
+            errors = [message for messages in form.errors.values() for message in messages]
+            return HttpResponse(f"error: Invalid form data. {' '.join(errors)}")
 
 
-def secret_santa(participants, max_price, currency, date):
+class QuickGameStatusView(View):
     """
-    Function created for running secret santa function.
-    Shuffles results are not saved into database.
+    View showing the progress of the emails of a quick game.
 
-    :param participants: list of tuples (name, email)
-    :param max_price: maximum price for gifts
-    :param currency: currency of max_price
-    :param date: date of gift exchange
+    Methods:
+        - get(self, request, job_id): Renders quick_game_status.html (refreshing until the job is done)
+                                      or returns the status as JSON with ?format=json.
     """
-    random.shuffle(participants)
-    for i in range(len(participants)):
-        giver_name, giver_email = participants[i]
-        next_index = (i+1) % len(participants)
-        receiver_name, receiver_email = participants[next_index]
-
-        subject = 'Secret Santa'
-        message = f'Hi {giver_name},\n\nYou are {receiver_name}\'s Secret Santa!'
-        message += f'\n\nThe maximum price for gifts is {max_price} {currency}.'
-        message += f'\nThe exchange date is {date}.'
-        message += f'\n\nBest wishes,\nSecret Santa'
-        email_from = settings.EMAIL_HOST_USER
-        recipient_list = [giver_email]
-        send_mail(subject, message, email_from, recipient_list)
+    def get(self, request, job_id):
+        status = job_status(job_id)
+        if status is None:
+            raise Http404('Unknown or expired quick game.')
+        if request.GET.get('format') == 'json':
+            return JsonResponse(status)
+        return render(request, 'quick_game_status.html', {'job': status})
 
 
 class LoginView(View):
@@ -162,43 +202,185 @@ def register(request):
     return render(request, 'register.html', {'form': form})
 
 
+GAMES_PER_PAGE = 12
+
+
+def game_pairs(draws):
+    """
+    Function reading the gift pairs of draws with one query.
+
+    :param draws: list of Draw objects
+    :return: dict draw id -> list of dicts with the names of the giver and the receiver
+    """
+    pairs_by_draw = defaultdict(list)
+    pairs = (GiftPair.objects.filter(draw__in=draws)
+             .order_by('draw_id', 'id')
+             .values('draw_id', 'giver__first_name', 'giver__last_name',
+                     'receiver__first_name', 'receiver__last_name'))
+    for pair in pairs:
+        pairs_by_draw[pair['draw_id']].append(pair)
+    return pairs_by_draw
+
+
+def pairs_of_game(draw):
+    return game_pairs([draw])[draw.id]
+
+
+def game_cards(draws):
+    """
+    Function building the game cards shown on the dashboard and in the games archive.
+    Every card has a version for the {% cache %} tag (see fragments.py). Gift pairs are read
+    in one query, only for the cards that are not cached.
+    Cards found in the cache get a function instead of their pairs, which the template calls
+    only when the card was evicted in the meantime, so it is never rendered without its pairs.
+
+    :param draws: iterable of Draw objects with event and group selected
+    :return: list of dicts with game data
+    """
+    draws = list(draws)
+    stamps = get_stamps(
+        [event_stamp_key(draw.event_id) for draw in draws]
+        + [group_stamp_key(draw.group_id) for draw in draws]
+        + [players_stamp_key(draw.event.organizer_id) for draw in draws]
+    )
+    versions = {draw.id: '{}:{}:{}:{}'.format(
+        draw.id,
+        stamps[event_stamp_key(draw.event_id)],
+        stamps[group_stamp_key(draw.group_id)],
+        stamps[players_stamp_key(draw.event.organizer_id)],
+    ) for draw in draws}
+    cached = cached_fragments('game_card', versions.values())
+
+    missing = [draw for draw in draws if versions[draw.id] not in cached]
+    pairs_by_draw = game_pairs(missing) if missing else {}
+
+    return [{
+        'game_number': draw.id,
+        'group_name': draw.group.name,
+        'event_name': draw.event.name,
+        'date': draw.date,
+        'price_limit': draw.price_limit,
+        'pairs': partial(pairs_of_game, draw) if versions[draw.id] in cached else pairs_by_draw[draw.id],
+        'version': versions[draw.id],
+    } for draw in draws]
+
+
+def group_cards(groups, user):
+    """
+    Function preparing the groups shown on the dashboard.
+    Every group gets a version for the {% cache %} tag of its list of players (see fragments.py),
+    and players are read in one query, only for the groups whose lists are not cached.
+
+    :param groups: queryset of the user's Group objects
+    :param user: the logged user
+    :return: list of Group objects with a version attribute
+    """
+    groups = list(groups)
+    stamps = get_stamps([group_stamp_key(group.id) for group in groups] + [players_stamp_key(user.id)])
+    for group in groups:
+        group.version = '{}:{}:{}'.format(group.id, stamps[group_stamp_key(group.id)],
+                                          stamps[players_stamp_key(user.id)])
+    cached = cached_fragments('group_members', [group.version for group in groups])
+    prefetch_related_objects([group for group in groups if group.version not in cached], 'participants')
+    return groups
+
+
 class LoggedUserView(View):
+    """
+    Dashboard of the logged user.
+    Only upcoming games are loaded (past ones are in GamesArchiveView) and they are paginated.
+    The number of queries does not depend on the number of games, groups or players:
+    related rows are joined or prefetched and all gift pairs are read in one query.
+    Game cards and lists of group players are cached template fragments, so pairs and players
+    are read only for the cards and groups that changed.
+
+    Methods:
+        - get(self, request): Handles GET requests and renders the logged_user.html template.
+    """
+    read_only = True  # reads can go to the replica database, see routers.ReplicaRouter
+
     def get(self, request):
         today = date.today()
         user = request.user
-        events = Event.objects.filter(organizer=user)
-        groups = Group.objects.filter(creator=user)
+        events = Event.objects.filter(organizer=user).select_related('organizer')
+        groups = group_cards(Group.objects.filter(creator=user).select_related('creator'), user)
         players = Participant.objects.filter(creator=user)
-        gift_pairs = GiftPair.objects.filter(event__organizer=user)
-        events_with_draws = Event.objects.filter(giftpair__in=gift_pairs).distinct()
-        game_numbers = list(gift_pairs.values_list('game_number', flat=True).distinct())
-
-        game_data = []
-        for game_number in game_numbers:
-            game_pairs = gift_pairs.filter(game_number=game_number)
-            game_info = {
-                'game_number': game_number,
-                'group_name': game_pairs[0].group.name,
-                'event_name': game_pairs[0].event.name,
-                'date': game_pairs[0].date,
-                'price_limit': game_pairs[0].group.price_limit,
-                'pairs': game_pairs.values('giver__first_name', 'giver__last_name', 'receiver__first_name', 'receiver__last_name')
-
-            }
-            game_data.append(game_info)
+        draws = Draw.objects.filter(event__organizer=user, date__gte=today).select_related('event', 'group')
+        page = keyset_page(draws, request.GET.get('cursor'), page_size=GAMES_PER_PAGE)
 
         return render(request, "logged_user.html", {
             'user': user,
             'events': events,
             'groups': groups,
             'players': players,
-            'gift_pairs': gift_pairs,
-            'events_with_draws': events_with_draws,
-            'game_data': game_data,
-            'today': today
+            'game_data': game_cards(page),
+            'next_cursor': page.next_cursor,
+            'fragment_timeout': fragment_timeout(),
+        })
+
+
+class GamesArchiveView(View):
+    """
+    View for displaying past games of the logged user, newest first.
+
+    Methods:
+        - get(self, request): Handles GET requests and renders the games_archive.html template.
+    """
+    read_only = True
+
+    def get(self, request):
+        draws = (Draw.objects.filter(event__organizer=request.user, date__lt=date.today())
+                 .select_related('event', 'group'))
+        page = keyset_page(draws, request.GET.get('cursor'), descending=True, page_size=GAMES_PER_PAGE)
+
+        return render(request, 'games_archive.html', {
+            'game_data': game_cards(page),
+            'next_cursor': page.next_cursor,
+            'fragment_timeout': fragment_timeout(),
         })
 
 
+class ExportView(View):
+    """
+    View streaming gift pairs of the logged user's games as CSV or JSON Lines (?format=jsonl).
+    Rows are read from the database in chunks while the response is sent,
+    so memory does not grow with the size of the games.
+
+    Attributes:
+        - scope: 'game' (one draw), 'event' (all draws of an event) or 'all' (all draws of the user).
+
+    Methods:
+        - get(self, request, pk=None): Handles GET requests and streams the export.
+    """
+    scope = 'all'
+    read_only = True
+
+    def get(self, request, pk=None):
+        if not request.user.is_authenticated:
+            return redirect('login')
+        export_format = request.GET.get('format', 'csv')
+        if export_format not in EXPORT_FORMATS:
+            return HttpResponse("error: Unknown export format")
+
+        gift_pairs = organizer_pairs(request.user)
+        filename = 'secret-santa'
+        if self.scope == 'game':
+            draw = get_object_or_404(Draw, pk=pk, event__organizer=request.user)
+            gift_pairs = gift_pairs.filter(draw=draw)
+            filename = f'game-{draw.id}'
+        elif self.scope == 'event':
+            event = get_object_or_404(Event, pk=pk, organizer=request.user)
+            gift_pairs = gift_pairs.filter(draw__event=event)
+            filename = f'event-{event.id}'
+
+        # rows are read after the view returns, so the database is chosen now, while the request is routed
+        gift_pairs = gift_pairs.using(gift_pairs.db)
+        response = StreamingHttpResponse(export_lines(gift_pairs, export_format),
+                                         content_type=EXPORT_FORMATS[export_format])
+        response['Content-Disposition'] = f'attachment; filename="{filename}.{export_format}"'
+        return response
+
+
 ### EVENT SECTION ###
 
 
@@ -345,6 +527,28 @@ class DeleteGroupView(View):
             return HttpResponse(f"An error occurred: {e}. Please try again.")
 
 
+class AddExclusionView(View):
+    """
+    View for adding exclusion rules to a group (e.g. couples that should not draw each other).
+
+    Methods:
+        - get(self, request, group_id): Handles GET requests and renders the add_exclusion.html template.
+        - post(self, request, group_id): Handles POST requests and saves the rule.
+    """
+    def get(self, request, group_id):
+        group = get_object_or_404(Group, pk=group_id, creator=request.user)
+        form = ExclusionForm(group=group)
+        return render(request, 'add_exclusion.html', {'form': form, 'group': group})
+
+    def post(self, request, group_id):
+        group = get_object_or_404(Group, pk=group_id, creator=request.user)
+        form = ExclusionForm(request.POST, group=group)
+        if form.is_valid():
+            form.save()
+            return redirect('base')
+        return render(request, 'add_exclusion.html', {'form': form, 'group': group})
+
+
 ### PLAYER SECTION ###
 
 
@@ -371,6 +575,37 @@ class AddPlayerView(View):
         return HttpResponse("An error occurred. Please try again.")
 
 
+class ImportPlayersView(View):
+    """
+    View for adding many players at once from a CSV file.
+
+    Methods:
+        - get(self, request): Handles GET requests and renders the import_players.html template.
+        - post(self, request): Handles POST requests, imports the players and renders the import report.
+    """
+    def get(self, request):
+        form = ParticipantImportForm()
+        return render(request, 'import_players.html', {'form': form})
+
+    def post(self, request):
+        form = ParticipantImportForm(request.POST, request.FILES)
+        if form.is_valid():
+            lines = io.TextIOWrapper(form.cleaned_data['file'].file, encoding='utf-8-sig', newline='')
+            try:
+                report = import_participants(
+                    request.user, lines,
+                    group_name=form.cleaned_data['group_name'],
+                    price_limit=form.cleaned_data['price_limit'],
+                    currency=form.cleaned_data['currency'],
+                )
+            except (ValidationError, UnicodeDecodeError) as e:
+                message = e.messages[0] if isinstance(e, ValidationError) else 'The file is not UTF-8 text.'
+                form.add_error('file', message)
+            else:
+                return render(request, 'import_result.html', {'report': report})
+        return render(request, 'import_players.html', {'form': form})
+
+
 class EditPlayerView(View):
     """
     View for editing existing players.
@@ -426,7 +661,8 @@ class GameView(View):
 
     Methods:
         - get(self, request): Handles GET requests and renders the game.html template with a form.
-        - post(self, request): Handles POST requests, creates gift pairs, and sends emails.
+        - post(self, request): Handles POST requests, creates gift pairs, and queues emails in the outbox,
+          or schedules the draw when the form has a time to run it at.
     """
     def get(self, request):
         form = GameForm(user=request.user)
@@ -438,100 +674,130 @@ class GameView(View):
             event = form.cleaned_data['event']
             group = form.cleaned_data['group']
             date = form.cleaned_data['date']
-            participants = [(participant.name, participant.email) for participant in group.participants.all()]
-            max_price = group.price_limit
-            currency = group.currency
+            avoid_repeats = form.cleaned_data['avoid_repeats']
+            run_at = form.cleaned_data['run_at']
 
-            game_number = GiftPair.objects.latest('id').id + 1 if GiftPair.objects.exists() else 1
+            if run_at:
+                ScheduledDraw.objects.create(event=event, group=group, date=date, run_at=run_at,
+                                             avoid_repeats=avoid_repeats)
+                return HttpResponse(f"The draw is scheduled for {run_at:%Y-%m-%d %H:%M %Z}.")
 
-            random.shuffle(participants)
+            try:
+                create_draw(event, group, date, avoid_repeats)
+            except DrawInfeasible as e:
+                return HttpResponse(f"The draw is not possible: {e}")
 
-            for i in range(len(participants)):
-                giver_name, giver_email = participants[i]
-                next_index = (i+1) % len(participants)
-                receiver_name, receiver_email = participants[next_index]
+            return redirect('success')
 
-                giver = Participant.objects.get(email=giver_email)
-                receiver = Participant.objects.get(email=receiver_email)
+        else:
+            return HttpResponse("An error occurred. Please try again")
 
-                gift_pair = GiftPair(
-                    giver=giver,
-                    receiver=receiver,
-                    event=event,
-                    group=group,
-                    date=date,
-                    game_number=game_number
-                )
-                gift_pair.save()
 
-                subject = 'Secret Santa'
-                message = f'Hi {giver.name},\n\nYou are {receiver.name}\'s Secret Santa!'
-                message += f'\n\nThe maximum price for gifts is {max_price} {currency}.'
-                message += f'\nThe exchange date is {date}.'
-                message += f'\n\nBest wishes,\nSecret Santa'
-                email_from = settings.EMAIL_HOST_USER
-                recipient_list = [giver.email]
-                send_mail(subject, message, email_from, recipient_list)
+class EventDrawView(View):
+    """
+    View for drawing all groups of an event at once.
 
-            return redirect('success')
+    Methods:
+        - get(self, request, event_id): Handles GET requests and renders the event_draw.html template with a form.
+        - post(self, request, event_id): Handles POST requests, draws every group of the event
+          and renders a summary of the groups.
+    """
+    def get(self, request, event_id):
+        event = get_object_or_404(Event, pk=event_id, organizer=request.user)
+        return render(request, 'event_draw.html', {
+            'event': event,
+            'groups': event.groups.all(),
+            'form': EventDrawForm(),
+        })
 
-        else:
+    def post(self, request, event_id):
+        event = get_object_or_404(Event, pk=event_id, organizer=request.user)
+        form = EventDrawForm(request.POST)
+        if not form.is_valid():
             return HttpResponse("An error occurred. Please try again")
 
+        report = draw_event(event, form.cleaned_data['date'], form.cleaned_data['avoid_repeats'])
+        if not report.groups:
+            return HttpResponse("error: the event has no groups to draw")
+        return render(request, 'event_draw.html', {'event': event, 'report': report})
+
 
-class MyGiftPairsView(View):
+class MyGiftPairsView(AsyncView):
     """
-    View for displaying gift pairs for the logged user.
+    View for displaying upcoming gift pairs for the logged user.
 
     Methods:
         - get(self, request): Handles GET requests and renders the my_gift_pairs.html template.
     """
-    def get(self, request):
-        today = date.today()
-        user_email = request.user.email
-
-        participant = Participant.objects.filter(email=user_email).first()
+    archive = False
+    read_only = True
 
-        if participant is not None:
-            gift_pairs = GiftPair.objects.filter(giver=participant)
-        else:
-            gift_pairs = []
+    async def get(self, request):
+        email = await sync_to_async(lambda: request.user.email)()
+        assignments = await sync_to_async(get_assignments)(email, request.GET.get('cursor'), self.archive)
 
-        if not gift_pairs:
+        if assignments['email'] is None:
             return HttpResponse("Your email does not participate in any games yet.")
 
-        return render(request, 'my_gift_pairs.html', {'gift_pairs': gift_pairs, 'today': today})
+        return await sync_to_async(render)(request, 'my_gift_pairs.html', {
+            'gift_pairs': assignments['rows'],
+            'next_cursor': assignments['next_cursor'],
+            'archive': self.archive,
+        })
+
+
+class MyGiftPairsArchiveView(MyGiftPairsView):
+    """
+    View for displaying past gift pairs for the logged user.
+    """
+    archive = True
 
 
-class LookupView(View):
+class LookupView(AsyncView):
     """
-    View for looking up gift pairs for a given email.
+    View for looking up upcoming gift pairs for a given email.
 
     Methods:
         - get(self, request): Handles GET requests and renders the lookup.html template.
         - post(self, request): Handles POST requests and processes the email data.
     """
-    def get(self, request):
+    archive = False
+    read_only = True
+
+    async def get(self, request):
         form = EmailLookupForm()
-        return render(request, 'lookup.html', {'form': form})
+        return await sync_to_async(render)(request, 'lookup.html', {'form': form})
 
-    def post(self, request):
-        today = date.today()
+    async def post(self, request):
         form = EmailLookupForm(request.POST)
-        participant = None
 
         if form.is_valid():
-            user_email = form.cleaned_data['email']
-            participants = Participant.objects.filter(email=user_email)
-            if participants.exists():
-                participant = participants.first()
-                gift_pairs = GiftPair.objects.filter(giver=participant)
-            else:
-                gift_pairs = []
+            assignments = await sync_to_async(get_assignments)(
+                form.cleaned_data['email'], form.cleaned_data['cursor'], self.archive)
+
+            return await sync_to_async(render)(request, 'lookup_result.html', {
+                'gift_pairs': assignments['rows'],
+                'email': assignments['email'],
+                'next_cursor': assignments['next_cursor'],
+                'archive': self.archive,
+            })
 
-            return render(request, 'lookup_result.html', {'gift_pairs': gift_pairs, 'participant': participant, 'today': today})
+        return await sync_to_async(render)(request, 'lookup.html', {'form': form})
 
-        return render(request, 'lookup.html', {'form': form})
+
+class LookupArchiveView(LookupView):
+    """
+    View for looking up past gift pairs for a given email.
+    """
+    archive = True
+
+
+@staff_member_required
+def cache_stats_view(request):
+    """
+    Function returning hit and miss counters of the assignment cache (staff only).
+    """
+    return JsonResponse(cache_stats())
 
 
 def success_view(request):